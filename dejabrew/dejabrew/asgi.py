@@ -3,6 +3,11 @@ ASGI config for dejabrew project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it (e.g. ``uvicorn dejabrew.asgi:application``, or gunicorn with
+``-k uvicorn.workers.UvicornWorker``) to get the live events stream at
+/api/events/, which holds a connection open per client and so can't run
+on the sync WSGI workers. Everything else works the same under either.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
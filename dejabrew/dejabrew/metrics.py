@@ -0,0 +1,220 @@
+"""
+Request and cache metrics in the Prometheus text format.
+
+MetricsMiddleware records, per view: requests (by method and status), a
+latency histogram, and how many SQL queries the requests ran and how long
+those took. Other code counts its own events with `increment()`; the
+forecasting model caches report their hits and misses that way.
+
+Every gunicorn worker keeps its own counters and writes them to
+METRICS_DIR/<pid>-<start time>.json at most once a second. The /metrics
+endpoint adds up the files of all workers, so whichever worker answers a
+scrape reports totals for the whole server. The start time keeps a worker
+that reuses a dead one's pid from overwriting its file, and gunicorn's
+post_fork hook calls reset() so workers don't inherit (and count again)
+what the master recorded while warming up. Files of dead workers stay
+until the next server start, when gunicorn's when_ready hook clear()s the
+directory.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FLUSH_INTERVAL = 1.0  # seconds between writes of this worker's file
+
+# name -> (type, help)
+METRICS = {
+    'dejabrew_http_requests_total': ('counter', 'Requests handled, by view, method and status'),
+    'dejabrew_http_request_duration_seconds': ('histogram', 'Request latency by view'),
+    'dejabrew_db_queries_total': ('counter', 'SQL queries run while handling requests, by view'),
+    'dejabrew_db_query_seconds_total': ('counter', 'Time spent in SQL queries while handling requests, by view'),
+    'dejabrew_forecast_cache_total': ('counter', 'Forecasting cache lookups, by cache and result (hit/miss)'),
+}
+
+_lock = threading.Lock()
+_values = defaultdict(float)  # (name, ((label, value), ...)) -> value
+_last_flush = 0.0
+_filename = f'{os.getpid()}-{time.time_ns()}.json'
+
+
+def metrics_dir():
+    return str(getattr(settings, 'METRICS_DIR', None)
+               or os.path.join(tempfile.gettempdir(), 'dejabrew-metrics'))
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    with _lock:
+        _values[_key(name, labels)] += amount
+    _maybe_flush()
+
+
+def observe(name, value, **labels):
+    """Adds one observation to a histogram (stored as cumulative bucket counters)."""
+    with _lock:
+        for bound in LATENCY_BUCKETS:
+            # Every bucket gets a series, even while it is still 0
+            _values[_key(f'{name}_bucket', {**labels, 'le': bound})] += value <= bound
+        _values[_key(f'{name}_bucket', {**labels, 'le': '+Inf'})] += 1
+        _values[_key(f'{name}_sum', labels)] += value
+        _values[_key(f'{name}_count', labels)] += 1
+    _maybe_flush()
+
+
+def record_cache(cache, hit):
+    increment('dejabrew_forecast_cache_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def reset():
+    """Starts this process's counters from zero in a file of its own; call after fork."""
+    global _last_flush, _filename
+    with _lock:
+        _values.clear()
+        _last_flush = 0.0
+        _filename = f'{os.getpid()}-{time.time_ns()}.json'
+
+
+def clear():
+    """Deletes the files of earlier runs; call in the master before workers fork."""
+    directory = metrics_dir()
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.endswith(('.json', '.tmp')):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                pass
+
+
+def flush():
+    """Writes this process's counters to its file in METRICS_DIR."""
+    global _last_flush
+    with _lock:
+        rows = [[name, dict(labels), value] for (name, labels), value in _values.items()]
+        _last_flush = time.monotonic()
+        filename = _filename
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(rows, f)
+    os.replace(tmp, path)
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        try:
+            flush()
+        except OSError as e:
+            print(f"⚠️ Could not write metrics: {e}")
+
+
+def collect():
+    """Counters of every worker that has written a metrics file, summed."""
+    flush()
+    totals = defaultdict(float)
+    directory = metrics_dir()
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            continue  # Being replaced right now; it will be there next scrape
+        for name, labels, value in rows:
+            totals[_key(name, labels)] += value
+    return totals
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def _bucket_order(item):
+    (name, labels), _ = item
+    le = dict(labels).get('le')
+    return name, [kv for kv in labels if kv[0] != 'le'], float(le) if le else 0.0
+
+
+def render(totals):
+    lines = []
+    for metric, (kind, help_text) in METRICS.items():
+        series = sorted(
+            ((key, value) for key, value in totals.items()
+             if key[0] == metric or (kind == 'histogram' and key[0].rsplit('_', 1)[0] == metric)),
+            key=_bucket_order,
+        )
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for (name, labels), value in series:
+            lines.append(f'{name}{_format_labels(labels)} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    """execute_wrapper that counts and times the queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        with _lock:
+            _values[_key('dejabrew_http_requests_total',
+                         {'view': view, 'method': request.method, 'status': response.status_code})] += 1
+            _values[_key('dejabrew_db_queries_total', {'view': view})] += queries.count
+            _values[_key('dejabrew_db_query_seconds_total', {'view': view})] += queries.seconds
+        observe('dejabrew_http_request_duration_seconds', elapsed, view=view)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, open to METRICS_ALLOWED_IPS and admins."""
+    allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    is_admin = request.user.is_superuser or getattr(getattr(request.user, 'profile', None), 'role', None) == 'admin'
+    if not (allowed or is_admin):
+        return HttpResponseForbidden('Metrics are only available locally')
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,122 @@
+"""
+Opt-in N+1 query detector for development and tests.
+
+While it is active every SQL statement is reduced to its shape (Django
+already sends parameters separately; IN lists of any length collapse to
+one) and counted, together with the line of project code that ran it.
+When one shape runs more than the threshold in a request, the detector
+warns or raises with a report naming that line, e.g. the view line that
+reads `log.user.username` inside a loop.
+
+Turn it on for the dev server or a test run with NPLUSONE_DETECTION =
+'warn' or 'raise' (env DJANGO_NPLUSONE_DETECTION), or wrap code in
+`detect_n_plus_one()`.
+"""
+
+import os
+import re
+import traceback
+import warnings
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+DEFAULT_THRESHOLD = 5
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+# Transaction control repeats legitimately (and savepoint names differ anyway)
+IGNORED = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+
+class NPlusOneWarning(UserWarning):
+    pass
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def fingerprint(sql):
+    return IN_LIST.sub('IN (...)', ' '.join(sql.split()))
+
+
+# The project package only holds settings and wrappers like this one
+INFRASTRUCTURE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def caller_location():
+    """The innermost frame of app code (not Django, not the query wrappers)."""
+    base = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        path = frame.filename
+        if path.startswith(base) and not path.startswith(INFRASTRUCTURE_DIR) and 'site-packages' not in path:
+            return f'{os.path.relpath(path, base)}:{frame.lineno} in {frame.name}: {(frame.line or "").strip()}'
+    return 'unknown'
+
+
+class QueryCollector:
+    """execute_wrapper that counts statement shapes and the lines that ran them."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.origins = {}  # shape -> Counter of origins
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(IGNORED):
+            shape = fingerprint(sql)
+            self.counts[shape] += 1
+            self.origins.setdefault(shape, Counter())[caller_location()] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        """[(shape, count, [(origin, count), ...]), ...] for shapes run more than threshold times."""
+        return [(shape, count, self.origins[shape].most_common())
+                for shape, count in self.counts.most_common() if count > threshold]
+
+
+def format_report(repeated, label=''):
+    lines = [f"Possible N+1 queries{f' in {label}' if label else ''}:"]
+    for shape, count, origins in repeated:
+        lines.append(f'  {count}x {shape[:300]}')
+        for origin, origin_count in origins:
+            lines.append(f'      {origin_count}x from {origin}')
+    return '\n'.join(lines)
+
+
+@contextmanager
+def detect_n_plus_one(threshold=None, mode='raise', label=''):
+    """
+    Counts the queries run inside the block and, on exit, warns
+    (mode='warn') or raises NPlusOneError (mode='raise') if one statement
+    shape ran more than `threshold` times.
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'NPLUSONE_THRESHOLD', DEFAULT_THRESHOLD)
+    collector = QueryCollector()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(collector))
+        yield collector
+
+    repeated = collector.repeated(threshold)
+    if repeated:
+        report = format_report(repeated, label)
+        if mode == 'raise':
+            raise NPlusOneError(report)
+        warnings.warn(report, NPlusOneWarning, stacklevel=3)
+
+
+class NPlusOneMiddleware:
+    """Runs each request under detect_n_plus_one() when NPLUSONE_DETECTION is set."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = getattr(settings, 'NPLUSONE_DETECTION', None)
+        if not mode:
+            return self.get_response(request)
+        with detect_n_plus_one(mode=mode, label=f'{request.method} {request.path}'):
+            return self.get_response(request)
@@ -29,15 +29,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'dejabrew.metrics.MetricsMiddleware',  # Outermost, so latency covers the whole stack
+    'dejabrew.nplusone.NPlusOneMiddleware',  # No-op unless NPLUSONE_DETECTION is set
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files in production
+    'dejabrew.static_files.ProductImageWhiteNoiseMiddleware',  # For static files in production
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'dejabrew.slow_queries.SlowQueryMiddleware',  # Tags slow-query log entries with the view
 ]
 
 ROOT_URLCONF = 'dejabrew.urls'
@@ -60,7 +63,9 @@ WSGI_APPLICATION = 'dejabrew.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # sqlite3 plus a WAL/busy-timeout PRAGMA profile for multiple gunicorn
+        # workers; see dejabrew/sqlite_backend/__init__.py
+        'ENGINE': 'dejabrew.sqlite_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
@@ -111,6 +116,36 @@ STORAGES = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# ==================== METRICS ====================
+# Per-worker counter files summed by the /metrics endpoint (dejabrew/metrics.py)
+METRICS_DIR = os.environ.get('DJANGO_METRICS_DIR', BASE_DIR / 'metrics')
+# Clients allowed to scrape /metrics without logging in as an admin
+METRICS_ALLOWED_IPS = os.getenv('DJANGO_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Test runs use a temporary METRICS_DIR and no slow query log (dejabrew/test_runner.py)
+TEST_RUNNER = 'dejabrew.test_runner.TestRunner'
+
+# ==================== N+1 QUERY DETECTION ====================
+# 'warn' or 'raise' when one SQL statement shape runs more than
+# NPLUSONE_THRESHOLD times in a request (dejabrew/nplusone.py). Off by default.
+NPLUSONE_DETECTION = os.getenv('DJANGO_NPLUSONE_DETECTION') or None
+NPLUSONE_THRESHOLD = int(os.getenv('DJANGO_NPLUSONE_THRESHOLD', '5'))
+
+# ==================== SLOW QUERY LOG ====================
+# Statements slower than this (ms) go to SLOW_QUERY_LOG_FILE with their
+# query plan and are summed per shape in the SlowQuery admin
+# (dejabrew/slow_queries.py). 0 turns it off; test runs turn it off too.
+SLOW_QUERY_MS = float(os.getenv('DJANGO_SLOW_QUERY_MS', '200') or 0)
+SLOW_QUERY_LOG_FILE = os.environ.get('DJANGO_SLOW_QUERY_LOG_FILE', BASE_DIR / 'logs' / 'slow_queries.log')
+
+# ==================== LIVE EVENTS ====================
+# Server-sent events at /api/events/ (pos/live_events.py; needs the ASGI
+# app). Streams poll for new events every LIVE_EVENTS_POLL_SECONDS and close
+# after LIVE_EVENTS_STREAM_SECONDS, when the browser reconnects.
+LIVE_EVENTS_POLL_SECONDS = float(os.getenv('DJANGO_LIVE_EVENTS_POLL_SECONDS', '1'))
+LIVE_EVENTS_STREAM_SECONDS = float(os.getenv('DJANGO_LIVE_EVENTS_STREAM_SECONDS', '300'))
+LIVE_EVENTS_RETENTION_SECONDS = 3600
+
 # ==================== DJANGO REST FRAMEWORK ====================
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -0,0 +1,190 @@
+"""
+Slow-query log.
+
+Every database connection gets an execute wrapper (installed from
+PosConfig.ready) that times each statement. Statements slower than
+SLOW_QUERY_MS are:
+
+- written in full (SQL, parameters, duration, view, calling line and
+  EXPLAIN QUERY PLAN) to the rotating SLOW_QUERY_LOG_FILE, and
+- summed per statement shape in the SlowQuery table, which the admin
+  lists by total time, so the worst offenders are at the top.
+
+The log file is written as the statement finishes. During a request the
+table entries are buffered and saved by SlowQueryMiddleware once the view
+has returned, in one transaction of their own: a slow read-only request
+doesn't take SQLite's write lock in the middle of its work, and what it
+recorded isn't lost if its own transaction rolls back. Outside requests
+(commands, background jobs) a statement is saved once its transaction
+commits, or right away outside one.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import closing
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from dejabrew.nplusone import caller_location, fingerprint
+from dejabrew.sqlite_backend import immediate_atomic
+
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+_local = threading.local()
+
+
+def threshold_ms():
+    return getattr(settings, 'SLOW_QUERY_MS', None) or 0
+
+
+def get_logger():
+    """Logger writing to SLOW_QUERY_LOG_FILE (set up again if that setting changes)."""
+    path = str(settings.SLOW_QUERY_LOG_FILE)
+    logger = logging.getLogger('dejabrew.slow_queries')
+    if getattr(logger, 'log_path', None) != path:
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            handler.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.log_path = path
+    return logger
+
+
+def query_plan(connection, sql, params):
+    """EXPLAIN output for one statement, on a raw cursor so it isn't logged or counted itself."""
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with closing(connection.create_cursor()) as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except Exception as e:
+        return f'(no plan: {e})'
+    if connection.vendor == 'sqlite':
+        return '\n'.join(str(row[-1]) for row in rows)  # (id, parent, notused, detail)
+    return '\n'.join(' '.join(str(col) for col in row) for row in rows)
+
+
+def save(entry):
+    from pos.models import SlowQuery
+
+    _local.busy = True
+    try:
+        now = timezone.now()
+        latest = {'params': entry['params'], 'view': entry['view'][:200], 'origin': entry['origin'][:500],
+                  'plan': entry['plan'], 'last_seen': now}
+        key = hashlib.sha1(entry['sql'].encode()).hexdigest()
+        bump = dict(count=F('count') + 1, total_ms=F('total_ms') + entry['ms'],
+                    max_ms=Greatest('max_ms', entry['ms']), **latest)
+        if not SlowQuery.objects.filter(fingerprint_hash=key).update(**bump):
+            try:
+                with transaction.atomic():
+                    SlowQuery.objects.create(fingerprint_hash=key, sql=entry['sql'], count=1, total_ms=entry['ms'],
+                                             max_ms=entry['ms'], first_seen=now, **latest)
+            except IntegrityError:  # Another worker created it first
+                SlowQuery.objects.filter(fingerprint_hash=key).update(**bump)
+    except Exception as e:
+        print(f"⚠️ Could not record slow query: {e}")
+    finally:
+        _local.busy = False
+
+
+class SlowQueryWrapper:
+    """execute_wrapper timing every statement on one connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'busy', False) or not threshold_ms():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            if ms >= threshold_ms():
+                self.record(sql, params, many, ms)
+
+    def record(self, sql, params, many, ms):
+        _local.busy = True
+        try:
+            entry = {
+                'sql': fingerprint(sql),
+                'params': repr(params)[:2000],
+                'ms': ms,
+                'view': getattr(_local, 'view', '') or '',
+                'origin': caller_location(),
+                'plan': '' if many else query_plan(self.connection, sql, params),
+            }
+            get_logger().info(
+                f"{ms:.1f}ms view={entry['view'] or '-'} at {entry['origin']}\n"
+                f"  SQL: {sql}\n  params: {entry['params']}\n  plan:\n    "
+                + entry['plan'].replace('\n', '\n    ')
+            )
+        except Exception as e:
+            print(f"⚠️ Could not log slow query: {e}")
+            return
+        finally:
+            _local.busy = False
+
+        pending = getattr(_local, 'pending', None)
+        if pending is not None:
+            pending.append(entry)
+        elif self.connection.in_atomic_block:
+            transaction.on_commit(lambda: save(entry), using=self.connection.alias)
+        else:
+            save(entry)
+
+
+def save_pending():
+    """Saves the entries buffered during a request."""
+    entries, _local.pending = getattr(_local, 'pending', None), None
+    if not entries:
+        return
+    _local.busy = True
+    try:
+        with immediate_atomic():
+            for entry in entries:
+                save(entry)
+    except Exception as e:
+        print(f"⚠️ Could not record slow queries: {e}")
+    finally:
+        _local.busy = False
+
+
+def install(sender, connection, **kwargs):
+    """connection_created handler. Outermost, so wrappers pushed and popped later keep working."""
+    if not any(isinstance(w, SlowQueryWrapper) for w in connection.execute_wrappers):
+        connection.execute_wrappers.insert(0, SlowQueryWrapper(connection))
+
+
+class SlowQueryMiddleware:
+    """Remembers which view is running, for the log entries, and saves them after it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.pending = []
+        try:
+            return self.get_response(request)
+        finally:
+            _local.view = None
+            save_pending()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _local.view = request.resolver_match.view_name if request.resolver_match else view_func.__name__
@@ -0,0 +1,67 @@
+"""
+SQLite backend tuned for several gunicorn workers sharing one database file.
+
+Use it as the ENGINE ('dejabrew.sqlite_backend'). Every new connection gets
+the PRAGMA profile below (WAL so readers never wait on the writer, a busy
+timeout instead of failing straight away with "database is locked", and
+larger page/mmap caches).
+
+Write transactions should use `immediate_atomic` instead of
+`transaction.atomic`: it opens the transaction with BEGIN IMMEDIATE, taking
+the write lock up front. With a plain (deferred) BEGIN, two checkouts that
+both read stock and then write can't both upgrade to a write lock, and
+one fails with "database is locked" without waiting out the busy timeout.
+"""
+
+from contextlib import ContextDecorator
+
+from django.db import transaction
+
+# PRAGMA -> value applied on every new connection. Override (or drop entries)
+# with DATABASES[...]['OPTIONS']['pragmas'].
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',       # Safe with WAL; fsync at checkpoints only
+    'busy_timeout': 15000,         # ms to wait for a lock (below gunicorn's 30s timeout)
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32000,          # Negative means KiB: ~32 MB page cache
+    'temp_store': 'MEMORY',
+}
+
+
+class ImmediateAtomic(ContextDecorator):
+
+    def __init__(self, using=None, savepoint=True, durable=False):
+        self.using = using
+        self.savepoint = savepoint
+        self.durable = durable
+
+    def _recreate_cm(self):
+        # Fresh state per call, the same decorator may run in many threads
+        return type(self)(self.using, self.savepoint, self.durable)
+
+    def __enter__(self):
+        connection = transaction.get_connection(self.using)
+        self.atomic = transaction.atomic(using=self.using, savepoint=self.savepoint, durable=self.durable)
+        previous = getattr(connection, 'begin_mode', None)
+        connection.begin_mode = 'IMMEDIATE'
+        try:
+            self.atomic.__enter__()
+        finally:
+            connection.begin_mode = previous
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.atomic.__exit__(exc_type, exc_value, traceback)
+
+
+def immediate_atomic(using=None, savepoint=True, durable=False):
+    """
+    transaction.atomic() whose outermost transaction starts with
+    BEGIN IMMEDIATE. Nested inside an existing atomic block it is a plain
+    savepoint. On other database backends it is just transaction.atomic().
+    Usable bare (@immediate_atomic) or called, like transaction.atomic.
+    """
+    # Bare decorator: @immediate_atomic
+    if callable(using):
+        return ImmediateAtomic(None, savepoint, durable)(using)
+    return ImmediateAtomic(using, savepoint, durable)
@@ -0,0 +1,28 @@
+from django.db.backends.sqlite3 import base
+
+from . import DEFAULT_PRAGMAS
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Set for the duration of immediate_atomic's BEGIN
+    begin_mode = None
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # Our own options; sqlite3.connect() would reject them
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+        for name, value in pragmas.items():
+            if value is not None:
+                conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # DEFERRED (sqlite's default), IMMEDIATE or EXCLUSIVE
+        mode = self.begin_mode or self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -0,0 +1,18 @@
+"""
+WhiteNoise, plus far-future caching for product images.
+
+WhiteNoise only marks files as immutable when collectstatic's manifest
+hashed their names. Product photo derivatives are uploaded at runtime with
+a content hash in the name already (pos/product_images.py), so they can
+be cached for good as well.
+"""
+
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from pos.product_images import HASHED_URL
+
+
+class ProductImageWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+
+    def immutable_file_test(self, path, url):
+        return bool(HASHED_URL.match(url)) or super().immutable_file_test(path, url)
@@ -0,0 +1,28 @@
+"""
+Test runner that keeps a test run's side files out of the project.
+
+Every request through MetricsMiddleware writes a metrics file, so the run
+points METRICS_DIR at a temporary directory that is deleted afterwards.
+The slow query log is off (SLOW_QUERY_MS = 0) so the suite's statements
+don't end up in logs/slow_queries.log; SlowQueryLogTests turn it back on
+with a log file of their own.
+"""
+
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._metrics_dir = tempfile.TemporaryDirectory(prefix='dejabrew-metrics-')
+        self._settings = override_settings(METRICS_DIR=self._metrics_dir.name, SLOW_QUERY_MS=0)
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        self._metrics_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
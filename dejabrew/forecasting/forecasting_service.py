@@ -1,6 +1,7 @@
 # forecasting/forecasting_service.py
 import os
 import joblib
+import numpy as np
 import pandas as pd
 import datetime
 import json
@@ -11,6 +12,8 @@ from django.db.models import Sum, F
 from django.core.cache import cache
 from collections import defaultdict
 
+from dejabrew import metrics
+
 # --- Import your project's models ---
 def get_order_item_model():
     from pos.models import OrderItem
@@ -35,6 +38,16 @@ MODEL_PREFIX = 'model_'
 MODEL_CACHE = {}
 
 MAPPING_FILE = os.path.join(DATA_DIR, 'product_mapping.json')
+GLOBAL_MODEL_FILE = os.path.join(DATA_DIR, 'global_model.joblib')
+TRAINED_ARTICLES_FILE = os.path.join(DATA_DIR, 'trained_articles.json')
+
+# Parsed JSON files and resolved item names, keyed by file modification time
+# so a retrain in another process is picked up without a restart.
+JSON_CACHE = {}
+RESOLVER_CACHE = {}
+GLOBAL_MODEL_KEY = '__global__'
+# HistGradientBoostingRegressor rejects categorical features with more categories
+MAX_CATEGORICAL_ARTICLES = 255
 
 
 def load_live_db_data():
@@ -45,7 +58,7 @@ def load_live_db_data():
     OrderItem = get_order_item_model()
 
     qs = OrderItem.objects.filter(order__status='paid') \
-                          .annotate(date=F('order__created_at__date')) \
+                          .annotate(date=F('order__business_date')) \
                           .values('date', 'item__name') \
                           .annotate(quantity=Sum('qty')) \
                           .order_by('date')
@@ -78,6 +91,7 @@ def load_kaggle_data():
     cache_key = 'coffee_shop_sales_v2'
     cached_data = cache.get(cache_key)
 
+    metrics.record_cache('csv', bool(cached_data))
     if cached_data:
         print("Loading Coffee Shop Sales from cache...")
         return cached_data
@@ -157,15 +171,45 @@ def load_kaggle_data():
     return df, all_articles, []
 
 
-def load_trained_articles():
-    fn = os.path.join(DATA_DIR, 'trained_articles.json')
-    if not os.path.exists(fn):
-        return []
+def load_combined_sales():
+    """
+    Loads Kaggle/CSV and live DB sales, drops returns and sums duplicate
+    (date, article) rows. This is the training set used by every engine.
+    """
+    df_kaggle, _, _ = load_kaggle_data()
+    df_live = load_live_db_data()
+
+    if df_kaggle.empty and df_live.empty:
+        return pd.DataFrame(columns=['date', 'article', 'quantity'])
+
+    df = pd.concat([df_kaggle, df_live], ignore_index=True)
+    df = df[df['quantity'] > 0]  # remove negatives/returns
+    return df.groupby(['date', 'article'])['quantity'].sum().reset_index()
+
+
+def _read_json_cached(path, default):
+    """
+    Reads a JSON file once and reuses the parsed value until the file changes.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return default
+    cached = JSON_CACHE.get(path)
+    metrics.record_cache('json', bool(cached and cached[0] == mtime))
+    if cached and cached[0] == mtime:
+        return cached[1]
     try:
-        with open(fn, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
     except Exception:
-        return []
+        return default
+    JSON_CACHE[path] = (mtime, data)
+    return data
+
+
+def load_trained_articles():
+    return _read_json_cached(TRAINED_ARTICLES_FILE, [])
 
 def list_available_models():
     return load_trained_articles()
@@ -175,28 +219,64 @@ def model_filename_for_article(article):
     return os.path.join(DATA_DIR, f"{MODEL_PREFIX}{safe}.joblib")
 
 def load_model_for_article(article):
-    if article in MODEL_CACHE:
-        return MODEL_CACHE[article]
     path = model_filename_for_article(article)
-    if not os.path.exists(path):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
         return None
+    cached = MODEL_CACHE.get(article)
+    metrics.record_cache('model', bool(cached and cached[0] == mtime))
+    if cached and cached[0] == mtime:
+        return cached[1]
     model = joblib.load(path)
-    MODEL_CACHE[article] = model
+    MODEL_CACHE[article] = (mtime, model)
     return model
 
+def load_global_model():
+    """
+    Returns the global model bundle ({'model', 'articles', 'features'}) if
+    the last retrain used the global engine, else None.
+    """
+    try:
+        mtime = os.path.getmtime(GLOBAL_MODEL_FILE)
+    except OSError:
+        return None
+    cached = MODEL_CACHE.get(GLOBAL_MODEL_KEY)
+    metrics.record_cache('model', bool(cached and cached[0] == mtime))
+    if cached and cached[0] == mtime:
+        return cached[1]
+    bundle = joblib.load(GLOBAL_MODEL_FILE)
+    MODEL_CACHE[GLOBAL_MODEL_KEY] = (mtime, bundle)
+    return bundle
+
+def _resolver_signature():
+    return tuple(
+        os.path.getmtime(p) if os.path.exists(p) else None
+        for p in (MAPPING_FILE, TRAINED_ARTICLES_FILE)
+    )
+
 def map_item_to_article(item_name):
     """
     Returns the best-matching article name trained in models.
+    Results are memoized until the mapping or trained list changes on disk.
     """
+    signature = _resolver_signature()
+    if RESOLVER_CACHE.get('__signature__') != signature:
+        RESOLVER_CACHE.clear()
+        RESOLVER_CACHE['__signature__'] = signature
+    metrics.record_cache('resolver', item_name in RESOLVER_CACHE)
+    if item_name in RESOLVER_CACHE:
+        return RESOLVER_CACHE[item_name]
+
+    article = _resolve_article(item_name)
+    RESOLVER_CACHE[item_name] = article
+    return article
+
+def _resolve_article(item_name):
     # 1) explicit mapping
-    if os.path.exists(MAPPING_FILE):
-        try:
-            with open(MAPPING_FILE, 'r', encoding='utf-8') as f:
-                mapping = json.load(f)
-            if item_name in mapping:
-                return mapping[item_name]
-        except Exception:
-            pass
+    mapping = _read_json_cached(MAPPING_FILE, {})
+    if item_name in mapping:
+        return mapping[item_name]
 
     trained = load_trained_articles()
     if not trained:
@@ -221,6 +301,36 @@ def map_item_to_article(item_name):
     return None
 
 
+def warm_model_cache(item_names=None):
+    """
+    Imports the forecasting stack and loads every trained model, the
+    article mapping and (optionally) the item -> article resolutions
+    into memory.
+
+    Meant to run once in the gunicorn master with preload_app enabled,
+    so forked workers inherit the loaded models copy-on-write instead
+    of each loading its own copy on the first predict request.
+
+    Returns the number of models loaded.
+    """
+    import sklearn.ensemble  # noqa: F401 - unpickling needs it anyway
+
+    loaded = 0
+    if load_global_model() is not None:
+        loaded += 1
+    for article in load_trained_articles():
+        try:
+            if load_model_for_article(article) is not None:
+                loaded += 1
+        except Exception as e:
+            print(f"⚠️ Could not preload model for {article}: {e}")
+
+    for name in item_names or []:
+        map_item_to_article(name)
+
+    return loaded
+
+
 # --- Utility functions for training ---
 def pivot_daily(df):
     """
@@ -266,27 +376,95 @@ def create_date_features_for_range(start_date, days):
     return features
 
 
-def predict_for_item(item_name, days=7, start_date=None, period='daily'):
+def train_article_model(X_train, y_train):
     """
-    Returns predictions for next `days` for the mapped article.
-    Now supports aggregation by period: 'daily', 'weekly', 'monthly'
+    Fits the per-article GradientBoostingRegressor on date features.
     """
-    article = map_item_to_article(item_name)
-    if not article:
-        return None
+    from sklearn.ensemble import GradientBoostingRegressor
 
-    model = load_model_for_article(article)
-    if model is None:
-        return None
+    model = GradientBoostingRegressor(n_estimators=200, learning_rate=0.05, random_state=42)
+    model.fit(X_train, y_train)
+    return model
 
-    # Use provided start_date or default to tomorrow
-    start = start_date if start_date else (timezone.now().date() + datetime.timedelta(days=1))
-    
-    # Always generate daily predictions first
-    features = create_date_features_for_range(start, days)
-    preds = model.predict(features)
+
+def score_forecast(y_test, y_pred_test):
+    """
+    Test-set metrics as stored in latest_metrics.json.
+
+    Returns:
+        (mae, r2, mape, accuracy); MAPE uses y + 1 in the denominator so
+        zero-sale days don't blow up.
+    """
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    test_mae = mean_absolute_error(y_test, y_pred_test)
+    test_r2 = r2_score(y_test, y_pred_test)
+    test_mape = np.mean(np.abs((y_test - y_pred_test) / (y_test + 1))) * 100
+    test_accuracy = max(0, 100 - test_mape)
+    return test_mae, test_r2, test_mape, test_accuracy
+
+
+def build_global_features(date_features, article_codes):
+    """
+    Stacks the same date features once per article and appends the
+    article code column, so the whole menu is one feature matrix.
+    """
+    n_days = len(date_features)
+    X = pd.DataFrame(
+        np.tile(date_features.to_numpy(), (len(article_codes), 1)),
+        columns=date_features.columns
+    )
+    X['article_code'] = np.repeat(np.asarray(article_codes, dtype=np.int64), n_days)
+    return X
+
+
+def train_global_model(daily, split=None):
+    """
+    Trains one HistGradientBoostingRegressor over all articles, with the
+    article code as a categorical feature. Menus larger than
+    MAX_CATEGORICAL_ARTICLES fall back to a plain numeric article code.
+
+    Args:
+        daily: output of pivot_daily (dates x articles)
+        split: number of leading days used for training (None = all days)
+
+    Returns:
+        (bundle, X_test, y_test) where bundle is {'model', 'articles', 'features'}
+        and X_test/y_test hold the held-out days (empty when split is None).
+    """
+    from sklearn.ensemble import HistGradientBoostingRegressor
+
+    articles = daily.columns.tolist()
+    date_features = create_date_features(daily.index)
+    X = build_global_features(date_features, range(len(articles)))
+    # Column-major ravel matches the article-major row order of X
+    y = pd.Series(daily.to_numpy().ravel(order='F'))
+
+    train_mask = np.ones(len(X), dtype=bool)
+    if split is not None:
+        train_mask = np.tile(np.arange(len(daily)) < split, len(articles))
+
+    categorical = None
+    if len(articles) <= MAX_CATEGORICAL_ARTICLES:
+        categorical = [X.columns.get_loc('article_code')]
+    else:
+        print(f"⚠ {len(articles)} articles exceed {MAX_CATEGORICAL_ARTICLES} categories; "
+              f"training with a numeric article code")
+
+    model = HistGradientBoostingRegressor(
+        max_iter=200, learning_rate=0.05,
+        categorical_features=categorical,
+        random_state=42
+    )
+    model.fit(X[train_mask], y[train_mask])
+
+    bundle = {'model': model, 'articles': articles, 'features': X.columns.tolist()}
+    return bundle, X[~train_mask], y[~train_mask]
+
+
+def _finish_predictions(preds, start, period):
     preds = [int(max(0, round(float(p)))) for p in preds]
-    
+
     # Create daily results
     daily_results = [
         {
@@ -307,6 +485,66 @@ def predict_for_item(item_name, days=7, start_date=None, period='daily'):
         return daily_results
 
 
+def predict_for_items(item_names, days=7, start_date=None, period='daily'):
+    """
+    Returns {item_name: predictions} for every item that maps to a model.
+    With the global engine the whole menu is predicted in one call.
+    """
+    start = start_date if start_date else (timezone.now().date() + datetime.timedelta(days=1))
+
+    bundle = load_global_model()
+    if bundle is None:
+        results = {}
+        for name in item_names:
+            preds = predict_for_item(name, days=days, start_date=start, period=period)
+            if preds:
+                results[name] = preds
+        return results
+
+    codes = {article: i for i, article in enumerate(bundle['articles'])}
+    mapped = []
+    for name in item_names:
+        article = map_item_to_article(name)
+        if article in codes:
+            mapped.append((name, codes[article]))
+    if not mapped:
+        return {}
+
+    features = create_date_features_for_range(start, days)
+    X = build_global_features(features, [code for _, code in mapped])
+    preds = bundle['model'].predict(X[bundle['features']]).reshape(len(mapped), days)
+
+    return {
+        name: _finish_predictions(row, start, period)
+        for (name, _), row in zip(mapped, preds)
+    }
+
+
+def predict_for_item(item_name, days=7, start_date=None, period='daily'):
+    """
+    Returns predictions for next `days` for the mapped article.
+    Now supports aggregation by period: 'daily', 'weekly', 'monthly'
+    """
+    if load_global_model() is not None:
+        return predict_for_items([item_name], days, start_date, period).get(item_name)
+
+    article = map_item_to_article(item_name)
+    if not article:
+        return None
+
+    model = load_model_for_article(article)
+    if model is None:
+        return None
+
+    # Use provided start_date or default to tomorrow
+    start = start_date if start_date else (timezone.now().date() + datetime.timedelta(days=1))
+    
+    # Always generate daily predictions first
+    features = create_date_features_for_range(start, days)
+    preds = model.predict(features)
+    return _finish_predictions(preds, start, period)
+
+
 def aggregate_to_weekly(daily_predictions):
     """
     Aggregates daily predictions into weekly totals
@@ -384,6 +622,8 @@ def match_ingredient_name(recipe_name, ingredients_queryset):
 def compute_inventory_forecast(items_with_predictions, IngredientModel, RecipeExtractor, days=7, period='daily'):
     all_ingredients = list(IngredientModel.objects.all())
     ing_map = {ing.name: ing for ing in all_ingredients}
+    # RecipeExtractor may hit the database; call it once per item, not per ingredient and period
+    recipes = {item_name: RecipeExtractor(item_name) for item_name in items_with_predictions}
 
     inventory_forecast = []
 
@@ -415,7 +655,7 @@ def compute_inventory_forecast(items_with_predictions, IngredientModel, RecipeEx
 
             # Iterate through all items
             for item_name, preds in items_with_predictions.items():
-                recipe = RecipeExtractor(item_name)
+                recipe = recipes[item_name]
                 if not recipe:
                     continue
 
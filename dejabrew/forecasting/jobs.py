@@ -0,0 +1,173 @@
+# forecasting/jobs.py
+"""
+Background jobs for long-running management commands (model retraining,
+inventory backfill) so a web request only submits them and returns.
+
+Each job runs in its own detached `manage.py run_job <name>` process, so a
+gunicorn worker timeout or restart can't kill it halfway. A per-job flock
+gives single-flight across all workers, and progress is persisted to
+forecasting_data/jobs/<name>.json for the polling endpoint.
+"""
+
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+
+from forecasting.forecasting_service import DATA_DIR
+
+JOBS_DIR = os.path.join(DATA_DIR, 'jobs')
+
+# Job name -> management command it runs
+JOBS = {
+    'retrain': 'retrain_live',
+    'populate_inventory': 'populate_inventory_transactions',
+}
+
+ACTIVE_STATES = ('queued', 'running')
+
+# Don't rewrite the status file more often than this while progressing
+PROGRESS_INTERVAL = 1.0
+
+
+def status_path(name):
+    return os.path.join(JOBS_DIR, f'{name}.json')
+
+
+def lock_path(name):
+    return os.path.join(JOBS_DIR, f'{name}.lock')
+
+
+def log_path(name):
+    return os.path.join(JOBS_DIR, f'{name}.log')
+
+
+def acquire_lock(name):
+    """
+    Try to take the job's single-flight lock without blocking.
+    Returns the open file descriptor holding it, or None if it is taken.
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    fd = os.open(lock_path(name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def write_status(name, status):
+    """Atomically replace the job's status file."""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    tmp = status_path(name) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, status_path(name))
+
+
+def read_status(name):
+    """
+    Current status of a job, with live elapsed/ETA figures.
+    A job left 'running' by a process that died is reported as failed.
+    """
+    try:
+        with open(status_path(name), 'r', encoding='utf-8') as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return {'job': name, 'state': 'idle'}
+
+    if status.get('state') in ACTIVE_STATES:
+        fd = acquire_lock(name)
+        if fd is not None:
+            # Nobody holds the lock any more, so the job process is gone
+            os.close(fd)
+            status.update(state='failed', error='Job process exited unexpectedly',
+                          finished_at=datetime.now().isoformat())
+            write_status(name, status)
+        else:
+            status.update(timing(status))
+    return status
+
+
+def timing(status, now=None):
+    """elapsed_seconds and eta_seconds from started_at and done/total."""
+    if not status.get('started_at'):
+        return {'elapsed_seconds': 0, 'eta_seconds': None}
+    now = now or datetime.now()
+    elapsed = (now - datetime.fromisoformat(status['started_at'])).total_seconds()
+    done, total = status.get('done') or 0, status.get('total')
+    eta = None
+    if total and done:
+        eta = round(elapsed / done * max(total - done, 0), 1)
+    return {'elapsed_seconds': round(elapsed, 1), 'eta_seconds': eta}
+
+
+def submit(name, args=()):
+    """
+    Start job `name` in the background unless it is already running.
+    Returns (started, status).
+    """
+    if name not in JOBS:
+        raise ValueError(f"Unknown job: {name}")
+
+    fd = acquire_lock(name)
+    if fd is None:
+        return False, read_status(name)
+
+    try:
+        status = {
+            'job': name,
+            'command': JOBS[name],
+            'state': 'queued',
+            'submitted_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'done': 0,
+            'total': None,
+            'error': None,
+        }
+        write_status(name, status)
+
+        # The child inherits the locked descriptor, which keeps the lock
+        # held for exactly as long as the job process lives.
+        with open(log_path(name), 'w', encoding='utf-8') as log:
+            process = subprocess.Popen(
+                [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+                 'run_job', name, '--lock-fd', str(fd), *args],
+                stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                pass_fds=(fd,), start_new_session=True,
+            )
+        # Reap the child when it exits so it doesn't linger as a zombie
+        threading.Thread(target=process.wait, daemon=True).start()
+    finally:
+        os.close(fd)
+
+    return True, status
+
+
+class ProgressReporter:
+    """
+    Passed to a job's command as its `progress` option; call it with
+    (done, total) as work completes.
+    """
+
+    def __init__(self, name, status):
+        self.name = name
+        self.status = status
+        self.last_write = 0.0
+
+    def __call__(self, done, total):
+        self.status['done'] = done
+        self.status['total'] = total
+        now = time.monotonic()
+        if now - self.last_write >= PROGRESS_INTERVAL or done >= total:
+            self.last_write = now
+            self.status.update(timing(self.status))
+            write_status(self.name, self.status)
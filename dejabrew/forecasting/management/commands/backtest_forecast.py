@@ -0,0 +1,219 @@
+# forecasting/management/commands/backtest_forecast.py
+
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from forecasting.forecasting_service import (
+    DATA_DIR,
+    GENERATED_CSV,
+    load_live_db_data,
+    pivot_daily,
+    create_date_features,
+    build_global_features,
+    train_article_model,
+    train_global_model,
+)
+
+DEFAULT_REPORT = os.path.join(DATA_DIR, 'backtest_report.json')
+
+
+def load_source(source):
+    """
+    Daily sales matrix (every calendar day x article) for one data source.
+    Days without sales are filled with 0 so origins step by real days.
+    """
+    if source == 'csv':
+        if not os.path.exists(GENERATED_CSV):
+            return pd.DataFrame()
+        df = pd.read_csv(GENERATED_CSV)
+        df['date'] = pd.to_datetime(df['date'])
+        df['article'] = df['article'].str.strip()
+    else:
+        df = load_live_db_data()
+    df = df[df['quantity'] > 0]
+    if df.empty:
+        return pd.DataFrame()
+    return pivot_daily(df).asfreq('D', fill_value=0)
+
+
+class Measure:
+    """Wall time and peak traced memory (KB) of the enclosed block."""
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self.base = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.peak_kb = max(0, tracemalloc.get_traced_memory()[1] - self.base) / 1024
+
+
+def run_per_article(train, test_index):
+    X_train = create_date_features(train.index)
+    X_test = create_date_features(test_index)
+    preds, stats = {}, {}
+    for article in train.columns:
+        with Measure() as fit:
+            model = train_article_model(X_train, train[article])
+        with Measure() as predict:
+            preds[article] = model.predict(X_test)
+        stats[article] = {
+            'fit_seconds': fit.seconds,
+            'predict_seconds': predict.seconds,
+            'peak_memory_kb': max(fit.peak_kb, predict.peak_kb),
+        }
+    return pd.DataFrame(preds, index=test_index), stats
+
+
+def run_global(train, test_index):
+    articles = train.columns.tolist()
+    with Measure() as fit:
+        bundle, _, _ = train_global_model(train)
+    with Measure() as predict:
+        X_test = build_global_features(create_date_features(test_index), range(len(articles)))
+        y = bundle['model'].predict(X_test).reshape(len(articles), len(test_index))
+    # One model serves every article, so its cost is amortized per article
+    share = {
+        'fit_seconds': fit.seconds / len(articles),
+        'predict_seconds': predict.seconds / len(articles),
+        'peak_memory_kb': max(fit.peak_kb, predict.peak_kb),
+    }
+    return pd.DataFrame(y.T, index=test_index, columns=articles), {a: dict(share) for a in articles}
+
+
+ENGINES = {
+    'per-article': run_per_article,
+    'global': run_global,
+}
+
+
+class Command(BaseCommand):
+    help = ('Rolling-origin backtest of the forecasting engines over generated_sales.csv '
+            'and the live DB. Writes accuracy, fit/predict time and peak memory per article '
+            'to a JSON report.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', nargs='+', choices=['csv', 'db'], default=['csv', 'db'])
+        parser.add_argument('--engine', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+        parser.add_argument('--folds', type=int, default=4, help='Number of forecast origins')
+        parser.add_argument('--horizon', type=int, default=7, help='Days forecast from each origin')
+        parser.add_argument('--min-train', type=int, default=28,
+                            help='Minimum days of history before the first origin')
+        parser.add_argument('--output', default=DEFAULT_REPORT, help='Where to write the JSON report')
+        parser.add_argument('--baseline', help='Previous report to compare the summary against')
+
+    def handle(self, *args, **options):
+        folds, horizon = options['folds'], options['horizon']
+        report = {
+            'generated_at': datetime.now().isoformat(),
+            'params': {
+                'folds': folds, 'horizon': horizon, 'min_train': options['min_train'],
+                'engines': options['engine'],
+            },
+            'sources': {},
+        }
+
+        tracemalloc.start()
+        try:
+            for source in options['source']:
+                daily = load_source(source)
+                needed = options['min_train'] + folds * horizon
+                if daily.empty or len(daily) < needed:
+                    self.stdout.write(self.style.WARNING(
+                        f"Skipping {source}: {len(daily)} days of data, need {needed}"))
+                    continue
+                report['sources'][source] = self.backtest(daily, options['engine'], folds, horizon)
+        finally:
+            tracemalloc.stop()
+
+        if not report['sources']:
+            raise CommandError("No source had enough data to backtest.")
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        self.print_summary(report, baseline)
+        self.stdout.write(f"\n✓ Report saved to: {options['output']}")
+
+    def backtest(self, daily, engines, folds, horizon):
+        # Origins step back from the end, one horizon apart, oldest first
+        origins = [len(daily) - horizon * k for k in range(folds, 0, -1)]
+        result = {
+            'days': len(daily),
+            'articles': len(daily.columns),
+            'origins': [daily.index[o].date().isoformat() for o in origins],
+            'engines': {},
+        }
+
+        for engine in engines:
+            per_article = {a: {'abs_errors': [], 'pct_errors': [], 'fit_seconds': 0.0,
+                               'predict_seconds': 0.0, 'peak_memory_kb': 0.0} for a in daily.columns}
+            for origin in origins:
+                train = daily.iloc[:origin]
+                test = daily.iloc[origin:origin + horizon]
+                preds, stats = ENGINES[engine](train, test.index)
+                for article, acc in per_article.items():
+                    y_true = test[article].to_numpy(dtype=float)
+                    y_pred = preds[article].to_numpy()
+                    acc['abs_errors'].extend(np.abs(y_true - y_pred))
+                    acc['pct_errors'].extend(np.abs((y_true - y_pred) / (y_true + 1)) * 100)
+                    acc['fit_seconds'] += stats[article]['fit_seconds']
+                    acc['predict_seconds'] += stats[article]['predict_seconds']
+                    acc['peak_memory_kb'] = max(acc['peak_memory_kb'], stats[article]['peak_memory_kb'])
+
+            articles = {
+                article: {
+                    'mae': round(float(np.mean(acc['abs_errors'])), 4),
+                    'mape': round(float(np.mean(acc['pct_errors'])), 2),
+                    'fit_seconds': round(acc['fit_seconds'] / len(origins), 5),
+                    'predict_seconds': round(acc['predict_seconds'] / len(origins), 5),
+                    'peak_memory_kb': round(acc['peak_memory_kb'], 1),
+                }
+                for article, acc in per_article.items()
+            }
+            result['engines'][engine] = {
+                'summary': {
+                    'mae': round(float(np.mean([a['mae'] for a in articles.values()])), 4),
+                    'mape': round(float(np.mean([a['mape'] for a in articles.values()])), 2),
+                    'fit_seconds': round(sum(a['fit_seconds'] for a in articles.values()), 4),
+                    'predict_seconds': round(sum(a['predict_seconds'] for a in articles.values()), 5),
+                    'peak_memory_kb': round(max(a['peak_memory_kb'] for a in articles.values()), 1),
+                },
+                'articles': articles,
+            }
+        return result
+
+    def print_summary(self, report, baseline=None):
+        for source, result in report['sources'].items():
+            self.stdout.write(f"\n[{source}] {result['articles']} articles, {result['days']} days, "
+                              f"origins {', '.join(result['origins'])}")
+            self.stdout.write(f"{'engine':<12} {'MAE':>8} {'MAPE %':>8} {'fit (s)':>9} "
+                              f"{'predict (ms)':>13} {'peak mem (KB)':>14}")
+            for engine, data in result['engines'].items():
+                s = data['summary']
+                self.stdout.write(
+                    f"{engine:<12} {s['mae']:>8.3f} {s['mape']:>8.2f} {s['fit_seconds']:>9.3f} "
+                    f"{s['predict_seconds'] * 1000:>13.2f} {s['peak_memory_kb']:>14.1f}"
+                )
+                old = (baseline or {}).get('sources', {}).get(source, {}).get('engines', {}).get(engine)
+                if old:
+                    o = old['summary']
+                    self.stdout.write(
+                        f"{'  vs base':<12} {s['mae'] - o['mae']:>+8.3f} {s['mape'] - o['mape']:>+8.2f} "
+                        f"{s['fit_seconds'] - o['fit_seconds']:>+9.3f} "
+                        f"{(s['predict_seconds'] - o['predict_seconds']) * 1000:>+13.2f} "
+                        f"{s['peak_memory_kb'] - o['peak_memory_kb']:>+14.1f}"
+                    )
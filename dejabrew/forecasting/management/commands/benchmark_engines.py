@@ -0,0 +1,129 @@
+# forecasting/management/commands/benchmark_engines.py
+
+import io
+import json
+import time
+
+import joblib
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from forecasting.forecasting_service import (
+    load_combined_sales,
+    pivot_daily,
+    create_date_features,
+    create_date_features_for_range,
+    build_global_features,
+    train_article_model,
+    train_global_model,
+    score_forecast,
+)
+
+
+def serialized_size(obj):
+    """Size in bytes of obj as written by joblib.dump"""
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer)
+    return buffer.tell()
+
+
+class Command(BaseCommand):
+    help = ('Compares the per-article and global forecasting engines on the same '
+            '80/20 split: training time, model size, prediction latency and test MAPE.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, default=30,
+                            help='Days predicted per item when timing prediction')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Prediction timing repetitions (best run is reported)')
+        parser.add_argument('--json', dest='json_path',
+                            help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        horizon = options['horizon']
+        repeat = options['repeat']
+
+        df = load_combined_sales()
+        if df.empty:
+            self.stdout.write(self.style.ERROR("No data found in CSVs or Live DB. Aborting."))
+            return
+
+        daily = pivot_daily(df)
+        split = int(len(daily) * 0.8)
+        if split < 5:
+            self.stdout.write(self.style.ERROR("Not enough data for an 80/20 split. Aborting."))
+            return
+
+        articles = daily.columns.tolist()
+        future = create_date_features_for_range(daily.index[-1].date(), horizon)
+        results = {}
+
+        # --- Per-article: one GradientBoostingRegressor per product ---
+        X = create_date_features(daily.index)
+        X_train, X_test = X.iloc[:split], X.iloc[split:]
+        start = time.perf_counter()
+        models = {a: train_article_model(X_train, daily[a].iloc[:split]) for a in articles}
+        fit_seconds = time.perf_counter() - start
+
+        mapes = [
+            score_forecast(daily[a].iloc[split:], models[a].predict(X_test))[2]
+            for a in articles
+        ]
+
+        def predict_per_article():
+            for model in models.values():
+                model.predict(future)
+
+        results['per-article'] = {
+            'fit_seconds': fit_seconds,
+            'model_files': len(models),
+            'model_bytes': sum(serialized_size(m) for m in models.values()),
+            'predict_ms': self.best_of(predict_per_article, repeat),
+            'test_mape': float(np.mean(mapes)),
+        }
+
+        # --- Global: one HistGradientBoostingRegressor, article as a category ---
+        start = time.perf_counter()
+        bundle, X_test_g, y_test_g = train_global_model(daily, split=split)
+        fit_seconds = time.perf_counter() - start
+
+        y_pred_g = bundle['model'].predict(X_test_g)
+        codes = X_test_g['article_code'].to_numpy()
+        mapes = [
+            score_forecast(y_test_g[codes == c].to_numpy(), y_pred_g[codes == c])[2]
+            for c in range(len(articles))
+        ]
+        X_future = build_global_features(future, range(len(articles)))
+
+        results['global'] = {
+            'fit_seconds': fit_seconds,
+            'model_files': 1,
+            'model_bytes': serialized_size(bundle),
+            'predict_ms': self.best_of(lambda: bundle['model'].predict(X_future), repeat),
+            'test_mape': float(np.mean(mapes)),
+        }
+
+        self.stdout.write(f"{len(articles)} articles, {len(daily)} days "
+                          f"(train {split}, test {len(daily) - split}), horizon {horizon} days\n")
+        self.stdout.write(f"{'engine':<12} {'fit (s)':>9} {'files':>6} {'size (KB)':>10} "
+                          f"{'predict menu (ms)':>18} {'test MAPE %':>12}")
+        for engine, r in results.items():
+            self.stdout.write(
+                f"{engine:<12} {r['fit_seconds']:>9.2f} {r['model_files']:>6} "
+                f"{r['model_bytes'] / 1024:>10.1f} {r['predict_ms']:>18.2f} {r['test_mape']:>12.2f}"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump({'articles': len(articles), 'days': len(daily), 'horizon': horizon,
+                           'results': results}, f, indent=2)
+            self.stdout.write(f"\n✓ Results saved to: {options['json_path']}")
+
+    @staticmethod
+    def best_of(fn, repeat):
+        timings = []
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        return min(timings)
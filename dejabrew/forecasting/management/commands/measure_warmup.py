@@ -0,0 +1,116 @@
+# forecasting/management/commands/measure_warmup.py
+
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def read_memory_kb():
+    """
+    Returns (rss_kb, private_kb) for the current process.
+    private_kb is the unshared part (USS), which is what each extra
+    gunicorn worker really costs. Falls back to ru_maxrss off Linux.
+    """
+    rss = private = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1])
+        with open('/proc/self/smaps_rollup') as f:
+            private = 0
+            for line in f:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    private += int(line.split()[1])
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss, private
+
+
+def first_request(item_names):
+    """
+    What a worker does on its first predict_api hit: import the
+    forecasting views (URLconf is loaded lazily) and predict every item.
+    Returns elapsed milliseconds.
+    """
+    start = time.perf_counter()
+    import forecasting.views  # noqa: F401
+    from forecasting.forecasting_service import predict_for_item
+    for name in item_names:
+        predict_for_item(name, days=7)
+    return (time.perf_counter() - start) * 1000
+
+
+class Command(BaseCommand):
+    help = ('Measures per-worker memory and first forecast request latency '
+            'with and without preloading the models in the parent process.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of simulated workers per mode')
+        parser.add_argument('--probe', action='store_true',
+                            help='Internal: run one cold worker and print its JSON result')
+
+    def handle(self, *args, **options):
+        from pos.models import Item
+        item_names = list(Item.objects.filter(is_active=True).values_list('name', flat=True))
+
+        if options['probe']:
+            latency = first_request(item_names)
+            rss, private = read_memory_kb()
+            self.stdout.write(json.dumps({'latency_ms': latency, 'rss_kb': rss, 'private_kb': private}))
+            return
+
+        workers = options['workers']
+        connections.close_all()
+
+        # --- Cold: fresh interpreters, like gunicorn without preload_app ---
+        cold = []
+        for _ in range(workers):
+            out = subprocess.run(
+                [sys.executable, sys.argv[0], 'measure_warmup', '--probe'],
+                capture_output=True, text=True, check=True
+            ).stdout
+            cold.append(json.loads(out.strip().splitlines()[-1]))
+
+        # --- Warm: load everything here, then fork, like the when_ready hook ---
+        from forecasting.forecasting_service import warm_model_cache
+        import forecasting.views  # noqa: F401
+        warm_start = time.perf_counter()
+        loaded = warm_model_cache(item_names)
+        warm_ms = (time.perf_counter() - warm_start) * 1000
+        connections.close_all()
+        gc.freeze()
+
+        warm = []
+        for _ in range(workers):
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                latency = first_request(item_names)
+                rss, private = read_memory_kb()
+                os.write(write_fd, json.dumps({'latency_ms': latency, 'rss_kb': rss, 'private_kb': private}).encode())
+                os.close(write_fd)
+                os._exit(0)
+            os.close(write_fd)
+            with os.fdopen(read_fd) as f:
+                warm.append(json.loads(f.read()))
+            os.waitpid(pid, 0)
+
+        self.stdout.write(f"Items predicted per request: {len(item_names)}")
+        self.stdout.write(f"Models preloaded in parent: {loaded} ({warm_ms:.0f} ms)\n")
+        self.stdout.write(f"{'mode':<6} {'first request (ms)':>20} {'RSS (MB)':>10} {'private (MB)':>14}")
+        for mode, results in (('cold', cold), ('warm', warm)):
+            latency = sum(r['latency_ms'] for r in results) / len(results)
+            rss = sum(r['rss_kb'] or 0 for r in results) / len(results) / 1024
+            private = results[0]['private_kb']
+            private = sum(r['private_kb'] for r in results) / len(results) / 1024 if private is not None else float('nan')
+            self.stdout.write(f"{mode:<6} {latency:>20.1f} {rss:>10.1f} {private:>14.1f}")
@@ -1,10 +1,7 @@
 # forecasting/management/commands/retrain_live.py
 
 import os
-import pandas as pd
 import numpy as np
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.metrics import mean_absolute_error, r2_score
 import joblib
 import json
 from datetime import datetime
@@ -13,10 +10,13 @@ from django.db.models import Sum, F
 
 # --- UPDATED: Import from forecasting_service ---
 from forecasting.forecasting_service import (
-    load_live_db_data,
-    load_kaggle_data,
+    load_combined_sales,
     pivot_daily,
-    create_date_features
+    create_date_features,
+    train_article_model,
+    train_global_model,
+    score_forecast,
+    GLOBAL_MODEL_FILE
 ) 
 
 # --- Get paths from your train_models.py ---
@@ -46,26 +46,31 @@ def save_metrics_json(metrics_dict):
 # --- This is the main Django command ---
 class Command(BaseCommand):
     help = 'Retrains all product forecasting models using live DB and Kaggle data.'
+    # Callable(done, total) supplied by forecasting.jobs when run in the background
+    stealth_options = ('progress',)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engine',
+            choices=['per-article', 'global'],
+            default='per-article',
+            help='per-article: one GradientBoostingRegressor per product (default). '
+                 'global: one HistGradientBoostingRegressor for the whole menu.',
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS("Starting model retraining..."))
+        engine = options.get('engine', 'per-article')
+        self.progress = options.get('progress') or (lambda done, total: None)
+        self.stdout.write(self.style.SUCCESS(f"Starting model retraining ({engine} engine)..."))
 
-        # --- 1. LOAD DATA ---
-        # --- UPDATED: These functions are now imported ---
-        df_kaggle, bakery_articles, coffee_articles = load_kaggle_data()
-        df_live = load_live_db_data()
+        # --- 1. LOAD & COMBINE DATA ---
+        # Aggregates duplicates (e.g., same day, same item in both CSV and DB)
+        df = load_combined_sales()
 
-        if df_kaggle.empty and df_live.empty:
+        if df.empty:
             self.stdout.write(self.style.ERROR("No data found in CSVs or Live DB. Aborting."))
             return
 
-        # --- 2. COMBINE DATA ---
-        df = pd.concat([df_kaggle, df_live], ignore_index=True)
-        df = df[df['quantity'] > 0] # remove negatives/returns
-        
-        # Aggregate duplicates (e.g., same day, same item in both CSV and DB)
-        df = df.groupby(['date', 'article'])['quantity'].sum().reset_index()
-
         self.stdout.write(f"Combined data has {len(df)} total sales records.")
 
         # --- 3. TRAIN MODELS (Logic from train_models.py) ---
@@ -85,62 +90,10 @@ class Command(BaseCommand):
         trained_list = []
         all_metrics = []  # Store metrics for each trained model
 
-        for article in all_articles:
-            if article not in daily.columns:
-                self.stdout.write(f"Skipping {article} (not in data)")
-                continue
-            y = daily[article]
-
-            split = int(len(X) * 0.8)
-            if split < 5: # Need at least 5 data points to train
-                self.stdout.write(f"Skipping {article} (not enough data)")
-                continue
-
-            # Create train/test split (80/20)
-            X_train, X_test = X.iloc[:split], X.iloc[split:]
-            y_train, y_test = y.iloc[:split], y.iloc[split:]
-
-            try:
-                # Train the model
-                model = GradientBoostingRegressor(n_estimators=200, learning_rate=0.05, random_state=42)
-                model.fit(X_train, y_train)
-
-                # --- CALCULATE TEST SET METRICS ---
-                y_pred_test = model.predict(X_test)
-
-                # Calculate MAE, R², MAPE, and Accuracy on TEST SET
-                test_mae = mean_absolute_error(y_test, y_pred_test)
-                test_r2 = r2_score(y_test, y_pred_test)
-                test_mape = np.mean(np.abs((y_test - y_pred_test) / (y_test + 1))) * 100
-                test_accuracy = max(0, 100 - test_mape)
-
-                # Save the model
-                safe_name = article.lower().replace(' ', '_').replace('/', '_')
-                fname = f"{MODEL_PREFIX}{safe_name}.joblib"
-
-                joblib.dump(model, os.path.join(MODEL_DIR, fname))
-
-                # Store metrics for this model
-                article_metrics = {
-                    'article': article,
-                    'test_mae': round(test_mae, 2),
-                    'test_r2': round(test_r2, 4),
-                    'test_mape': round(test_mape, 2),
-                    'test_accuracy': round(test_accuracy, 2),
-                    'train_size': len(X_train),
-                    'test_size': len(X_test)
-                }
-                all_metrics.append(article_metrics)
-                trained_list.append(article)
-
-                # Print test metrics to terminal
-                self.stdout.write(
-                    f"✓ {article:<35} | Test Accuracy: {test_accuracy:>6.2f}% | "
-                    f"R²: {test_r2:>6.4f} | MAE: {test_mae:>6.2f}"
-                )
-
-            except Exception as e:
-                self.stdout.write(f"!! FAILED to train model for {article}: {e}")
+        if engine == 'global':
+            self.train_global(daily, trained_list, all_metrics)
+        else:
+            self.train_per_article(daily, X, all_articles, trained_list, all_metrics)
 
         # --- 4. SAVE METADATA ---
         json_path = os.path.join(MODEL_DIR, 'trained_articles.json')
@@ -150,6 +103,7 @@ class Command(BaseCommand):
         # --- 5. SAVE METRICS TO latest_metrics.json ---
         metrics_summary = {
             'trained_date': datetime.now().isoformat(),
+            'engine': engine,
             'total_models_trained': len(trained_list),
             'models': all_metrics,
             'average_metrics': {
@@ -174,8 +128,16 @@ class Command(BaseCommand):
         # --- 5. CLEANUP (from train_models.py) ---
         self.stdout.write("\nCleaning up old, unused model files...")
         
+        # The global engine replaces every per-article file, and vice versa
         safe_filenames = set()
-        for article in trained_list:
+        if engine == 'global':
+            trained_models = []
+        else:
+            trained_models = trained_list
+            if os.path.exists(GLOBAL_MODEL_FILE):
+                os.remove(GLOBAL_MODEL_FILE)
+                self.stdout.write(f"Removed old model: {os.path.basename(GLOBAL_MODEL_FILE)}")
+        for article in trained_models:
             safe_name = article.lower().replace(' ', '_').replace('/', '_')
             fname = f"{MODEL_PREFIX}{safe_name}.joblib"
             safe_filenames.add(fname)
@@ -198,4 +160,96 @@ class Command(BaseCommand):
                         self.stdout.write(f"Could not remove {filename}: {e}")
                             
         self.stdout.write(f"Cleanup complete. Removed {deleted_count} old models.")
-        self.stdout.write(self.style.SUCCESS("All models are now up to date."))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS("All models are now up to date."))
+
+    def train_per_article(self, daily, X, all_articles, trained_list, all_metrics):
+        """One GradientBoostingRegressor per article, saved as model_<article>.joblib"""
+        for done, article in enumerate(all_articles, start=1):
+            self.progress(done - 1, len(all_articles))
+            if article not in daily.columns:
+                self.stdout.write(f"Skipping {article} (not in data)")
+                continue
+            y = daily[article]
+
+            split = int(len(X) * 0.8)
+            if split < 5: # Need at least 5 data points to train
+                self.stdout.write(f"Skipping {article} (not enough data)")
+                continue
+
+            # Create train/test split (80/20)
+            X_train, X_test = X.iloc[:split], X.iloc[split:]
+            y_train, y_test = y.iloc[:split], y.iloc[split:]
+
+            try:
+                # Train the model
+                model = train_article_model(X_train, y_train)
+
+                # --- CALCULATE TEST SET METRICS ---
+                y_pred_test = model.predict(X_test)
+
+                # Calculate MAE, R², MAPE, and Accuracy on TEST SET
+                test_mae, test_r2, test_mape, test_accuracy = score_forecast(y_test, y_pred_test)
+
+                # Save the model
+                safe_name = article.lower().replace(' ', '_').replace('/', '_')
+                fname = f"{MODEL_PREFIX}{safe_name}.joblib"
+
+                joblib.dump(model, os.path.join(MODEL_DIR, fname))
+
+                # Store metrics for this model
+                article_metrics = {
+                    'article': article,
+                    'test_mae': round(test_mae, 2),
+                    'test_r2': round(test_r2, 4),
+                    'test_mape': round(test_mape, 2),
+                    'test_accuracy': round(test_accuracy, 2),
+                    'train_size': len(X_train),
+                    'test_size': len(X_test)
+                }
+                all_metrics.append(article_metrics)
+                trained_list.append(article)
+
+                # Print test metrics to terminal
+                self.stdout.write(
+                    f"✓ {article:<35} | Test Accuracy: {test_accuracy:>6.2f}% | "
+                    f"R²: {test_r2:>6.4f} | MAE: {test_mae:>6.2f}"
+                )
+
+            except Exception as e:
+                self.stdout.write(f"!! FAILED to train model for {article}: {e}")
+
+        self.progress(len(all_articles), len(all_articles))
+
+    def train_global(self, daily, trained_list, all_metrics):
+        """One HistGradientBoostingRegressor for all articles, saved as global_model.joblib"""
+        split = int(len(daily) * 0.8)
+        if split < 5:  # Need at least 5 days to train
+            self.stdout.write("Skipping global model (not enough data)")
+            return
+
+        self.progress(0, len(daily.columns))
+        bundle, X_test, y_test = train_global_model(daily, split=split)
+        joblib.dump(bundle, GLOBAL_MODEL_FILE)
+
+        y_pred = bundle['model'].predict(X_test)
+        codes = X_test['article_code'].to_numpy()
+        for code, article in enumerate(bundle['articles']):
+            mask = codes == code
+            test_mae, test_r2, test_mape, test_accuracy = score_forecast(
+                y_test[mask].to_numpy(), y_pred[mask]
+            )
+            all_metrics.append({
+                'article': article,
+                'test_mae': round(test_mae, 2),
+                'test_r2': round(test_r2, 4),
+                'test_mape': round(test_mape, 2),
+                'test_accuracy': round(test_accuracy, 2),
+                'train_size': split,
+                'test_size': int(mask.sum())
+            })
+            trained_list.append(article)
+            self.stdout.write(
+                f"✓ {article:<35} | Test Accuracy: {test_accuracy:>6.2f}% | "
+                f"R²: {test_r2:>6.4f} | MAE: {test_mae:>6.2f}"
+            )
+        self.progress(len(daily.columns), len(daily.columns))
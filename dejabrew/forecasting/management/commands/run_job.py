@@ -0,0 +1,60 @@
+# forecasting/management/commands/run_job.py
+
+import os
+import traceback
+from datetime import datetime
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from forecasting.jobs import JOBS, ProgressReporter, acquire_lock, read_status, timing, write_status
+
+
+class Command(BaseCommand):
+    help = ('Runs a background job (see forecasting.jobs.JOBS) under its single-flight '
+            'lock, recording progress for the job status endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(JOBS))
+        parser.add_argument('--lock-fd', type=int,
+                            help='Internal: descriptor of the lock already taken by the submitter')
+        parser.add_argument('args', nargs='*', help='Extra arguments for the job command')
+
+    def handle(self, *args, **options):
+        name = options['name']
+        fd = options['lock_fd']
+        if fd is None:
+            fd = acquire_lock(name)
+            if fd is None:
+                raise CommandError(f"Job '{name}' is already running.")
+
+        status = read_status(name)
+        status.update(
+            job=name,
+            command=JOBS[name],
+            state='running',
+            pid=os.getpid(),
+            started_at=datetime.now().isoformat(),
+            finished_at=None,
+            done=0,
+            total=None,
+            error=None,
+        )
+        status.setdefault('submitted_at', status['started_at'])
+        write_status(name, status)
+
+        try:
+            call_command(JOBS[name], *args, progress=ProgressReporter(name, status),
+                         stdout=self.stdout, stderr=self.stderr)
+        except BaseException as e:
+            status.update(state='failed', error=str(e) or e.__class__.__name__)
+            traceback.print_exc()
+            raise
+        else:
+            status['state'] = 'succeeded'
+        finally:
+            status.update(timing(status), finished_at=datetime.now().isoformat(), eta_seconds=0)
+            write_status(name, status)
+            os.close(fd)
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Job '{name}' finished in {status['elapsed_seconds']}s"))
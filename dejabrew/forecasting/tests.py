@@ -0,0 +1,184 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.test import RequestFactory, SimpleTestCase
+
+from forecasting import jobs
+from forecasting.forecasting_service import (
+    MAX_CATEGORICAL_ARTICLES, build_global_features, create_date_features_for_range,
+    train_global_model
+)
+from forecasting.utils import (
+    make_features, train_gb_model, forecast_next_days, forecast_next_days_many
+)
+
+
+def reference_forecast_next_days(model, df_daily, days=30):
+    """The original one-row-at-a-time recursive forecaster, kept as the oracle."""
+    df_feat = make_features(df_daily)
+    current_row = df_feat.iloc[-1:].copy()
+    preds, dates = [], []
+    for i in range(days):
+        next_date = current_row['date'].iloc[0] + pd.Timedelta(days=1)
+        new_row = {
+            'date': next_date,
+            'dayofweek': next_date.dayofweek,
+            'day': next_date.day,
+            'month': next_date.month,
+            'is_month_start': int(next_date.is_month_start),
+        }
+        history = list(df_feat['quantity'].values) + preds
+        for lag in [1, 2, 3, 7, 14]:
+            new_row[f'lag_{lag}'] = history[-lag] if len(history) >= lag else 0
+        new_row['rolling_7'] = np.mean(history[-7:]) if len(history) >= 1 else 0
+        new_row['rolling_14'] = np.mean(history[-14:]) if len(history) >= 1 else 0
+        yhat = max(0, float(model.predict(pd.DataFrame([new_row]).drop(columns=['date']))[0]))
+        preds.append(yhat)
+        dates.append(next_date)
+        current_row = pd.DataFrame([new_row])
+    return pd.DataFrame({'date': dates, 'predicted_quantity': preds})
+
+
+def make_series(seed, length, start='2025-01-01'):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=length, freq='D')
+    weekly = 10 + 5 * np.sin(np.arange(length) * 2 * np.pi / 7)
+    return pd.DataFrame({'date': dates, 'quantity': rng.poisson(weekly)})
+
+
+class RecursiveForecasterTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model, _ = train_gb_model(make_series(0, 120))
+
+    def test_single_series_matches_reference(self):
+        df = make_series(1, 90)
+        expected = reference_forecast_next_days(self.model, df, days=45)
+        result = forecast_next_days(self.model, df, days=45)
+        np.testing.assert_array_equal(result['predicted_quantity'], expected['predicted_quantity'])
+        self.assertTrue((result['date'].to_numpy() == expected['date'].to_numpy()).all())
+
+    def test_many_series_in_lockstep_match_reference(self):
+        # Different lengths (including shorter than every lag window) and end dates
+        series = {
+            'long': make_series(2, 200),
+            'short': make_series(3, 4, start='2025-03-10'),
+            'one_day': make_series(4, 1, start='2025-02-27'),
+            'mid': make_series(5, 10, start='2024-12-25'),
+        }
+        results = forecast_next_days_many(self.model, series, days=30)
+        for key, df in series.items():
+            expected = reference_forecast_next_days(self.model, df, days=30)
+            np.testing.assert_array_equal(
+                results[key]['predicted_quantity'], expected['predicted_quantity'], err_msg=key
+            )
+            self.assertTrue((results[key]['date'].to_numpy() == expected['date'].to_numpy()).all())
+
+    def test_per_series_models(self):
+        other_model, _ = train_gb_model(make_series(9, 60))
+        series = {'a': make_series(6, 40), 'b': make_series(7, 50)}
+        models = {'a': self.model, 'b': other_model}
+        results = forecast_next_days_many(models, series, days=20)
+        for key, df in series.items():
+            expected = reference_forecast_next_days(models[key], df, days=20)
+            np.testing.assert_array_equal(results[key]['predicted_quantity'], expected['predicted_quantity'])
+
+
+class GlobalModelTests(SimpleTestCase):
+
+    def daily(self, n_articles, n_days=21):
+        rng = np.random.default_rng(0)
+        return pd.DataFrame(
+            rng.poisson(5, size=(n_days, n_articles)),
+            index=pd.date_range('2025-01-01', periods=n_days, freq='D'),
+            columns=[f'Article {i}' for i in range(n_articles)],
+        )
+
+    def test_article_code_is_categorical_on_small_menus(self):
+        bundle, _, _ = train_global_model(self.daily(3))
+        self.assertTrue(bundle['model'].is_categorical_[-1])
+
+    def test_menus_past_the_category_limit_still_train(self):
+        n = MAX_CATEGORICAL_ARTICLES + 45
+        with mock.patch('builtins.print'):
+            bundle, X_test, y_test = train_global_model(self.daily(n), split=14)
+        self.assertIsNone(bundle['model'].is_categorical_)
+        self.assertEqual(len(X_test), n * 7)
+
+        features = create_date_features_for_range(datetime(2025, 1, 22), 5)
+        X = build_global_features(features, [0, n - 1])
+        preds = bundle['model'].predict(X[bundle['features']])
+        self.assertEqual(len(preds), 10)
+
+
+class BackgroundJobTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(jobs, 'JOBS_DIR', tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_submit_is_single_flight(self):
+        fd = jobs.acquire_lock('retrain')
+        self.addCleanup(os.close, fd)
+        jobs.write_status('retrain', {'job': 'retrain', 'state': 'running', 'done': 3, 'total': 10,
+                                      'started_at': datetime.now().isoformat()})
+        with mock.patch('forecasting.jobs.subprocess.Popen') as popen:
+            started, status = jobs.submit('retrain')
+        self.assertFalse(started)
+        popen.assert_not_called()
+        self.assertEqual(status['state'], 'running')
+        self.assertEqual(status['done'], 3)
+
+    def test_submit_starts_job_and_releases_lock_to_child(self):
+        with mock.patch('forecasting.jobs.subprocess.Popen') as popen:
+            started, status = jobs.submit('populate_inventory')
+        self.assertTrue(started)
+        self.assertEqual(status['state'], 'queued')
+        command = popen.call_args[0][0]
+        self.assertEqual(command[2:4], ['run_job', 'populate_inventory'])
+        # The mocked child never held the lock, so the job reads as dead
+        self.assertEqual(jobs.read_status('populate_inventory')['state'], 'failed')
+
+    def test_both_routes_answer_alike(self):
+        from forecasting import views as forecasting_views
+        from pos import views as pos_views
+
+        request = RequestFactory().post('/run-retrain/')
+        with mock.patch('forecasting.jobs.subprocess.Popen'):
+            payloads = [json.loads(module.run_retrain(request).content)
+                        for module in (pos_views, forecasting_views)]
+        self.assertEqual(payloads[0].keys(), payloads[1].keys())
+        self.assertEqual(payloads[1]['status_url'], '/api/jobs/retrain/')
+
+    def test_unknown_job(self):
+        with self.assertRaises(ValueError):
+            jobs.submit('nope')
+        self.assertEqual(jobs.read_status('nope'), {'job': 'nope', 'state': 'idle'})
+
+    def test_timing_eta(self):
+        now = datetime(2025, 1, 1, 12, 0, 20)
+        status = {'started_at': (now - timedelta(seconds=20)).isoformat(), 'done': 5, 'total': 15}
+        self.assertEqual(jobs.timing(status, now), {'elapsed_seconds': 20.0, 'eta_seconds': 40.0})
+        status['done'] = 0
+        self.assertIsNone(jobs.timing(status, now)['eta_seconds'])
+
+    def test_progress_reporter_persists(self):
+        status = {'job': 'retrain', 'state': 'running', 'started_at': datetime.now().isoformat()}
+        report = jobs.ProgressReporter('retrain', status)
+        report(1, 4)
+        report(2, 4)  # throttled, not written yet
+        report(4, 4)  # completion is always written
+        fd = jobs.acquire_lock('retrain')
+        self.addCleanup(os.close, fd)
+        saved = jobs.read_status('retrain')
+        self.assertEqual((saved['done'], saved['total']), (4, 4))
@@ -1,5 +1,6 @@
 import os
 import pickle
+from collections import defaultdict
 from datetime import timedelta
 import numpy as np
 import pandas as pd
@@ -42,7 +43,7 @@ def load_sales_df():
 
     # Get all paid order items
     qs = OrderItem.objects.filter(order__status='paid') \
-                          .annotate(date=F('order__created_at__date')) \
+                          .annotate(date=F('order__business_date')) \
                           .values('date', 'item__name', 'item_id') \
                           .annotate(quantity=Sum('qty')) \
                           .order_by('date')
@@ -96,45 +97,102 @@ def train_gb_model(df_daily, test_size=0.2, random_state=42):
     metrics = {'mae': float(mae), 'rmse': float(rmse), 'mape': float(mape)}
     return model, metrics
 
+LAGS = (1, 2, 3, 7, 14)
+ROLLING_WINDOWS = (7, 14)
+HISTORY_WINDOW = max(LAGS + ROLLING_WINDOWS)
+FEATURE_COLUMNS = (
+    ['dayofweek', 'day', 'month', 'is_month_start']
+    + [f'lag_{lag}' for lag in LAGS]
+    + [f'rolling_{w}' for w in ROLLING_WINDOWS]
+)
+
+
 def forecast_next_days(model, df_daily, days=30):
-    df_feat = make_features(df_daily)
-    last_row = df_feat.iloc[-1:].copy()
-    preds = []
-    dates = []
-    current_row = last_row.copy()
-    for i in range(days):
-        next_date = current_row['date'].iloc[0] + pd.Timedelta(days=1)
-        # build row for next_date
-        new_row = {}
-        new_row['date'] = next_date
-        new_row['dayofweek'] = next_date.dayofweek
-        new_row['day'] = next_date.day
-        new_row['month'] = next_date.month
-        new_row['is_month_start'] = int(next_date.is_month_start)
-        # compute lag features from current_row / previously predicted
-        # for simplicity we'll use previous predicted values stored in preds
-        history = list(df_feat['quantity'].values) + preds
-        # last 14 values of history
-        for lag in [1,2,3,7,14]:
-            if len(history) >= lag:
-                new_row[f'lag_{lag}'] = history[-lag]
-            else:
-                new_row[f'lag_{lag}'] = 0
-        # rolling means
-        window7 = np.mean(history[-7:]) if len(history) >= 1 else 0
-        window14 = np.mean(history[-14:]) if len(history) >= 1 else 0
-        new_row['rolling_7'] = window7
-        new_row['rolling_14'] = window14
-        X_new = pd.DataFrame([new_row]).drop(columns=['date'])
-        yhat = model.predict(X_new)[0]
-        # floor at 0
-        yhat = max(0, float(yhat))
-        preds.append(yhat)
-        dates.append(next_date)
-        # append to df_feat equivalent for next iter (not needed in detail)
-        # create a pseudo row to extend 'history' already handled
-        current_row = pd.DataFrame([new_row])
-    return pd.DataFrame({'date': dates, 'predicted_quantity': preds})
+    return forecast_next_days_many(model, {0: df_daily}, days=days)[0]
+
+
+def forecast_next_days_many(model, daily_by_key, days=30):
+    """
+    Recursive multi-step forecast for many series at once.
+
+    Each series' last HISTORY_WINDOW values live in one row of a fixed
+    NumPy ring buffer, so a step costs one feature matrix for all series
+    and one model.predict per distinct model, instead of a DataFrame and
+    a predict call per series per day.
+
+    Args:
+        model: a fitted model shared by every series, or {key: model}
+        daily_by_key: {key: df with columns ['date', 'quantity']}
+        days: horizon
+
+    Returns:
+        {key: DataFrame(date, predicted_quantity)}, identical to running
+        the one-series recursive forecast on each key.
+    """
+    keys = list(daily_by_key)
+    n = len(keys)
+    width = HISTORY_WINDOW
+
+    # Right-align each series' tail so the most recent value sits just
+    # before the write head (index 0).
+    buffer = np.zeros((n, width))
+    filled = np.zeros(n, dtype=np.int64)
+    last_dates = np.empty(n, dtype='datetime64[ns]')
+    for row, key in enumerate(keys):
+        d = daily_by_key[key].sort_values('date')
+        tail = d['quantity'].fillna(0).to_numpy(dtype=float)[-width:]
+        buffer[row, width - len(tail):] = tail
+        filled[row] = len(tail)
+        last_dates[row] = pd.Timestamp(d['date'].iloc[-1]).to_datetime64()
+
+    # Series that share a model object are predicted together
+    groups = defaultdict(list)
+    for row, key in enumerate(keys):
+        groups[id(model[key] if isinstance(model, dict) else model)].append(row)
+    group_models = {
+        gid: (model[keys[rows[0]]] if isinstance(model, dict) else model)
+        for gid, rows in groups.items()
+    }
+    group_rows = {gid: np.asarray(rows) for gid, rows in groups.items()}
+
+    preds = np.zeros((n, days))
+    head = 0
+    X = np.zeros((n, len(FEATURE_COLUMNS)))
+    for step in range(days):
+        dates = pd.DatetimeIndex(last_dates + np.timedelta64(step + 1, 'D'))
+        X[:, 0] = dates.dayofweek
+        X[:, 1] = dates.day
+        X[:, 2] = dates.month
+        X[:, 3] = dates.is_month_start
+
+        # Chronological view of the ring buffer, oldest -> newest
+        window = buffer[:, (head + np.arange(width)) % width]
+
+        col = 4
+        for lag in LAGS:
+            X[:, col] = np.where(filled >= lag, window[:, width - lag], 0)
+            col += 1
+        for w in ROLLING_WINDOWS:
+            X[:, col] = window[:, width - w:].mean(axis=1)
+            # Short histories average whatever is there (0 when empty)
+            for row in np.flatnonzero(filled < w):
+                X[row, col] = window[row, width - filled[row]:].mean() if filled[row] else 0
+            col += 1
+
+        features = pd.DataFrame(X, columns=FEATURE_COLUMNS)
+        for gid, rows in group_rows.items():
+            yhat = group_models[gid].predict(features.iloc[rows])
+            preds[rows, step] = np.where(yhat > 0, yhat, 0)  # floor at 0
+
+        buffer[:, head] = preds[:, step]
+        head = (head + 1) % width
+        filled = np.minimum(filled + 1, width)
+
+    results = {}
+    for row, key in enumerate(keys):
+        dates = pd.date_range(pd.Timestamp(last_dates[row]) + pd.Timedelta(days=1), periods=days, freq='D')
+        results[key] = pd.DataFrame({'date': dates, 'predicted_quantity': preds[row]})
+    return results
 
 def save_model_pickle(model, filename):
     out_dir = os.path.join(settings.MEDIA_ROOT if hasattr(settings, 'MEDIA_ROOT') else settings.BASE_DIR, 'forecast_models')
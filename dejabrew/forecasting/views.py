@@ -9,7 +9,7 @@ from django.conf import settings
 from django.shortcuts import get_object_or_404, render
 # --- UPDATED IMPORTS ---
 from forecasting.forecasting_service import (
-    predict_for_item, compute_inventory_forecast, list_available_models,
+    predict_for_item, predict_for_items, compute_inventory_forecast, list_available_models,
     map_item_to_article, load_live_db_data, load_kaggle_data
 )
 # --- END UPDATED IMPORTS ---
@@ -166,6 +166,9 @@ def predict_api(request):
         # {item_name: [{'date': ..., 'predicted_quantity': ...}, ...]}
         full_preds_by_item = {}
 
+        # Recipes of the items loaded below, so the inventory forecast doesn't query per item
+        recipes = {}
+
         # If item specified, return only that item's forecast
         if item_param:
             preds = predict_for_item(item_param, days=days, start_date=start_date)
@@ -182,11 +185,13 @@ def predict_api(request):
                 'price': item_price
             }
         else:
-            # Predict for all Items that can be mapped
+            # Predict for all Items that can be mapped (one call for the whole menu)
             items = Item.objects.filter(is_active=True).order_by('id')
+            menu_preds = predict_for_items([it.name for it in items], days=days, start_date=start_date)
             for it in items:
+                recipes.setdefault(it.name, it.recipe or [])
                 # use Item.name as key
-                preds = predict_for_item(it.name, days=days, start_date=start_date)
+                preds = menu_preds.get(it.name)
                 if preds:
                     full_preds_by_item[it.name] = preds
                     # --- MODIFIED: Store price along with the series ---
@@ -236,7 +241,7 @@ def predict_api(request):
         inventory_forecast = compute_inventory_forecast(
             quantity_predictions,
             IngredientModel=Ingredient,
-            RecipeExtractor=lambda name: recipe_extractor_by_item_name(name),
+            RecipeExtractor=lambda name: recipes[name] if name in recipes else recipe_extractor_by_item_name(name),
             days=days
         )
 
@@ -355,12 +360,11 @@ def metrics_dashboard_view(request):
         }, status=500)
 
 
-from django.http import HttpResponse
-from django.core.management import call_command
+# Same payload as the routes in pos.views: job status, message and status_url
+from pos.views import submit_job_response
+
 def run_retrain(request):
-    call_command('retrain_live')
-    return HttpResponse("Retrain triggered!")
+    return submit_job_response('retrain')
 
 def populate_inventory(request):
-    call_command('populate_inventory_transactions')
-    return HttpResponse("Inventory population triggered!")
\ No newline at end of file
+    return submit_job_response('populate_inventory')
\ No newline at end of file
@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Item, Order, OrderItem, UserProfile, AuditTrail, Ingredient, WastedLog, InventoryTransaction
+
+from dejabrew.sqlite_backend import immediate_atomic
+
+from .best_sellers import record_order
+from .models import Item, Order, OrderItem, UserProfile, AuditTrail, Ingredient, WastedLog, InventoryTransaction, InventorySnapshot, SlowQuery
 
 
 # =======================
@@ -43,18 +47,55 @@ class OrderAdmin(admin.ModelAdmin):
     # Bulk actions for status updates (matches STATUS_CHOICES)
     actions = ['mark_as_paid', 'mark_as_cancelled']
 
+    # Keep the best-seller totals in step, as OrderViewSet does: an order's
+    # sales are taken back out before a change and added again after it
+    def set_status(self, queryset, status):
+        with immediate_atomic():
+            orders = list(queryset)
+            for order in orders:
+                record_order(order, -1)
+            updated = queryset.update(status=status)
+            for order in orders:
+                order.status = status
+                record_order(order)
+        return updated
+
     def mark_as_paid(self, request, queryset):
-        updated = queryset.update(status='paid')
+        updated = self.set_status(queryset, 'paid')
         self.message_user(request, f'{updated} order(s) marked as paid.')
     mark_as_paid.short_description = 'Mark selected orders as paid'
 
     def mark_as_cancelled(self, request, queryset):
-        updated = queryset.update(status='cancelled')
+        updated = self.set_status(queryset, 'cancelled')
         self.message_user(request, f'{updated} order(s) marked as cancelled.')
     mark_as_cancelled.short_description = 'Mark selected orders as cancelled'
 
+    # The change form saves the order, then its lines: the old sales come out
+    # before the first and the new ones go in after the second
+    def save_model(self, request, obj, form, change):
+        with immediate_atomic():
+            if change:
+                record_order(Order.objects.get(pk=obj.pk), -1)
+            super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        with immediate_atomic():
+            super().save_related(request, form, formsets, change)
+            record_order(form.instance)
+
+    def delete_model(self, request, obj):
+        with immediate_atomic():
+            record_order(obj, -1)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with immediate_atomic():
+            for order in queryset:
+                record_order(order, -1)
+            super().delete_queryset(request, queryset)
+
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('cashier', 'items__item')
+        return super().get_queryset(request).select_related('cashier').prefetch_related('items__item')
 
 
 # =======================
@@ -155,4 +196,45 @@ class InventoryTransactionAdmin(admin.ModelAdmin):
 
     def has_delete_permission(self, request, obj=None):
         # Only superusers can delete transactions
-        return request.user.is_superuser
\ No newline at end of file
+        return request.user.is_superuser
+
+# =======================
+#  INVENTORY SNAPSHOT ADMIN
+# =======================
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ('ingredient_name', 'taken_at', 'main_stock', 'stock_room', 'unit', 'cost_per_unit', 'valuation')
+    search_fields = ('ingredient_name',)
+    list_filter = ('taken_at',)
+    ordering = ('-taken_at', 'ingredient_name')
+    date_hierarchy = 'taken_at'
+
+    # Snapshots are written by the snapshot_inventory command / endpoint only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+# =======================
+#  SLOW QUERY ADMIN
+# =======================
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('short_sql', 'count', 'total_ms', 'avg_ms', 'max_ms', 'view', 'last_seen')
+    search_fields = ('sql', 'view', 'origin')
+    list_filter = ('view',)
+    ordering = ('-total_ms',)
+    readonly_fields = ('fingerprint_hash', 'sql', 'params', 'view', 'origin', 'plan',
+                       'count', 'total_ms', 'max_ms', 'first_seen', 'last_seen')
+
+    def short_sql(self, obj):
+        return obj.sql[:120]
+    short_sql.short_description = 'SQL'
+
+    # Rows are written by dejabrew.slow_queries; delete them to start counting afresh
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
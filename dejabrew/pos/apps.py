@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pos'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from dejabrew import slow_queries
+        connection_created.connect(slow_queries.install, dispatch_uid='dejabrew.slow_queries')
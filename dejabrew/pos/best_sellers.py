@@ -0,0 +1,84 @@
+"""
+Best-seller rankings over the last 7 days, the last 30 days and all time.
+
+ItemDailySales holds the units of each item sold per day in paid orders.
+Paying an order adds its lines with one upsert; changing or deleting an
+order takes its old lines back out. A ranking then sums at most a window's
+worth of rows per item, reading the recipe and image from the same query,
+instead of grouping every OrderItem in history on each call.
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Item, ItemDailySales, OrderItem
+
+WINDOWS = {'7d': 7, '30d': 30, 'all': None}
+DEFAULT_WINDOW = 'all'
+DEFAULT_LIMIT = 50
+UPSERT_CHUNK = 300  # Rows per statement, well under SQLite's bound-parameter limit
+
+
+def record_sales(rows):
+    """Adds (item_id, day, quantity) rows to the daily totals; quantities may be negative."""
+    totals = Counter()
+    for item_id, day, quantity in rows:
+        totals[item_id, day] += quantity
+    values = [(item_id, day, quantity) for (item_id, day), quantity in totals.items() if quantity]
+    if not values:
+        return
+
+    table = connection.ops.quote_name(ItemDailySales._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), UPSERT_CHUNK):
+            chunk = values[start:start + UPSERT_CHUNK]
+            cursor.execute(
+                f"INSERT INTO {table} (item_id, day, quantity) VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT (item_id, day) DO UPDATE SET quantity = {table}.quantity + excluded.quantity",
+                [value for row in chunk for value in row],
+            )
+
+
+def order_sales(order, lines, sign=1):
+    """(item_id, day, quantity) rows of an order's lines ([(item_id, qty), ...]); none unless it is paid."""
+    if order.status != 'paid':
+        return []
+    return [(item_id, order.business_date, sign * qty) for item_id, qty in lines]
+
+
+def record_order(order, sign=1):
+    """Adds (sign=-1: takes back) a saved order's lines, e.g. around an edit or delete."""
+    record_sales(order_sales(order, order.items.values_list('item_id', 'qty'), sign))
+
+
+def rebuild_item_sales():
+    """Recomputes every daily total from the paid orders. Returns the number of rows written."""
+    ItemDailySales.objects.all().delete()
+    totals = (
+        OrderItem.objects.filter(order__status='paid')
+        .values('item_id', day=F('order__business_date'))
+        .annotate(quantity=Sum('qty'))
+        .order_by()
+    )
+    return len(ItemDailySales.objects.bulk_create(
+        [ItemDailySales(**row) for row in totals.iterator()], batch_size=5000
+    ))
+
+
+def best_sellers(window=DEFAULT_WINDOW, limit=DEFAULT_LIMIT):
+    """Active items by units sold in the window, best first, in one query."""
+    sales = ItemDailySales.objects.filter(item=OuterRef('pk'))
+    if WINDOWS[window]:
+        sales = sales.filter(day__gt=timezone.localdate() - timedelta(days=WINDOWS[window]))
+    total = sales.order_by().values('item').annotate(total=Sum('quantity')).values('total')
+    return (
+        Item.objects.filter(is_active=True, is_archived=False)
+        .annotate(total_sold=Coalesce(Subquery(total, output_field=IntegerField()), 0))
+        .filter(total_sold__gt=0)
+        .order_by('-total_sold', 'id')[:limit]
+    )
@@ -0,0 +1,241 @@
+"""
+Bulk backfill of InventoryTransaction rows from historical paid orders and
+waste logs. Used by the populate_inventory_transactions command and the
+populate_historical_transactions endpoint.
+
+Ingredients and item recipes are loaded once into memory, source rows are
+streamed with .iterator(), and transactions are written with bulk_create in
+batches. After each committed batch the last processed source id is saved to
+an optional checkpoint file so an interrupted run can resume where it stopped.
+"""
+
+import json
+import os
+import time
+from decimal import Decimal
+from itertools import groupby
+
+from django.db.models import Max
+
+from dejabrew.sqlite_backend import immediate_atomic
+
+from .models import Order, OrderItem, WastedLog, InventoryTransaction, Ingredient, Item
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Errors kept in the stats; the rest are only counted
+MAX_ERRORS = 1000
+
+# phase -> (reference prefix, notes prefix) of the rows it writes. process_order
+# writes "Used in order (recipe)" and record_waste "Waste recorded: ..." for the
+# same references, so a pending batch is also bounded by the ledger id it started after.
+PHASES = {
+    'orders': ('Order-', 'Used in order (recipe for '),
+    'waste': ('WasteLog-', 'Waste recorded: '),
+}
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    if not path:
+        return
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+def add_error(stats, message):
+    stats['error_count'] += 1
+    if len(stats['errors']) < MAX_ERRORS:
+        stats['errors'].append(message)
+
+
+def order_transactions(ingredients, recipes, after_id, stats):
+    """
+    Yields (order_id, [InventoryTransaction, ...]) for every paid order with
+    id > after_id, one group per order, reading order lines as a stream.
+    """
+    lines = (
+        OrderItem.objects
+        .filter(order__status='paid', order_id__gt=after_id)
+        .order_by('order_id', 'id')
+        .values_list('order_id', 'order__created_at', 'order__cashier_id', 'item_id', 'qty')
+        .iterator(chunk_size=DEFAULT_BATCH_SIZE)
+    )
+    for order_id, order_lines in groupby(lines, key=lambda line: line[0]):
+        rows = []
+        for _, created_at, cashier_id, item_id, qty in order_lines:
+            item_name, recipe = recipes.get(item_id, ('', None))
+            if not isinstance(recipe, list):
+                continue
+            for recipe_ingredient in recipe:
+                ingredient_name = recipe_ingredient.get('ingredient')
+                quantity_per_item = recipe_ingredient.get('quantity', 0)
+                if not ingredient_name or not quantity_per_item > 0:
+                    continue
+
+                ingredient = ingredients.get(ingredient_name)
+                if ingredient is None:
+                    add_error(stats, f'Ingredient "{ingredient_name}" not found for order {order_id}')
+                    continue
+
+                total_quantity = float(quantity_per_item) * qty
+                rows.append(InventoryTransaction(
+                    ingredient=ingredient,
+                    ingredient_name=ingredient.name,
+                    transaction_type='STOCK_OUT',
+                    quantity=-total_quantity,  # Negative for stock out
+                    unit=ingredient.unit,
+                    cost_per_unit=ingredient.cost,
+                    total_cost=Decimal(str(total_quantity)) * ingredient.cost,
+                    main_stock_after=ingredient.mainStock,
+                    stock_room_after=ingredient.stockRoom,
+                    notes=f"Used in order (recipe for {item_name})",
+                    reference=f"Order-{order_id}",
+                    user_id=cashier_id,
+                    created_at=created_at,
+                ))
+        yield order_id, rows
+
+
+def waste_transactions(ingredients_by_id, after_id, stats):
+    """Yields (waste_log_id, [InventoryTransaction]) for waste logs with id > after_id."""
+    logs = (
+        WastedLog.objects
+        .filter(id__gt=after_id)
+        .order_by('id')
+        .values_list('id', 'ingredient_id', 'ingredient_name', 'quantity', 'unit',
+                     'cost_at_waste', 'reason', 'user_id', 'wasted_at')
+        .iterator(chunk_size=DEFAULT_BATCH_SIZE)
+    )
+    for log_id, ingredient_id, name, quantity, unit, cost, reason, user_id, wasted_at in logs:
+        ingredient = ingredients_by_id.get(ingredient_id)
+        if ingredient is None:
+            add_error(stats, f'Ingredient for waste log {log_id} no longer exists')
+            yield log_id, []
+            continue
+        yield log_id, [InventoryTransaction(
+            ingredient=ingredient,
+            ingredient_name=name,
+            transaction_type='WASTE',
+            quantity=-quantity,  # Negative for waste
+            unit=unit,
+            cost_per_unit=cost / Decimal(str(quantity)) if quantity > 0 else Decimal('0'),
+            total_cost=cost,
+            main_stock_after=ingredient.mainStock,
+            stock_room_after=ingredient.stockRoom,
+            notes=f"Waste recorded: {reason}",
+            reference=f"WasteLog-{log_id}",
+            user_id=user_id,
+            created_at=wasted_at,
+        )]
+
+
+def discard_pending(phase, after_id, until_id, after_row=0):
+    """
+    Delete rows of a batch that may have committed without its checkpoint
+    being saved (interrupted between the two), so resuming can't duplicate them.
+    Only rows with an id above after_row (the newest ledger row when the batch
+    started) are the batch's; older ones for the same sources were written live.
+    """
+    reference_prefix, notes_prefix = PHASES[phase]
+    source = Order.objects.filter(status='paid') if phase == 'orders' else WastedLog.objects.all()
+    ids = source.filter(id__gt=after_id, id__lte=until_id).values_list('id', flat=True)
+    references = [f'{reference_prefix}{i}' for i in ids]
+    deleted = 0
+    for start in range(0, len(references), 500):
+        deleted += InventoryTransaction.objects.filter(
+            id__gt=after_row, reference__in=references[start:start + 500], notes__startswith=notes_prefix
+        ).delete()[0]
+    return deleted
+
+
+def backfill_inventory_transactions(batch_size=DEFAULT_BATCH_SIZE, checkpoint_path=None,
+                                    progress=None, log=None):
+    """
+    Writes STOCK_OUT rows for paid orders, then WASTE rows for waste logs.
+    Resumes from checkpoint_path if it exists, and removes it when done.
+    Returns stats: stock_out, waste, errors (the first MAX_ERRORS messages),
+    error_count, rows_per_second.
+    """
+    progress = progress or (lambda done, total: None)
+    log = log or (lambda message: None)
+
+    ingredients = {i.name: i for i in Ingredient.objects.all()}
+    ingredients_by_id = {i.id: i for i in ingredients.values()}
+    recipes = {item_id: (name, recipe) for item_id, name, recipe
+               in Item.objects.values_list('id', 'name', 'recipe')}
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    checkpoint.setdefault('orders', 0)
+    checkpoint.setdefault('waste', 0)
+    checkpoint.setdefault('rows', 0)
+    pending = checkpoint.pop('pending', None)
+    if pending:
+        deleted = discard_pending(pending['phase'], checkpoint[pending['phase']], pending['until'],
+                                  pending.get('after_row', 0))
+        log(f"Discarded {deleted} rows from an interrupted batch")
+
+    stats = {'stock_out': 0, 'waste': 0, 'errors': [], 'error_count': 0}
+    # Orders without lines yield no group, so they aren't counted either
+    orders = Order.objects.filter(status='paid', items__isnull=False).distinct()
+    total = orders.count() + WastedLog.objects.count()
+    done = (orders.filter(id__lte=checkpoint['orders']).count()
+            + WastedLog.objects.filter(id__lte=checkpoint['waste']).count())
+    progress(done, total)
+
+    started = time.perf_counter()
+    written = 0
+
+    for phase, stat_key, groups in (
+        ('orders', 'stock_out', order_transactions(ingredients, recipes, checkpoint['orders'], stats)),
+        ('waste', 'waste', waste_transactions(ingredients_by_id, checkpoint['waste'], stats)),
+    ):
+        batch, last_id, sources = [], None, 0
+
+        def flush():
+            nonlocal batch, written, done, sources
+            # Mark the batch as pending first so a crash after the commit
+            # but before the checkpoint update is cleaned up on resume.
+            after_row = InventoryTransaction.objects.aggregate(after_row=Max('id'))['after_row'] or 0
+            save_checkpoint(checkpoint_path, {**checkpoint, 'pending': {'phase': phase, 'until': last_id,
+                                                                        'after_row': after_row}})
+            with immediate_atomic():
+                InventoryTransaction.objects.bulk_create(batch, batch_size=batch_size)
+            checkpoint[phase] = last_id
+            checkpoint['rows'] += len(batch)
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            stats[stat_key] += len(batch)
+            written += len(batch)
+            done += sources
+            progress(done, total)
+            elapsed = time.perf_counter() - started
+            log(f"  {phase}: {written} rows written, up to id {last_id} "
+                f"({written / elapsed if elapsed else 0:,.0f} rows/sec)")
+            batch, sources = [], 0
+
+        # Batches only end on a source boundary, so an order's rows are never split
+        for last_id, rows in groups:
+            batch.extend(rows)
+            sources += 1
+            if len(batch) >= batch_size:
+                flush()
+        if sources:
+            flush()
+
+    progress(total, total)
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    elapsed = time.perf_counter() - started
+    stats['elapsed_seconds'] = elapsed
+    stats['rows_per_second'] = written / elapsed if elapsed else 0
+    return stats
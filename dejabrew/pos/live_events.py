@@ -0,0 +1,147 @@
+"""
+Server-sent events: a push channel for terminals and the dashboard, so they
+can update stock and recent orders incrementally instead of re-fetching
+whole lists.
+
+Views publish compact events into the LiveEvent table, inside the same
+transaction as the change:
+
+- stock:     {"ingredients": [{"id", "name", "main", "room", "status"}, ...]}
+             after process_order, record_waste or an ingredient update
+- low_stock: one ingredient crossing its reorder level, with "level" (and
+             the previous "was") one of ok / low / out
+- order:     a new paid order, shaped like a recent_orders_api row
+
+GET /api/events/ streams them to logged-in users. It is an async view, so
+it needs the ASGI application (dejabrew.asgi, e.g. under uvicorn); each
+server process polls the table by id, which keeps every worker in step
+without a message broker. EventSource reconnects with Last-Event-ID and
+gets whatever it missed, or a `reset` event if that was already pruned.
+"""
+
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import LiveEvent
+
+BATCH_SIZE = 200
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+PRUNE_EVERY = 500
+
+
+def stock_level(main_stock, stock_room, reorder):
+    """ok / low / out, by the rules process_order and record_waste set the status with."""
+    if main_stock <= 0 and stock_room <= 0:
+        return 'out'
+    if main_stock < reorder:
+        return 'low'
+    return 'ok'
+
+
+def ingredient_data(ingredient):
+    return {'id': ingredient.id, 'name': ingredient.name, 'main': float(ingredient.mainStock),
+            'room': float(ingredient.stockRoom), 'status': ingredient.status}
+
+
+def order_data(order):
+    """One order as recent_orders_api lists it."""
+    return {'id': order.id, 'total': float(order.total), 'created_at': order.created_at.strftime('%H:%M'),
+            'cashier': order.cashier.username if order.cashier else 'Unknown',
+            'customer_name': order.customer_name or 'Walk-in', 'dining_option': order.dining_option}
+
+
+def publish(events):
+    """Saves events; call inside the transaction that made the change."""
+    if not events:
+        return
+    LiveEvent.objects.bulk_create(events)
+    # Prune every PRUNE_EVERY events rather than on a timer, so a request's query count doesn't vary
+    if any(event.id and event.id % PRUNE_EVERY == 0 for event in events):
+        cutoff = timezone.now() - timedelta(seconds=settings.LIVE_EVENTS_RETENTION_SECONDS)
+        LiveEvent.objects.filter(created_at__lt=cutoff).delete()
+
+
+def stock_events(changes):
+    """
+    Events for changed ingredients. `changes` holds (ingredient after the
+    change, main stock before, stock room before).
+    """
+    if not changes:
+        return []
+    events = [LiveEvent(kind='stock', data={'ingredients': [ingredient_data(i) for i, _, _ in changes]})]
+    for ingredient, main_before, room_before in changes:
+        was = stock_level(main_before, room_before, ingredient.reorder)
+        level = stock_level(ingredient.mainStock, ingredient.stockRoom, ingredient.reorder)
+        if level != was:
+            events.append(LiveEvent(kind='low_stock', data={
+                **ingredient_data(ingredient), 'reorder': float(ingredient.reorder), 'level': level, 'was': was,
+            }))
+    return events
+
+
+def order_events(order):
+    return [LiveEvent(kind='order', data=order_data(order))] if order.status == 'paid' else []
+
+
+def format_event(event):
+    return f"id: {event.id}\nevent: {event.kind}\ndata: {json.dumps(event.data, separators=(',', ':'))}\n\n"
+
+
+async def event_stream(cursor, kinds, reset):
+    """Yields SSE messages after event id `cursor` until LIVE_EVENTS_STREAM_SECONDS have passed."""
+    yield f'retry: {RETRY_MS}\n\n'
+    if reset:
+        yield f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+
+    deadline = time.monotonic() + settings.LIVE_EVENTS_STREAM_SECONDS
+    last_write = time.monotonic()
+    while time.monotonic() < deadline:
+        events = [e async for e in LiveEvent.objects.filter(id__gt=cursor).order_by('id')[:BATCH_SIZE]]
+        for event in events:
+            cursor = event.id
+            if not kinds or event.kind in kinds:
+                yield format_event(event)
+                last_write = time.monotonic()
+        if len(events) == BATCH_SIZE:
+            continue
+        if time.monotonic() - last_write >= HEARTBEAT_SECONDS:
+            yield ': ping\n\n'  # Keeps proxies from closing an idle stream
+            last_write = time.monotonic()
+        await asyncio.sleep(settings.LIVE_EVENTS_POLL_SECONDS)
+    # Closing now and then frees the connection; EventSource reconnects with Last-Event-ID
+
+
+async def live_events(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'success': False, 'error': 'Live events need the ASGI server (dejabrew.asgi)'},
+                            status=503)
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+
+    kinds = {k for k in request.GET.get('kinds', '').split(',') if k}
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    latest = await LiveEvent.objects.order_by('-id').values_list('id', flat=True).afirst() or 0
+    reset = False
+    if last_id and last_id.isdigit():
+        cursor = int(last_id)
+        oldest = await LiveEvent.objects.order_by('id').values_list('id', flat=True).afirst()
+        # Events after the client's last one were pruned: it has to reload its lists
+        reset = oldest is not None and oldest > cursor + 1
+        if reset:
+            cursor = latest
+    else:
+        cursor = latest  # New clients have just loaded the lists; only send what changes from here
+
+    response = StreamingHttpResponse(event_stream(cursor, kinds, reset), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
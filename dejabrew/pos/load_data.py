@@ -0,0 +1,335 @@
+"""
+Synthetic load data for benchmarks: cashiers, menu items built from
+pos/fixtures/sample_items.json with recipes on the existing ingredients,
+and a history of orders together with the ledger, waste and audit rows
+the POS writes alongside them.
+
+Orders follow a coffee shop's day (morning rush, lunch, afternoon peak)
+and week (busier weekends, slow start of the week), and a few items sell
+far more than the rest. Everything is drawn from one seeded NumPy
+generator, so the same seed on the same starting database gives the same
+rows. Rows are written with bulk_create, one transaction per batch.
+
+Generated rows belong to the CASHIER_PREFIX users, which is how
+delete_load_data() finds them again.
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from dejabrew.sqlite_backend import immediate_atomic
+
+from .best_sellers import rebuild_item_sales, record_sales
+from .ledger import replay_ledger
+from .margins import item_unit_cost
+from .models import AuditTrail, Ingredient, InventoryTransaction, Item, Order, OrderItem, UserProfile, WastedLog
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'sample_items.json')
+CASHIER_PREFIX = 'loadgen_cashier_'
+DEFAULT_PASSWORD = 'loadgen'
+DEFAULT_BATCH_SIZE = 10000
+
+# Relative number of orders in each opening hour
+HOUR_WEIGHTS = {7: 6, 8: 10, 9: 8, 10: 5, 11: 6, 12: 9, 13: 8, 14: 6, 15: 8, 16: 7, 17: 5, 18: 4, 19: 3, 20: 2}
+# Monday first
+WEEKDAY_WEIGHTS = (0.85, 0.8, 0.9, 0.95, 1.1, 1.35, 1.25)
+SHIFT_STARTS = (7, 14)  # Two cashier shifts a day
+CLOSING_HOUR = 21
+
+LINES_PER_ORDER = ((1, 0.45), (2, 0.3), (3, 0.17), (4, 0.08))
+QTY_PER_LINE = ((1, 0.75), (2, 0.2), (3, 0.05))
+STATUSES = (('paid', 0.97), ('cancelled', 0.02), ('pending', 0.01))
+PAYMENT_METHODS = (('Cash', 0.6), ('GCash', 0.3), ('Card', 0.1))
+DINING_OPTIONS = (('dine-in', 0.55), ('take-out', 0.45))
+SPOILAGE_CHANCE = 0.3  # Per perishable ingredient per day
+VARIANTS = ('Grande', 'Venti', 'Iced', 'Special', 'Classic', 'Double')
+
+
+@contextmanager
+def explicit_timestamps():
+    """Lets bulk_create keep the created_at/timestamp we set instead of auto_now_add's now()."""
+    fields = [Order._meta.get_field('created_at'), AuditTrail._meta.get_field('timestamp')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def pick(rng, choices, size):
+    values, weights = zip(*choices)
+    return np.asarray(values)[rng.choice(len(values), size=size, p=weights)]
+
+
+def ensure_cashiers(count, password=DEFAULT_PASSWORD):
+    """The first `count` load-test cashiers, creating the missing ones (staff role)."""
+    usernames = [f'{CASHIER_PREFIX}{i + 1}' for i in range(count)]
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    missing = [name for name in usernames if name not in existing]
+    if missing:
+        hashed = make_password(password)  # Hashing is slow; every cashier gets the same one
+        created = User.objects.bulk_create([
+            User(username=name, password=hashed, first_name='Load', last_name=f'Cashier {name.rsplit("_", 1)[1]}')
+            for name in missing
+        ])
+        UserProfile.objects.bulk_create([UserProfile(user=user, role='staff') for user in created])
+    users = User.objects.in_bulk(usernames, field_name='username')
+    return [users[name] for name in usernames]
+
+
+def ensure_items(count, rng, ingredients):
+    """
+    `count` menu items (at least the fixture's): the fixture items, then
+    variants of them with jittered prices and recipe quantities. Recipe
+    ingredients missing from the database are swapped for existing ones.
+    Items that already exist (by name) are reused as they are.
+    """
+    with open(FIXTURE, encoding='utf-8') as f:
+        base = [row['fields'] for row in json.load(f) if row['model'] == 'pos.item']
+    available = sorted(ingredients)
+
+    def recipe_for(fields, scale):
+        recipe = []
+        for line in fields.get('recipe') or []:
+            name = line['ingredient'] if line['ingredient'] in ingredients else available[rng.integers(len(available))]
+            if name not in [r['ingredient'] for r in recipe]:
+                recipe.append({'ingredient': name, 'quantity': round(float(line['quantity']) * scale, 3)})
+        return recipe
+
+    specs = []
+    for i in range(max(count, len(base))):
+        fields = base[i % len(base)]
+        if i < len(base):
+            specs.append({**fields, 'recipe': recipe_for(fields, 1)})
+            continue
+        variant = VARIANTS[(i // len(base) - 1) % len(VARIANTS)]
+        round_no = (i // len(base) - 1) // len(VARIANTS)
+        scale = float(rng.uniform(0.8, 1.5))
+        specs.append({
+            **fields,
+            'name': f"{variant} {fields['name']}" + (f' {round_no + 1}' if round_no else ''),
+            'price': str((Decimal(fields['price']) * Decimal(str(round(scale, 2)))).quantize(Decimal('1'))),
+            'recipe': recipe_for(fields, scale),
+        })
+
+    names = [spec['name'] for spec in specs]
+    existing = {item.name: item for item in Item.objects.filter(name__in=names).order_by('-id')}
+    Item.objects.bulk_create([
+        Item(name=spec['name'], description=spec.get('description', ''), category=spec.get('category', 'General'),
+             price=Decimal(spec['price']), stock=0 if spec['recipe'] else 10 ** 6,
+             image_url=spec.get('image_url', ''), recipe=spec['recipe'])
+        for spec in specs if spec['name'] not in existing
+    ])
+    items = {item.name: item for item in Item.objects.filter(name__in=names).order_by('-id')}
+    return [items[name] for name in names]
+
+
+def day_starts(days):
+    """Local midnights of the `days` whole days before today."""
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return [today - timedelta(days=days - k) for k in range(days)]
+
+
+def order_times(rng, orders, starts):
+    """Sorted epoch seconds of `orders` orders spread over the days by weekday, trend and hour of day."""
+    weights = np.array([WEEKDAY_WEIGHTS[d.weekday()] * (1 + 0.2 * k / len(starts)) for k, d in enumerate(starts)])
+    per_day = rng.multinomial(orders, weights / weights.sum())
+    hours, hour_weights = zip(*HOUR_WEIGHTS.items())
+    hour_p = np.array(hour_weights) / sum(hour_weights)
+    times = []
+    for start, count in zip(starts, per_day):
+        offsets = rng.choice(hours, size=count, p=hour_p) * 3600 + rng.integers(0, 3600, size=count)
+        times.append(np.sort(start.timestamp() + offsets))
+    return np.concatenate(times) if times else np.array([])
+
+
+def as_datetime(epoch):
+    return datetime.fromtimestamp(float(epoch), tz=dt_timezone.utc)
+
+
+def money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def write_orders(rng, times, chunk_start, first_day, items, recipes, ingredients, cashiers, stats, daily_use):
+    """Writes one batch of orders with their lines, STOCK_OUT rows and audit entries."""
+    n = len(times)
+    line_counts = pick(rng, LINES_PER_ORDER, n)
+    line_items = rng.choice(len(items), size=int(line_counts.sum()), p=stats['popularity'])
+    line_qty = pick(rng, QTY_PER_LINE, len(line_items))
+    starts = np.concatenate([[0], np.cumsum(line_counts)[:-1]])
+    prices = np.array([int(item.price * 100) for item in items])
+    totals = np.add.reduceat(prices[line_items] * line_qty, starts)
+    usage = np.add.reduceat(recipes[line_items] * line_qty[:, None], starts)  # orders x ingredients
+
+    statuses = pick(rng, STATUSES, n)
+    payments = pick(rng, PAYMENT_METHODS, n)
+    dining = pick(rng, DINING_OPTIONS, n)
+    days = ((times - first_day) // 86400).astype(int)
+    hours = ((times - first_day) % 86400 // 3600).astype(int)
+    shifts = days * len(SHIFT_STARTS) + np.searchsorted(SHIFT_STARTS, hours, side='right') - 1
+    cashier_ids = np.array([c.id for c in cashiers])[shifts % len(cashiers)]
+    when = [as_datetime(t) for t in times]
+    costs = {ingredient.name: ingredient.cost for ingredient in ingredients}
+    unit_costs = [item_unit_cost(item, costs) for item in items]
+
+    orders = Order.objects.bulk_create([
+        Order(created_at=when[i], total=money(totals[i]), status=statuses[i], cashier_id=int(cashier_ids[i]),
+              payment_method=payments[i], dining_option=dining[i],
+              reference_number=f'LG{chunk_start + i:010d}' if payments[i] != 'Cash' else None)
+        for i in range(n)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order_id=orders[i].id, item_id=items[line_items[j]].id, qty=int(line_qty[j]),
+                  price_at_order=items[line_items[j]].price, unit_cost=unit_costs[line_items[j]])
+        for i in range(n) for j in range(starts[i], starts[i] + line_counts[i])
+    ])
+    record_sales(
+        (items[line_items[j]].id, orders[i].business_date, int(line_qty[j]))
+        for i in np.flatnonzero(statuses == 'paid') for j in range(starts[i], starts[i] + line_counts[i])
+    )
+
+    paid = statuses != 'cancelled'  # Pending orders had their stock deducted at checkout too
+    np.add.at(daily_use, days[paid], usage[paid])
+    rows = []
+    for i, k in zip(*np.nonzero(usage * paid[:, None])):
+        ingredient = ingredients[k]
+        quantity = round(float(usage[i, k]), 6)
+        rows.append(InventoryTransaction(
+            ingredient=ingredient, ingredient_name=ingredient.name, transaction_type='STOCK_OUT',
+            quantity=-quantity, unit=ingredient.unit, cost_per_unit=ingredient.cost,
+            total_cost=(Decimal(str(quantity)) * ingredient.cost).quantize(Decimal('0.01')),
+            main_stock_after=ingredient.mainStock, stock_room_after=ingredient.stockRoom,
+            notes='Used in order (recipe)', reference=f'Order-{orders[i].id}',
+            user_id=int(cashier_ids[i]), created_at=when[i],
+        ))
+    InventoryTransaction.objects.bulk_create(rows)
+    AuditTrail.objects.bulk_create([
+        AuditTrail(user_id=int(cashier_ids[i]), action='Process Order', timestamp=when[i],
+                   description=f'Order #{order.id} processed. Total: ₱{order.total}.',
+                   category='sales', severity='medium')
+        for i, order in enumerate(orders)
+    ])
+
+    stats['orders'] += n
+    stats['order_items'] += len(line_items)
+    stats['stock_out'] += len(rows)
+    stats['audit'] += n
+
+
+def write_daily_rows(rng, starts, ingredients, cashiers, daily_use, stats):
+    """Shift logins and end-of-day spoilage (WastedLog, WASTE row and audit entry) for every day."""
+    perishable = [k for k, i in enumerate(ingredients) if i.ingredient_type == 'perishable'] \
+        or list(range(len(ingredients)))
+    logins, spoiled = [], []
+    for day, start in enumerate(starts):
+        for shift, hour in enumerate(SHIFT_STARTS):
+            cashier = cashiers[(day * len(SHIFT_STARTS) + shift) % len(cashiers)]
+            logins.append(AuditTrail(user=cashier, action='Login', category='auth', severity='low',
+                                     description=f"User '{cashier.username}' logged in",
+                                     timestamp=start + timedelta(hours=hour, minutes=-10)))
+        closer = cashiers[(day * len(SHIFT_STARTS) + len(SHIFT_STARTS) - 1) % len(cashiers)]
+        for k in perishable:
+            if daily_use[day, k] > 0 and rng.random() < SPOILAGE_CHANCE:
+                quantity = round(float(daily_use[day, k] * rng.uniform(0.01, 0.05)), 3)
+                if quantity > 0:
+                    spoiled.append((start + timedelta(hours=CLOSING_HOUR), ingredients[k], quantity, closer))
+
+    logs = WastedLog.objects.bulk_create([
+        WastedLog(ingredient=ingredient, ingredient_name=ingredient.name, quantity=quantity, unit=ingredient.unit,
+                  cost_at_waste=(Decimal(str(quantity)) * ingredient.cost).quantize(Decimal('0.01')),
+                  wasted_at=when, reason='End-of-day spoilage', user=user)
+        for when, ingredient, quantity, user in spoiled
+    ])
+    InventoryTransaction.objects.bulk_create([
+        InventoryTransaction(
+            ingredient=log.ingredient, ingredient_name=log.ingredient_name, transaction_type='WASTE',
+            quantity=-log.quantity, unit=log.unit, cost_per_unit=log.ingredient.cost, total_cost=log.cost_at_waste,
+            main_stock_after=log.ingredient.mainStock, stock_room_after=log.ingredient.stockRoom,
+            notes=f'Waste recorded: {log.reason}', reference=f'WasteLog-{log.id}', user=log.user,
+            created_at=log.wasted_at,
+        )
+        for log in logs
+    ])
+    waste_audits = [
+        AuditTrail(user=log.user, action='Record Waste', category='inventory', severity='medium',
+                   description=f"User '{log.user.username}' recorded {log.quantity}{log.unit} of "
+                               f"'{log.ingredient_name}' as waste. Reason: {log.reason}.",
+                   timestamp=log.wasted_at)
+        for log in logs
+    ]
+    AuditTrail.objects.bulk_create(logins + waste_audits)
+    stats['waste'] += len(logs)
+    stats['audit'] += len(logins) + len(waste_audits)
+
+
+def generate_load_data(orders, days=90, cashiers=5, items=0, seed=42, batch_size=DEFAULT_BATCH_SIZE,
+                       password=DEFAULT_PASSWORD, replay=False, log=print):
+    """
+    Creates the cashiers and items, then `orders` orders over the last
+    `days` whole days. Returns counts of what was written.
+
+    Ledger rows carry today's stock, as backfilled ones do. With replay,
+    the balances of the touched ingredients are recomputed at the end,
+    which rewrites every one of their rows and takes far longer than
+    generating them.
+    """
+    ingredients = list(Ingredient.objects.order_by('name'))
+    if not ingredients:
+        raise ValueError('No ingredients to build recipes from; add some first.')
+    rng = np.random.default_rng(seed)
+
+    with immediate_atomic():
+        cashier_users = ensure_cashiers(cashiers, password)
+        menu = ensure_items(items, rng, {i.name: i for i in ingredients})
+    column = {i.name: k for k, i in enumerate(ingredients)}
+    recipes = np.zeros((len(menu), len(ingredients)))  # items x ingredients, quantity per item sold
+    for row, item in enumerate(menu):
+        for line in item.recipe or []:
+            if line.get('ingredient') in column and float(line.get('quantity') or 0) > 0:
+                recipes[row, column[line['ingredient']]] += float(line['quantity'])
+    popularity = 1 / np.arange(1, len(menu) + 1) ** 0.8  # Zipf-like: a few best sellers
+    rng.shuffle(popularity)
+
+    stats = {'cashiers': len(cashier_users), 'items': len(menu), 'orders': 0, 'order_items': 0,
+             'stock_out': 0, 'waste': 0, 'audit': 0, 'popularity': popularity / popularity.sum()}
+    starts = day_starts(days)
+    times = order_times(rng, orders, starts)
+    first_day = starts[0].timestamp()
+    daily_use = np.zeros((days, len(ingredients)))
+
+    with explicit_timestamps():
+        for chunk_start in range(0, len(times), batch_size):
+            with immediate_atomic():
+                write_orders(rng, times[chunk_start:chunk_start + batch_size], chunk_start, first_day, menu,
+                             recipes, ingredients, cashier_users, stats, daily_use)
+            log(f"  {stats['orders']:,}/{orders:,} orders")
+        with immediate_atomic():
+            write_daily_rows(rng, starts, ingredients, cashier_users, daily_use, stats)
+
+    if replay:
+        used = [i.id for k, i in enumerate(ingredients) if daily_use[:, k].any()]
+        replay_ledger(Ingredient.objects.filter(id__in=used))
+    del stats['popularity']
+    return stats
+
+
+def delete_load_data():
+    """Deletes the orders, ledger, waste and audit rows of the load-test cashiers. Returns rows deleted."""
+    users = User.objects.filter(username__startswith=CASHIER_PREFIX)
+    deleted = 0
+    for model, field in ((Order, 'cashier'), (InventoryTransaction, 'user'), (WastedLog, 'user'),
+                         (AuditTrail, 'user')):
+        deleted += model.objects.filter(**{f'{field}__in': users}).delete()[0]
+    rebuild_item_sales()
+    return deleted
@@ -0,0 +1,30 @@
+"""
+Django management command to fill in the unit cost of past order lines
+Orders placed before unit costs were stored have none, so margin reports
+leave them out; this prices each line's recipe at the ingredient costs its
+order's ledger rows recorded (or the current ones) and stores the result
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.margins import BACKFILL_BATCH_SIZE, backfill_unit_costs
+
+
+class Command(BaseCommand):
+    help = 'Store the cost of goods of order lines that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Recompute lines that already have a unit cost')
+        parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE, help='Orders costed per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        self.stdout.write(self.style.WARNING('Costing order lines...'))
+        stats = backfill_unit_costs(force=options['force'], batch_size=options['batch_size'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {stats['costed']:,} lines costed ({stats['from_ledger']:,} ingredient prices from the ledger)"
+        ))
+        if stats['uncosted']:
+            self.stdout.write(f"  {stats['uncosted']:,} lines have no recipe to cost and were left empty")
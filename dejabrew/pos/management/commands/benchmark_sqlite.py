@@ -0,0 +1,192 @@
+"""
+Django management command to benchmark SQLite under concurrent checkouts
+Runs writer processes doing process_order-style transactions alongside
+reader processes doing dashboard-style queries, once per connection profile,
+each against its own copy of the database, and reports throughput, latency
+and "database is locked" errors
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from dejabrew.sqlite_backend import DEFAULT_PRAGMAS, immediate_atomic
+from pos.models import AuditTrail, Ingredient, InventoryTransaction, Item, Order, OrderItem
+
+# name -> (OPTIONS for the connection, transaction used for writes)
+PROFILES = {
+    # What plain django.db.backends.sqlite3 does: rollback journal,
+    # Python's 5s busy timeout, deferred BEGIN
+    'baseline': ({'pragmas': {name: None for name in DEFAULT_PRAGMAS} | {'journal_mode': 'DELETE'}},
+                 transaction.atomic),
+    'tuned': ({}, immediate_atomic),
+}
+
+
+def checkout(items, cashier_id):
+    """The write pattern of process_order: read stock, then write the order and deduct it."""
+    item = random.choice(items)
+    qty = random.randint(1, 3)
+    ingredients = []
+    for line in item.recipe:
+        ingredient = Ingredient.objects.get(name=line['ingredient'])
+        ingredients.append((ingredient, float(line['quantity']) * qty))
+
+    order = Order.objects.create(total=item.price * qty, status='paid', cashier_id=cashier_id)
+    OrderItem.objects.create(order=order, item=item, qty=qty, price_at_order=item.price)
+    for ingredient, deduct in ingredients:
+        ingredient.mainStock -= deduct
+        ingredient.save(update_fields=['mainStock'])
+        InventoryTransaction.objects.create(
+            ingredient=ingredient, ingredient_name=ingredient.name, transaction_type='STOCK_OUT',
+            quantity=-deduct, unit=ingredient.unit, main_stock_after=ingredient.mainStock,
+            stock_room_after=ingredient.stockRoom, reference=f'Order-{order.id}', user_id=cashier_id,
+        )
+    AuditTrail.objects.create(user_id=cashier_id, action='Process Order',
+                              description=f'Order #{order.id} processed (benchmark)', category='sales')
+
+
+def dashboard_read():
+    """What the dashboard and recent-orders polling read."""
+    since = timezone.now() - timedelta(days=30)
+    Order.objects.filter(status='paid', created_at__gte=since).aggregate(total=Sum('total'), count=Count('id'))
+    list(Order.objects.order_by('-created_at').prefetch_related('items__item')[:20])
+
+
+def worker(role, db_path, options, use_immediate, deadline, seed, results):
+    random.seed(seed)
+    connection = connections['default']
+    connection.settings_dict['NAME'] = db_path
+    connection.settings_dict['OPTIONS'] = options
+    atomic = immediate_atomic if use_immediate else transaction.atomic
+
+    items = [i for i in Item.objects.filter(is_active=True)
+             if isinstance(i.recipe, list) and i.recipe
+             and all(line.get('ingredient') and line.get('quantity', 0) > 0 for line in i.recipe)]
+    cashier_id = None
+
+    latencies, locked, other_errors = [], 0, 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            if role == 'write':
+                with atomic():
+                    checkout(items, cashier_id)
+            else:
+                dashboard_read()
+            latencies.append((time.perf_counter() - start) * 1000)
+        except OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                locked += 1
+            else:
+                other_errors += 1
+        except Ingredient.DoesNotExist:
+            other_errors += 1
+    connection.close()
+    results.put({'role': role, 'latencies': latencies, 'locked': locked, 'errors': other_errors})
+
+
+class Command(BaseCommand):
+    help = ('Benchmark concurrent process_order-style writes and dashboard reads on copies '
+            'of the SQLite database, comparing connection profiles')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--profile', action='append', choices=list(PROFILES),
+                            help='Profiles to run (default: all)')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        source = str(settings.DATABASES['default']['NAME'])
+        if settings.DATABASES['default']['ENGINE'] != 'dejabrew.sqlite_backend' or not os.path.exists(source):
+            raise CommandError('This benchmark needs the dejabrew.sqlite_backend engine and an on-disk database.')
+        if not Item.objects.filter(is_active=True).exclude(recipe=[]).exists():
+            raise CommandError('Need at least one active item with a recipe (load pos/fixtures/sample_items.json).')
+
+        report = {}
+        tmp_dir = tempfile.mkdtemp(prefix='dejabrew-sqlite-bench-')
+        try:
+            for name in options['profile'] or list(PROFILES):
+                db_path = os.path.join(tmp_dir, f'{name}.sqlite3')
+                self.copy_database(source, db_path)
+                report[name] = self.run_profile(name, db_path, options)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.stdout.write(f"\n{options['writers']} writers + {options['readers']} readers, "
+                          f"{options['seconds']:.0f}s per profile\n")
+        self.stdout.write(f"{'profile':<10} {'writes/s':>9} {'w p50':>7} {'w p95':>7} {'w p99':>8} "
+                          f"{'locked':>7} {'reads/s':>9} {'r p95':>7} {'r p99':>8}")
+        for name, r in report.items():
+            w, rd = r['write'], r['read']
+            self.stdout.write(
+                f"{name:<10} {w['per_second']:>9.1f} {w['p50_ms']:>7.1f} {w['p95_ms']:>7.1f} {w['p99_ms']:>8.1f} "
+                f"{w['locked'] + rd['locked']:>7} {rd['per_second']:>9.1f} {rd['p95_ms']:>7.1f} {rd['p99_ms']:>8.1f}"
+            )
+        self.stdout.write('(latencies in ms; locked = "database is locked" errors)')
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"\n✓ Results saved to: {options['json_path']}")
+
+    @staticmethod
+    def copy_database(source, target):
+        # The backup API gives a consistent copy even if the source is in WAL mode
+        src, dst = sqlite3.connect(source), sqlite3.connect(target)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+
+    def run_profile(self, name, db_path, options):
+        db_options, atomic = PROFILES[name]
+        self.stdout.write(f"Running '{name}' profile...")
+        connections.close_all()  # Never share a connection with forked workers
+
+        ctx = multiprocessing.get_context('fork')
+        results = ctx.Queue()
+        deadline = time.time() + options['seconds']
+        roles = ['write'] * options['writers'] + ['read'] * options['readers']
+        processes = [
+            ctx.Process(target=worker, args=(role, db_path, db_options, atomic is immediate_atomic,
+                                             deadline, seed, results))
+            for seed, role in enumerate(roles)
+        ]
+        for p in processes:
+            p.start()
+        collected = [results.get() for _ in processes]
+        for p in processes:
+            p.join()
+
+        summary = {}
+        for role in ('write', 'read'):
+            rows = [r for r in collected if r['role'] == role]
+            latencies = np.array([ms for r in rows for ms in r['latencies']] or [0.0])
+            done = sum(len(r['latencies']) for r in rows)
+            summary[role] = {
+                'completed': done,
+                'per_second': done / options['seconds'],
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'p99_ms': float(np.percentile(latencies, 99)),
+                'locked': sum(r['locked'] for r in rows),
+                'errors': sum(r['errors'] for r in rows),
+            }
+        return summary
@@ -0,0 +1,54 @@
+"""
+Django management command to build the WebP derivatives of existing product images
+Items uploaded before the image pipeline point at full-size originals; this
+writes their thumbnail and detail derivatives and repoints image_url and
+thumbnail_url at them (the originals are left on disk)
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from pos.models import Item
+from pos.product_images import HASHED_URL, ProductImageError, local_path, save_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Write thumbnail and detail derivatives for product images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild items that already have derivatives (from their detail image)')
+        parser.add_argument('--dry-run', action='store_true', help='List the items that would be converted')
+
+    def handle(self, *args, **options):
+        converted = skipped = failed = 0
+        before = after = 0
+        for item in Item.objects.exclude(image_url='').order_by('id'):
+            done = item.thumbnail_url and HASHED_URL.match(item.image_url or '')
+            path = local_path(item.image_url)
+            if (done and not options['force']) or path is None or not os.path.exists(path):
+                skipped += 1
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'  {item.name}: {item.image_url}')
+                converted += 1
+                continue
+
+            try:
+                urls = save_derivatives(path, path if not done else item.image_url.rsplit('.', 2)[0])
+            except ProductImageError as e:
+                self.stdout.write(self.style.WARNING(f'  {item.name}: {e}'))
+                failed += 1
+                continue
+            before += os.path.getsize(path)
+            after += os.path.getsize(local_path(urls['thumbnail_url']))
+            Item.objects.filter(id=item.id).update(**urls)
+            converted += 1
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'✓ {converted} items would be converted ({skipped} skipped)'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'✓ {converted} items converted ({skipped} skipped, {failed} failed)'))
+        if converted:
+            self.stdout.write(f'  POS tiles now load {after / 1024:,.0f} KB instead of {before / 1024:,.0f} KB')
@@ -0,0 +1,62 @@
+"""
+Django management command to generate synthetic load data for benchmarks
+Creates load-test cashiers, menu items from pos/fixtures/sample_items.json
+with recipes on the existing ingredients, and a seeded, seasonal history of
+orders with their ledger, waste and audit rows (see pos/load_data.py)
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.load_data import (CASHIER_PREFIX, DEFAULT_BATCH_SIZE, DEFAULT_PASSWORD, delete_load_data,
+                           generate_load_data)
+
+
+class Command(BaseCommand):
+    help = 'Generate cashiers, items and a seasonal order history (with ledger, waste and audit rows) for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000, help='Orders to generate')
+        parser.add_argument('--days', type=int, default=90, help='Whole days of history, ending yesterday')
+        parser.add_argument('--cashiers', type=int, default=5)
+        parser.add_argument('--items', type=int, default=0,
+                            help='Menu size; the fixture items plus variants of them (default: just the fixture)')
+        parser.add_argument('--seed', type=int, default=42, help='Same seed and starting data, same rows')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Orders written per transaction')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Password of newly created cashiers')
+        parser.add_argument('--replay', action='store_true',
+                            help='Recompute the ledger balances afterwards (slow; replay_ledger does the same)')
+        parser.add_argument('--clear', action='store_true',
+                            help=f'First delete what earlier runs generated (rows of the {CASHIER_PREFIX}* users)')
+
+    def handle(self, *args, **options):
+        if options['orders'] < 0 or options['days'] < 1 or options['cashiers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--orders must be >= 0; --days, --cashiers and --batch-size >= 1.')
+
+        if options['clear']:
+            self.stdout.write(self.style.WARNING('Deleting earlier load data...'))
+            self.stdout.write(self.style.SUCCESS(f'✓ Deleted {delete_load_data():,} rows'))
+
+        self.stdout.write(self.style.WARNING(
+            f"Generating {options['orders']:,} orders over {options['days']} days (seed {options['seed']})..."
+        ))
+        start = time.perf_counter()
+        try:
+            stats = generate_load_data(
+                orders=options['orders'], days=options['days'], cashiers=options['cashiers'],
+                items=options['items'], seed=options['seed'], batch_size=options['batch_size'],
+                password=options['password'], replay=options['replay'], log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(f"✓ {stats['cashiers']} cashiers, {stats['items']} items"))
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {stats['orders']:,} orders with {stats['order_items']:,} lines "
+            f"({stats['orders'] / max(elapsed, 1e-9):,.0f} orders/s)"
+        ))
+        self.stdout.write(self.style.SUCCESS(f"✓ {stats['stock_out']:,} STOCK_OUT and {stats['waste']:,} waste rows"))
+        self.stdout.write(self.style.SUCCESS(f"✓ {stats['audit']:,} audit entries"))
+        self.stdout.write(f'Done in {elapsed:.1f}s')
@@ -0,0 +1,62 @@
+"""
+Django management command to import historical orders from a CSV or JSONL file
+Streams the file, resolves items by name or id, and bulk-inserts Orders and
+OrderItems with their original timestamps, optionally with the STOCK_OUT
+ledger rows of their recipes (see pos/order_import.py for the file format)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.order_import import DEFAULT_BATCH_SIZE, DEFAULT_SOURCE, import_orders
+
+
+class Command(BaseCommand):
+    help = 'Import historical orders and their lines from a CSV (one row per line) or JSONL (one order per line) file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Default: from the file extension')
+        parser.add_argument('--source', default=DEFAULT_SOURCE,
+                            help='Name of the system the orders come from; re-importing the same '
+                                 'source skips orders already imported')
+        parser.add_argument('--date-format',
+                            help='strptime format of created_at, e.g. "%%m/%%d/%%Y %%H:%%M" (default: ISO 8601)')
+        parser.add_argument('--ledger', action='store_true',
+                            help='Also write the STOCK_OUT ledger rows of the imported orders')
+        parser.add_argument('--replay', action='store_true',
+                            help='With --ledger, recompute the ledger balances afterwards (slow)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Orders written per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['replay'] and not options['ledger']:
+            raise CommandError('--replay only applies with --ledger.')
+
+        self.stdout.write(self.style.WARNING(f"Importing orders from {options['path']}..."))
+        try:
+            stats = import_orders(
+                options['path'], fmt=options['format'], source=options['source'],
+                batch_size=options['batch_size'], ledger=options['ledger'], replay=options['replay'],
+                date_format=options['date_format'], log=self.stdout.write,
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in stats['errors'][:20]:
+            self.stdout.write(self.style.WARNING(f'  {error}'))
+        if stats['failed'] > 20:
+            self.stdout.write(self.style.WARNING(f"  ... and {stats['failed'] - 20:,} more"))
+
+        elapsed = stats['elapsed_seconds']
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {stats['orders']:,} orders with {stats['order_items']:,} lines "
+            f"({stats['orders'] / max(elapsed, 1e-9):,.0f} orders/s)"
+        ))
+        if options['ledger']:
+            self.stdout.write(self.style.SUCCESS(f"✓ {stats['stock_out']:,} STOCK_OUT rows"))
+        if stats['skipped']:
+            self.stdout.write(f"  {stats['skipped']:,} orders were already imported and were skipped")
+        if stats['failed']:
+            self.stdout.write(self.style.WARNING(f"  {stats['failed']:,} orders could not be imported"))
+        self.stdout.write(f'Done in {elapsed:.1f}s')
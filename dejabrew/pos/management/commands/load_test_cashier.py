@@ -0,0 +1,242 @@
+"""
+Django management command to load test a running server with K cashier terminals
+Each terminal is a process that logs in like a cashier, makes the calls
+cashier-pos.js makes when the page loads, then posts carts to process-order,
+now and then voiding a line with admin credentials, until time runs out.
+Reports throughput, latency percentiles and error / "database is locked"
+rates per endpoint, for one or more terminal counts (to size gunicorn workers)
+"""
+
+import http.cookiejar
+import json
+import multiprocessing
+import random
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.load_data import CASHIER_PREFIX, DEFAULT_PASSWORD
+
+BOOTSTRAP = ('/api/ingredients/', '/api/products/', '/api/recent-orders/')
+PAYMENT_METHODS = (('Cash', 0.6), ('GCash', 0.3), ('Card', 0.1))
+
+
+class Terminal:
+    """One cashier's browser: a cookie jar, the CSRF token, and the timings of its requests."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(NoRedirect, urllib.request.HTTPCookieProcessor(self.cookies))
+        self.samples = {}  # endpoint -> [(ms, ok, locked), ...]
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def request(self, endpoint, method='GET', data=None, form=None, path=None):
+        """Sends one request and records it under `endpoint`. Returns (status, body bytes)."""
+        headers = {'X-CSRFToken': self.csrf_token(), 'Referer': self.base_url + '/cashier/'}
+        body = None
+        if data is not None:
+            body, headers['Content-Type'] = json.dumps(data).encode(), 'application/json'
+        elif form is not None:
+            body, headers['Content-Type'] = urllib.parse.urlencode(form).encode(), 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + (path or endpoint), data=body, headers=headers, method=method)
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            status, content = 0, str(e).encode()
+        ms = (time.perf_counter() - start) * 1000
+
+        ok = 200 <= status < 400
+        if ok and content[:1] == b'{':
+            try:
+                ok = json.loads(content).get('success', True) is not False
+            except ValueError:
+                ok = False
+        locked = b'database is locked' in content or b'database table is locked' in content
+        self.samples.setdefault(endpoint, []).append((ms, ok, locked))
+        return status, content
+
+    def login(self, username, password):
+        self.request('/login/ (form)', path='/login/')
+        status, _ = self.request('/login/', 'POST', form={
+            'username': username, 'password': password, 'csrfmiddlewaretoken': self.csrf_token(),
+        })
+        return status == 302  # A failed login re-renders the form with 200
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Lets a 302 come back as the response, so each request is timed on its own."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def pick(choices):
+    values, weights = zip(*choices)
+    return random.choices(values, weights)[0]
+
+
+def terminal(number, options, deadline, results):
+    random.seed(options['seed'] * 1000 + number)
+    t = Terminal(options['url'], options['timeout'])
+    username = options['username'].format(n=number % options['accounts'] + 1)
+    if not t.login(username, options['password']):
+        results.put({'terminal': number, 'samples': t.samples, 'orders': 0, 'failed': f'login as {username} failed'})
+        return
+
+    t.request('/cashier/')
+    products = []
+    for endpoint in BOOTSTRAP:
+        status, content = t.request(endpoint)
+        if endpoint == '/api/products/' and status == 200:
+            products = [p for p in json.loads(content).get('products', [])
+                        if p.get('status') in ('available', 'in stock', 'low stock')]
+    if not products:
+        results.put({'terminal': number, 'samples': t.samples, 'orders': 0, 'failed': 'no sellable products'})
+        return
+
+    orders = 0
+    while time.time() < deadline:
+        cart = random.sample(products, min(len(products), random.choice((1, 1, 2, 2, 3, 4))))
+        items = [{'id': p['id'], 'quantity': random.choice((1, 1, 1, 2, 3)), 'price': float(p['price'])}
+                 for p in cart]
+
+        if options['admin_username'] and random.random() < options['void_rate']:
+            # cashier-pos.js voidItem(): verify the admin, log the void, drop the line
+            t.request('/api/verify-admin/', 'POST', {'username': options['admin_username'],
+                                                     'password': options['admin_password']})
+            voided = items[-1]
+            t.request('/api/log-void-action/', 'POST', {
+                'item_id': voided['id'], 'item_name': cart[-1].get('name', ''), 'item_price': voided['price'],
+                'quantity': voided['quantity'], 'terminal': f'Load test {number}',
+                'admin_username': options['admin_username'], 'admin_password': options['admin_password'],
+            })
+            if len(items) > 1:
+                items.pop()
+
+        t.request('/api/process-order/', 'POST', {
+            'items': items, 'total': sum(i['price'] * i['quantity'] for i in items), 'discount': 0,
+            'discount_type': 'custom', 'discount_id': '', 'payment_method': pick(PAYMENT_METHODS),
+            'dining_option': random.choice(('dine-in', 'take-out')), 'customer_name': 'Walk-in',
+            'payment_details': {},
+        })
+        orders += t.samples['/api/process-order/'][-1][1]
+        if random.random() < options['refresh_rate']:
+            t.request('/api/recent-orders/')
+        if options['think']:
+            time.sleep(random.expovariate(1 / options['think']))
+    results.put({'terminal': number, 'samples': t.samples, 'orders': orders, 'failed': None})
+
+
+class Command(BaseCommand):
+    help = ('Simulate concurrent cashier terminals against a running server and report throughput, '
+            'latency percentiles and error / lock rates per endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server to test')
+        parser.add_argument('--terminals', type=int, action='append',
+                            help='Concurrent terminals; repeat to compare several counts (default: 4)')
+        parser.add_argument('--seconds', type=float, default=30, help='Duration of each run')
+        parser.add_argument('--username', default=CASHIER_PREFIX + '{n}',
+                            help='Cashier login; {n} is 1..--accounts (default: the generate_load_data cashiers)')
+        parser.add_argument('--accounts', type=int, default=5, help='Distinct cashier logins to spread terminals over')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument('--admin-username', help='Admin who approves voids (no voids without one)')
+        parser.add_argument('--admin-password', default='')
+        parser.add_argument('--void-rate', type=float, default=0.05, help='Share of carts with a voided line')
+        parser.add_argument('--refresh-rate', type=float, default=0.2,
+                            help='Share of orders followed by a recent-orders refresh')
+        parser.add_argument('--think', type=float, default=0,
+                            help='Mean seconds a cashier waits between orders (0: as fast as the server allows)')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as failed')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        counts = options['terminals'] or [4]
+        if min(counts) < 1 or options['accounts'] < 1:
+            raise CommandError('--terminals and --accounts must be at least 1.')
+        if options['admin_username'] is None:
+            self.stdout.write(self.style.WARNING('No --admin-username given; terminals will not void.'))
+
+        report = {}
+        for count in counts:
+            self.stdout.write(f"Running {count} terminal(s) against {options['url']} for {options['seconds']:.0f}s...")
+            report[count] = self.run(count, options)
+            self.print_run(count, report[count])
+
+        if len(counts) > 1:
+            self.stdout.write(f"\n{'terminals':>9} {'orders/s':>9} {'order p95':>10} {'order p99':>10} {'errors':>7}")
+            for count, r in report.items():
+                order = r['endpoints'].get('/api/process-order/', {})
+                self.stdout.write(f"{count:>9} {r['orders_per_second']:>9.1f} {order.get('p95_ms', 0):>10.1f} "
+                                  f"{order.get('p99_ms', 0):>10.1f} {order.get('error_rate', 0):>7.1%}")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"\n✓ Results saved to: {options['json_path']}")
+
+    def run(self, count, options):
+        ctx = multiprocessing.get_context('fork')
+        results = ctx.Queue()
+        deadline = time.time() + options['seconds']
+        processes = [ctx.Process(target=terminal, args=(n, options, deadline, results)) for n in range(count)]
+        for p in processes:
+            p.start()
+        collected = [results.get() for _ in processes]
+        for p in processes:
+            p.join()
+
+        failed = [f"terminal {r['terminal']}: {r['failed']}" for r in collected if r['failed']]
+        if len(failed) == count:
+            raise CommandError('Every terminal failed: ' + '; '.join(failed[:5]))
+
+        endpoints = {}
+        names = sorted({name for r in collected for name in r['samples']})
+        for name in names:
+            rows = [s for r in collected for s in r['samples'].get(name, [])]
+            ms = np.array([row[0] for row in rows])
+            endpoints[name] = {
+                'requests': len(rows),
+                'per_second': len(rows) / options['seconds'],
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p95_ms': float(np.percentile(ms, 95)),
+                'p99_ms': float(np.percentile(ms, 99)),
+                'error_rate': sum(not row[1] for row in rows) / len(rows),
+                'lock_rate': sum(row[2] for row in rows) / len(rows),
+            }
+        return {
+            'terminals': count,
+            'orders': sum(r['orders'] for r in collected),
+            'orders_per_second': sum(r['orders'] for r in collected) / options['seconds'],
+            'failed_terminals': failed,
+            'endpoints': endpoints,
+        }
+
+    def print_run(self, count, r):
+        for message in r['failed_terminals']:
+            self.stdout.write(self.style.WARNING(f'  {message}'))
+        self.stdout.write(f"\n{'endpoint':<24} {'requests':>8} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>8} "
+                          f"{'errors':>7} {'locked':>7}")
+        for name, e in r['endpoints'].items():
+            self.stdout.write(
+                f"{name:<24} {e['requests']:>8} {e['per_second']:>7.1f} {e['p50_ms']:>7.1f} {e['p95_ms']:>7.1f} "
+                f"{e['p99_ms']:>8.1f} {e['error_rate']:>7.1%} {e['lock_rate']:>7.1%}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {count} terminal(s): {r['orders']} orders, {r['orders_per_second']:.1f} orders/s"
+        ))
+        self.stdout.write('(latencies in ms; locked = "database is locked" responses)\n')
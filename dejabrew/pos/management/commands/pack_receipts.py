@@ -0,0 +1,40 @@
+"""
+Django management command to pack the flat receipt files into the receipt archive
+Moves pos/static/pos/receipt/receipt_order_<id>_<timestamp>.html into the daily
+compressed segments of pos/receipt_archive.py and indexes them by order, so
+/api/order/<id>/receipt/ serves them; safe to run again
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.receipt_archive import PACK_BATCH_SIZE, legacy_dir, pack_legacy_receipts
+
+
+class Command(BaseCommand):
+    help = 'Pack the per-order receipt HTML files into the compressed, date-sharded receipt archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help='Remove the flat files of orders whose receipt is in the archive')
+        parser.add_argument('--batch-size', type=int, default=PACK_BATCH_SIZE, help='Receipts packed per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        self.stdout.write(self.style.WARNING(f'Packing receipts from {legacy_dir()}...'))
+        stats = pack_legacy_receipts(delete=options['delete'], batch_size=options['batch_size'],
+                                     log=self.stdout.write)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {stats['packed']:,} receipts packed: {stats['bytes_before'] / 1024:,.0f} KB "
+            f"→ {stats['bytes_after'] / 1024:,.0f} KB"
+        ))
+        if stats['already_archived']:
+            self.stdout.write(f"  {stats['already_archived']:,} orders were already archived")
+        if stats['missing_orders']:
+            self.stdout.write(self.style.WARNING(
+                f"  {stats['missing_orders']:,} files belong to orders that no longer exist and were left in place"
+            ))
+        if options['delete']:
+            self.stdout.write(self.style.SUCCESS(f"✓ {stats['deleted']:,} flat files removed"))
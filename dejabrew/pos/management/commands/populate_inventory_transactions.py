@@ -3,153 +3,97 @@ Django management command to populate InventoryTransaction table from historical
 Backfills data from existing orders and waste logs
 """
 
+import os
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from pos.models import Order, OrderItem, WastedLog, InventoryTransaction, Ingredient
-from decimal import Decimal
-from django.utils import timezone
+from pos.models import InventoryTransaction
+from pos.inventory_backfill import DEFAULT_BATCH_SIZE, backfill_inventory_transactions, load_checkpoint
+from pos.ledger import replay_ledger
+
+DEFAULT_CHECKPOINT = os.path.join(settings.BASE_DIR, 'populate_inventory_checkpoint.json')
 
 
 class Command(BaseCommand):
     help = 'Populate InventoryTransaction table from historical orders and waste logs'
+    # Callable(done, total) supplied by forecasting.jobs when run in the background
+    stealth_options = ('progress',)
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--clear',
             action='store_true',
-            help='Clear existing transactions before populating',
+            help='Clear existing transactions (and any checkpoint) before populating',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Rows written per bulk insert',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=DEFAULT_CHECKPOINT,
+            help='Progress file used to resume an interrupted run; removed when the run completes',
         )
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.WARNING('Starting inventory transaction population...'))
+        checkpoint_path = options['checkpoint']
 
         if options['clear']:
             self.stdout.write(self.style.WARNING('Clearing existing transactions...'))
             InventoryTransaction.objects.all().delete()
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
             self.stdout.write(self.style.SUCCESS('Existing transactions cleared'))
 
-        # Counter for statistics
-        stock_out_count = 0
-        waste_count = 0
-        errors = 0
-
-        # Process historical orders for STOCK_OUT transactions
-        self.stdout.write('\n' + self.style.WARNING('Processing orders for ingredient usage...'))
-
-        orders = Order.objects.filter(status='paid').prefetch_related('items__item').order_by('created_at')
-
-        for order in orders:
-            try:
-                with transaction.atomic():
-                    for order_item in order.items.all():
-                        item = order_item.item
-
-                        # Check if item has a recipe
-                        if isinstance(item.recipe, list) and len(item.recipe) > 0:
-                            for recipe_ingredient in item.recipe:
-                                ingredient_name = recipe_ingredient.get('ingredient')
-                                quantity_per_item = recipe_ingredient.get('quantity', 0)
-
-                                if ingredient_name and quantity_per_item > 0:
-                                    try:
-                                        ingredient = Ingredient.objects.get(name=ingredient_name)
-
-                                        total_quantity = float(quantity_per_item) * order_item.qty
-
-                                        # Create STOCK_OUT transaction
-                                        InventoryTransaction.objects.create(
-                                            ingredient=ingredient,
-                                            ingredient_name=ingredient.name,
-                                            transaction_type='STOCK_OUT',
-                                            quantity=-total_quantity,  # Negative for stock out
-                                            unit=ingredient.unit,
-                                            cost_per_unit=ingredient.cost,
-                                            total_cost=Decimal(str(total_quantity)) * ingredient.cost,
-                                            main_stock_after=ingredient.mainStock,
-                                            stock_room_after=ingredient.stockRoom,
-                                            notes=f"Used in order (recipe for {item.name})",
-                                            reference=f"Order-{order.id}",
-                                            user=order.cashier,
-                                            created_at=order.created_at
-                                        )
-
-                                        stock_out_count += 1
+        checkpoint = load_checkpoint(checkpoint_path)
+        if checkpoint:
+            self.stdout.write(self.style.WARNING(
+                f"Resuming from checkpoint: orders after id {checkpoint.get('orders', 0)}, "
+                f"waste logs after id {checkpoint.get('waste', 0)} "
+                f"({checkpoint.get('rows', 0)} rows already written)"
+            ))
+
+        stats = backfill_inventory_transactions(
+            batch_size=options['batch_size'],
+            checkpoint_path=checkpoint_path,
+            progress=options.get('progress'),
+            log=self.stdout.write,
+        )
 
-                                    except Ingredient.DoesNotExist:
-                                        self.stdout.write(
-                                            self.style.WARNING(
-                                                f'  Ingredient "{ingredient_name}" not found for order {order.id}'
-                                            )
-                                        )
-                                        errors += 1
-                                        continue
+        # Backfilled rows carry today's stock; replay gives them their historical balances
+        self.stdout.write('\n' + self.style.WARNING('Replaying ledger balances...'))
+        ledger = replay_ledger()
+        corrected = sum(r['corrected'] for r in ledger)
+        negative = sum(1 for r in ledger if r['negative'])
 
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'  Error processing order {order.id}: {str(e)}')
-                )
-                errors += 1
+        for error in stats['errors'][:20]:
+            self.stdout.write(self.style.WARNING(f'  {error}'))
 
         self.stdout.write(
-            self.style.SUCCESS(f'✓ Created {stock_out_count} STOCK_OUT transactions from orders')
+            self.style.SUCCESS(f"✓ Created {stats['stock_out']} STOCK_OUT transactions from orders")
         )
-
-        # Process waste logs for WASTE transactions
-        self.stdout.write('\n' + self.style.WARNING('Processing waste logs...'))
-
-        waste_logs = WastedLog.objects.all().order_by('wasted_at')
-
-        for waste_log in waste_logs:
-            try:
-                with transaction.atomic():
-                    # Get current ingredient or use preserved name
-                    ingredient = waste_log.ingredient
-
-                    if ingredient:
-                        # Create WASTE transaction
-                        InventoryTransaction.objects.create(
-                            ingredient=ingredient,
-                            ingredient_name=waste_log.ingredient_name,
-                            transaction_type='WASTE',
-                            quantity=-waste_log.quantity,  # Negative for waste
-                            unit=waste_log.unit,
-                            cost_per_unit=waste_log.cost_at_waste / Decimal(str(waste_log.quantity)) if waste_log.quantity > 0 else Decimal('0'),
-                            total_cost=waste_log.cost_at_waste,
-                            main_stock_after=ingredient.mainStock,
-                            stock_room_after=ingredient.stockRoom,
-                            notes=f"Waste recorded: {waste_log.reason}",
-                            reference=f"WasteLog-{waste_log.id}",
-                            user=waste_log.user,
-                            created_at=waste_log.wasted_at
-                        )
-
-                        waste_count += 1
-                    else:
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f'  Ingredient for waste log {waste_log.id} no longer exists'
-                            )
-                        )
-                        errors += 1
-
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'  Error processing waste log {waste_log.id}: {str(e)}')
-                )
-                errors += 1
-
         self.stdout.write(
-            self.style.SUCCESS(f'✓ Created {waste_count} WASTE transactions from waste logs')
+            self.style.SUCCESS(f"✓ Created {stats['waste']} WASTE transactions from waste logs")
         )
 
         # Summary
         self.stdout.write('\n' + '=' * 70)
         self.stdout.write(self.style.SUCCESS('SUMMARY:'))
-        self.stdout.write(f'  Stock Out Transactions: {stock_out_count}')
-        self.stdout.write(f'  Waste Transactions: {waste_count}')
-        self.stdout.write(f'  Total Transactions Created: {stock_out_count + waste_count}')
-        if errors > 0:
-            self.stdout.write(self.style.WARNING(f'  Errors: {errors}'))
+        self.stdout.write(f"  Stock Out Transactions: {stats['stock_out']}")
+        self.stdout.write(f"  Waste Transactions: {stats['waste']}")
+        self.stdout.write(f"  Total Transactions Created: {stats['stock_out'] + stats['waste']}")
+        self.stdout.write(f"  Throughput: {stats['rows_per_second']:,.0f} rows/sec "
+                          f"({stats['elapsed_seconds']:.2f}s)")
+        self.stdout.write(f"  Ledger Balances Corrected: {corrected}")
+        if negative:
+            self.stdout.write(self.style.WARNING(
+                f"  Ingredients with negative balances: {negative} (see: manage.py replay_ledger --check)"
+            ))
+        if stats['error_count']:
+            self.stdout.write(self.style.WARNING(f"  Errors: {stats['error_count']}"))
         self.stdout.write('=' * 70)
 
         self.stdout.write('\n' + self.style.SUCCESS('✓ Inventory transaction population complete!'))
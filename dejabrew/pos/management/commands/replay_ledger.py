@@ -0,0 +1,75 @@
+"""
+Django management command to recompute InventoryTransaction running balances
+Replays each ingredient's ledger back from its current stock and reports
+the points where the balance went negative
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from pos.models import Ingredient
+from pos.ledger import replay_ledger
+
+
+class Command(BaseCommand):
+    help = 'Recompute main_stock_after / stock_room_after for the inventory ledger and flag negative balances'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredient',
+            action='append',
+            help='Only replay this ingredient (by name); can be repeated',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Consistency check only: report wrong and negative balances without writing',
+        )
+        parser.add_argument(
+            '--json',
+            dest='json_path',
+            help='Also write the per-ingredient results to this JSON file',
+        )
+
+    def handle(self, *args, **options):
+        ingredients = Ingredient.objects.all()
+        if options['ingredient']:
+            ingredients = ingredients.filter(name__in=options['ingredient'])
+            missing = set(options['ingredient']) - set(ingredients.values_list('name', flat=True))
+            if missing:
+                raise CommandError(f"Unknown ingredient(s): {', '.join(sorted(missing))}")
+
+        write = not options['check']
+        self.stdout.write(self.style.WARNING(
+            'Checking inventory ledger...' if not write else 'Replaying inventory ledger...'
+        ))
+
+        start = time.perf_counter()
+        results = replay_ledger(ingredients, write=write)
+        elapsed = time.perf_counter() - start
+
+        total_rows = sum(r['rows'] for r in results)
+        corrected = sum(r['corrected'] for r in results)
+        negative = [r for r in results if r['negative']]
+
+        for result in negative:
+            first = result['negative'][0]
+            self.stdout.write(self.style.ERROR(
+                f"  ⚠️ {result['ingredient']}: balance negative at {len(result['negative'])} rows, "
+                f"first {first['created_at']} ({first['type']} {first['reference']}) "
+                f"main={first['main_stock_after']} room={first['stock_room_after']}"
+            ))
+
+        self.stdout.write('\n' + '=' * 70)
+        self.stdout.write(self.style.SUCCESS('SUMMARY:'))
+        self.stdout.write(f'  Ingredients: {len(results)}')
+        self.stdout.write(f'  Transactions replayed: {total_rows} ({elapsed:.2f}s)')
+        self.stdout.write(f"  Balances {'corrected' if write else 'wrong'}: {corrected}")
+        self.stdout.write(f'  Ingredients with negative balances: {len(negative)}')
+        self.stdout.write('=' * 70)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"\n✓ Results saved to: {options['json_path']}")
@@ -0,0 +1,41 @@
+"""
+Django management command to write an inventory snapshot
+Run it nightly (e.g. from cron) so point-in-time stock queries only replay
+one day of ledger; --date backfills snapshots for past dates such as month ends
+"""
+
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from pos.ledger import take_inventory_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Snapshot every ingredient\'s main stock, stock room and valuation'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            action='append',
+            help='Snapshot the stock as of the end of this day (YYYY-MM-DD) instead of now; can be repeated',
+        )
+
+    def handle(self, *args, **options):
+        moments = [None]
+        if options['date']:
+            try:
+                moments = [
+                    timezone.make_aware(datetime.combine(datetime.strptime(d, '%Y-%m-%d').date(), time.max))
+                    for d in options['date']
+                ]
+            except ValueError as e:
+                raise CommandError(f'Invalid --date: {e}')
+
+        for when in moments:
+            snapshots = take_inventory_snapshot(when)
+            total = sum(s.valuation for s in snapshots)
+            label = when.strftime('%Y-%m-%d') if when else 'now'
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Snapshot ({label}): {len(snapshots)} ingredients, valuation ₱{total:,.2f}'
+            ))
@@ -0,0 +1,184 @@
+"""
+Cost of goods sold and gross margin.
+
+OrderItem.unit_cost is the ingredient cost of one unit as sold: its
+recipe quantities x Ingredient.cost at the time of sale (twice that for a
+Buy 1 Take 1 item, which gives a second one away). process_order stores it
+with the line; lines sold from item stock have no recipe cost and leave it
+empty. Margin reports then sum the stored costs per item, category or
+day over the paid orders of a date range, joined on the indexed
+Order.business_date, instead of pricing every recipe again.
+
+Revenue is qty x price_at_order, before order-level discounts, as in the
+dashboard's top products.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from dejabrew.sqlite_backend import immediate_atomic
+
+from .models import Ingredient, InventoryTransaction, Item, Order, OrderItem
+
+COST_PLACES = Decimal('0.0001')
+DEFAULT_DAYS = 30
+BACKFILL_BATCH_SIZE = 2000
+LEDGER_DELAY = timedelta(minutes=5)  # Ledger rows of an order are written right after it
+
+# Report grouping: model fields and renamed columns
+GROUPS = {
+    'item': (['item_id'], {'name': F('item__name'), 'category': F('item__category')}),
+    'category': ([], {'category': F('item__category')}),
+    'day': ([], {'day': F('order__business_date')}),
+}
+
+
+def recipe_unit_cost(recipe, costs, multiplier=1):
+    """
+    Ingredient cost of one unit made from `recipe`, with `costs` mapping
+    ingredient names to their cost per unit. None if the recipe has no
+    usable lines or uses an ingredient that isn't in `costs`.
+    """
+    total, used = Decimal('0'), False
+    for line in recipe if isinstance(recipe, list) else []:
+        name, quantity = line.get('ingredient'), float(line.get('quantity') or 0)
+        if not name or quantity <= 0:
+            continue
+        if name not in costs:
+            return None
+        total += Decimal(str(quantity)) * costs[name]
+        used = True
+    return (total * multiplier).quantize(COST_PLACES) if used else None
+
+
+def units_per_sale(is_buy1take1):
+    """Units made for one unit sold: a Buy 1 Take 1 sale gives a second one away."""
+    return 2 if is_buy1take1 else 1
+
+
+def item_unit_cost(item, costs):
+    """recipe_unit_cost of one unit of `item` as sold; every path that stores unit_cost uses this."""
+    return recipe_unit_cost(item.recipe, costs, units_per_sale(item.is_buy1take1))
+
+
+def margin_report(by='item', start_date=None, end_date=None):
+    """
+    Units, revenue, cost and gross margin of the paid orders between two
+    local dates (default: the last DEFAULT_DAYS days), grouped by item,
+    category or day. Lines without a cost are left out of the margin and
+    reported as uncosted_revenue.
+    """
+    end_date = end_date or timezone.localdate()
+    start_date = start_date or end_date - timedelta(days=DEFAULT_DAYS - 1)
+    fields, columns = GROUPS[by]
+    line_revenue = F('qty') * F('price_at_order')
+    rows = (
+        OrderItem.objects.filter(order__status='paid', order__business_date__range=[start_date, end_date])
+        .values(*fields, **columns)
+        .annotate(
+            units=Sum('qty'),
+            revenue=Sum(line_revenue),
+            cost=Sum(F('qty') * F('unit_cost')),
+            uncosted_revenue=Sum(line_revenue, filter=Q(unit_cost__isnull=True)),
+        )
+        .order_by(*fields, *columns)
+    )
+
+    report = []
+    for row in rows:
+        revenue, cost = row['revenue'] or Decimal('0'), row['cost'] or Decimal('0')
+        uncosted = row['uncosted_revenue'] or Decimal('0')
+        margin = revenue - uncosted - cost
+        report.append({
+            **row,
+            'revenue': float(revenue),
+            'cost': float(cost),
+            'uncosted_revenue': float(uncosted),
+            'gross_margin': float(margin),
+            'margin_percent': round(float(margin / (revenue - uncosted) * 100), 2) if revenue > uncosted else None,
+        })
+    if by != 'day':
+        report.sort(key=lambda row: -row['gross_margin'])
+    return report
+
+
+def orders_by_time(batch_size):
+    """
+    Yields the (id, created_at) of every order, newest first, batch_size at
+    a time. Both queries of a batch follow the created_at index, orders
+    sharing a timestamp included.
+    """
+    orders = Order.objects.order_by('-created_at', 'id').values_list('id', 'created_at')
+    batch = list(orders[:batch_size])
+    while batch:
+        yield batch
+        last_id, last_time = batch[-1]
+        batch = list(orders.filter(created_at=last_time, id__gt=last_id)[:batch_size])
+        if len(batch) < batch_size:
+            batch += orders.filter(created_at__lt=last_time)[:batch_size - len(batch)]
+
+
+def backfill_unit_costs(force=False, batch_size=BACKFILL_BATCH_SIZE, log=print):
+    """
+    Fills in unit_cost on order lines sold before it was stored (every line
+    with force). Each ingredient is priced at the cost_per_unit of the
+    order's STOCK_OUT ledger row when there is one, so a later price change
+    doesn't rewrite history, else at its current cost. Lines of items
+    without a recipe stay empty. Returns counts of what was done.
+
+    Orders are taken batch_size at a time in created_at order, so the ledger
+    read for a batch spans only the time its orders were placed in (imported
+    orders have high ids but old dates).
+    """
+    current = dict(Ingredient.objects.values_list('name', 'cost'))
+    items = {item_id: (recipe if isinstance(recipe, list) else [], units_per_sale(promo))
+             for item_id, recipe, promo in Item.objects.values_list('id', 'recipe', 'is_buy1take1')}
+    lines = OrderItem.objects.order_by()
+    table = connection.ops.quote_name(OrderItem._meta.db_table)
+    if not force:
+        lines = lines.filter(unit_cost__isnull=True)
+
+    stats = {'costed': 0, 'uncosted': 0, 'from_ledger': 0}
+    for orders in orders_by_time(batch_size):
+        times = dict(orders)
+        newest, oldest = orders[0][1], orders[-1][1]
+        # By time rather than a long IN list; orders sharing an end's timestamp may be in another batch
+        batch = [line for line in lines.filter(order__created_at__range=[oldest, newest])
+                 .values_list('id', 'order_id', 'item_id', 'unit_cost') if line[1] in times]
+        if not batch:
+            continue
+
+        # reference isn't indexed: read the batch's time span of the ledger (by its created_at index) instead
+        sale_costs = {}
+        for reference, name, cost in InventoryTransaction.objects.filter(
+            transaction_type='STOCK_OUT', created_at__gte=oldest, created_at__lte=newest + LEDGER_DELAY,
+            reference__startswith='Order-',
+        ).values_list('reference', 'ingredient_name', 'cost_per_unit'):
+            order_id = reference[len('Order-'):]
+            if order_id.isdigit() and int(order_id) in times:
+                sale_costs[int(order_id), name] = cost
+
+        changed = []
+        for line_id, order_id, item_id, old_cost in batch:
+            recipe, multiplier = items[item_id]
+            costs = {}
+            for recipe_line in recipe:
+                name = recipe_line.get('ingredient')
+                if (order_id, name) in sale_costs:
+                    costs[name] = sale_costs[order_id, name]
+                    stats['from_ledger'] += 1
+                elif name in current:
+                    costs[name] = current[name]
+            unit_cost = recipe_unit_cost(recipe, costs, multiplier)
+            stats['costed' if unit_cost is not None else 'uncosted'] += 1
+            if unit_cost != old_cost:
+                changed.append((unit_cost, line_id))
+        # executemany rather than bulk_update, whose CASE per row costs more than the rest of the batch
+        with immediate_atomic(), connection.cursor() as cursor:
+            cursor.executemany(f'UPDATE {table} SET unit_cost = %s WHERE id = %s', changed)
+        log(f"  {stats['costed'] + stats['uncosted']:,} lines, {stats['costed']:,} costed")
+    return stats
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.8 on 2026-10-18 23:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0016_item_is_buy1take1'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient_name', models.CharField(max_length=100)),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('main_stock', models.FloatField(default=0)),
+                ('stock_room', models.FloatField(default=0)),
+                ('unit', models.CharField(max_length=20)),
+                ('cost_per_unit', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('valuation', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('ingredient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pos.ingredient')),
+            ],
+            options={
+                'ordering': ['-taken_at'],
+                'indexes': [models.Index(fields=['-taken_at'], name='pos_invento_taken_a_36701d_idx'), models.Index(fields=['ingredient', '-taken_at'], name='pos_invento_ingredi_eef255_idx')],
+            },
+        ),
+    ]
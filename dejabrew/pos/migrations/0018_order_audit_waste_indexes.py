@@ -0,0 +1,29 @@
+# Generated by Django 4.2.8 on 2026-10-19 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0017_inventorysnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audittrail',
+            index=models.Index(fields=['-timestamp'], name='pos_audittr_timesta_33a6e0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at'], name='pos_order_created_9212c2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at'], name='pos_order_status_5b2a0a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wastedlog',
+            index=models.Index(fields=['-wasted_at'], name='pos_wastedl_wasted__05703d_idx'),
+        ),
+    ]
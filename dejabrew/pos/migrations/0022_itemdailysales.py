@@ -0,0 +1,46 @@
+# Generated by Django 4.2.8 on 2026-10-19 01:00
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def add_past_sales(apps, schema_editor):
+    OrderItem = apps.get_model('pos', 'OrderItem')
+    ItemDailySales = apps.get_model('pos', 'ItemDailySales')
+    totals = (
+        OrderItem.objects.filter(order__status='paid')
+        .annotate(day=TruncDate('order__created_at'))
+        .values('item_id', 'day')
+        .annotate(quantity=Sum('qty'))
+        .order_by()
+    )
+    ItemDailySales.objects.bulk_create([ItemDailySales(**row) for row in totals.iterator()], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0021_liveevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='pos.item')),
+            ],
+            options={
+                'verbose_name_plural': 'item daily sales',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='itemdailysales',
+            constraint=models.UniqueConstraint(fields=('item', 'day'), name='unique_item_day_sales'),
+        ),
+        migrations.RunPython(add_past_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-19 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0022_itemdailysales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='thumbnail_url',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.8 on 2026-10-19 01:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0023_item_thumbnail_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedReceipt',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archived_receipt', serialize=False, to='pos.order')),
+                ('segment', models.CharField(max_length=100)),
+                ('offset', models.BigIntegerField()),
+                ('length', models.PositiveIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.8 on 2026-10-19 02:00
+
+from django.db import migrations, models
+from django.db.models.functions import ExtractHour, TruncDate
+import pos.models
+
+
+def fill_business_time(apps, schema_editor):
+    # One UPDATE; the ORM converts created_at to the current (TIME_ZONE) time zone
+    Order = apps.get_model('pos', 'Order')
+    Order.objects.update(business_date=TruncDate('created_at'), business_hour=ExtractHour('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0024_archivedreceipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='business_date',
+            field=pos.models.BusinessDateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='business_hour',
+            field=pos.models.BusinessHourField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_business_time, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='business_date',
+            field=pos.models.BusinessDateField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='business_hour',
+            field=pos.models.BusinessHourField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['business_date', 'business_hour'], name='pos_order_busines_d5eab7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'business_date'], name='pos_order_status_46411b_idx'),
+        ),
+    ]
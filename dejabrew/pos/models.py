@@ -63,6 +63,7 @@ class Item(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=0)
     image_url = models.CharField(max_length=500, blank=True)
+    thumbnail_url = models.CharField(max_length=500, blank=True)  # Small derivative for POS tiles
     recipe = models.JSONField(default=list, blank=True, null=True)
     is_active = models.BooleanField(default=True)
 
@@ -87,6 +88,24 @@ class Item(models.Model):
     def __str__(self):
         return self.name
 
+class BusinessDateField(models.DateField):
+    """The date of the row's created_at in the store's time zone, filled in whenever it is saved (bulk_create too)."""
+
+    def pre_save(self, model_instance, add):
+        value = timezone.localdate(model_instance.created_at) if model_instance.created_at else None
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class BusinessHourField(models.PositiveSmallIntegerField):
+    """The hour (0-23) of the row's created_at in the store's time zone, filled in like BusinessDateField."""
+
+    def pre_save(self, model_instance, add):
+        value = timezone.localtime(model_instance.created_at).hour if model_instance.created_at else None
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -107,9 +126,21 @@ class Order(models.Model):
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=0, blank=True)
     dining_option = models.CharField(max_length=20, choices=DINING_CHOICES, default='dine-in', blank=True)
     reference_number = models.CharField(max_length=100, blank=True, null=True)
+    # Client-generated key of an order queued at a terminal; resubmitting it can't charge twice
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    # created_at in the store's time zone (TIME_ZONE), so reports filter and group on indexed
+    # columns instead of converting every row's timestamp. Declared after created_at: they read it.
+    business_date = BusinessDateField(editable=False)
+    business_hour = BusinessHourField(editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at']),
+            models.Index(fields=['status', '-created_at']),
+            models.Index(fields=['business_date', 'business_hour']),
+            models.Index(fields=['status', 'business_date']),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.total}"
@@ -120,6 +151,8 @@ class OrderItem(models.Model):
     item = models.ForeignKey(Item, on_delete=models.PROTECT)
     qty = models.IntegerField()
     price_at_order = models.DecimalField(max_digits=10, decimal_places=2)
+    # Ingredient cost of one unit at the time of sale, for margins (pos/margins.py); empty if unknown
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
 
     @property
     def subtotal(self):
@@ -129,6 +162,38 @@ class OrderItem(models.Model):
         return f"{self.qty} x {self.item.name}"
 
 
+class ItemDailySales(models.Model):
+    """
+    Units of an item sold in paid orders on one (local) day. Kept up to
+    date as orders are paid (pos/best_sellers.py), so best-seller rankings
+    read a few rows per item instead of every order line in history.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['item', 'day'], name='unique_item_day_sales')]
+        verbose_name_plural = 'item daily sales'
+
+    def __str__(self):
+        return f"{self.item_id} @ {self.day}: {self.quantity}"
+
+
+class ArchivedReceipt(models.Model):
+    """
+    Where an order's receipt sits in the receipt archive
+    (pos/receipt_archive.py): a compressed member of a daily segment file.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='archived_receipt')
+    segment = models.CharField(max_length=100)  # Relative to the archive directory
+    offset = models.BigIntegerField()
+    length = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"Order #{self.order_id} in {self.segment}"
+
+
 class AuditTrail(models.Model):
     SEVERITY_CHOICES = [
         ('low', 'Low'),
@@ -149,6 +214,9 @@ class AuditTrail(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp']),
+        ]
 
     def __str__(self):
         return f"{self.user.username if self.user else 'System'} - {self.action} [{self.category}/{self.severity}] at {self.timestamp}"
@@ -173,6 +241,9 @@ class WastedLog(models.Model):
 
     class Meta:
         ordering = ['-wasted_at']
+        indexes = [
+            models.Index(fields=['-wasted_at']),
+        ]
 
     def __str__(self):
         return f"{self.quantity}{self.unit} of {self.ingredient_name} wasted"
@@ -221,4 +292,77 @@ class InventoryTransaction(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.transaction_type}: {self.quantity}{self.unit} of {self.ingredient_name}"
\ No newline at end of file
+        return f"{self.transaction_type}: {self.quantity}{self.unit} of {self.ingredient_name}"
+
+class InventorySnapshot(models.Model):
+    """
+    Stock and valuation of one ingredient at a point in time.
+    Written for every ingredient at once (nightly or on demand), so
+    point-in-time queries only replay the ledger since the nearest one.
+    """
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.SET_NULL, null=True, blank=True)
+    ingredient_name = models.CharField(max_length=100)  # Preserved name if ingredient deleted
+    taken_at = models.DateTimeField(default=timezone.now)
+    main_stock = models.FloatField(default=0)
+    stock_room = models.FloatField(default=0)
+    unit = models.CharField(max_length=20)
+    cost_per_unit = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    valuation = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-taken_at']
+        indexes = [
+            models.Index(fields=['-taken_at']),
+            models.Index(fields=['ingredient', '-taken_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.ingredient_name} @ {self.taken_at:%Y-%m-%d %H:%M}: {self.main_stock + self.stock_room}{self.unit}"
+
+
+class SlowQuery(models.Model):
+    """
+    One row per SQL statement shape that has run slower than
+    SLOW_QUERY_MS: how often, how long in total, and the latest example
+    with its parameters, view and query plan. Written by dejabrew.slow_queries.
+    """
+    fingerprint_hash = models.CharField(max_length=40, unique=True)
+    sql = models.TextField()  # Statement shape (placeholders, IN lists collapsed)
+    params = models.TextField(blank=True)
+    view = models.CharField(max_length=200, blank=True)
+    origin = models.CharField(max_length=500, blank=True)  # App code line that ran it
+    plan = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-total_ms']
+        verbose_name_plural = 'slow queries'
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.count if self.count else 0
+
+    def __str__(self):
+        return f"{self.count}x {self.total_ms:.0f}ms: {self.sql[:80]}"
+
+
+class LiveEvent(models.Model):
+    """
+    Short-lived outbox of stock / order events for the server-sent events
+    stream (pos/live_events.py). Rows are written in the same transaction as
+    the change, so a rolled-back order publishes nothing, and every server
+    process reads the same sequence by id.
+    """
+    kind = models.CharField(max_length=20)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.kind}"
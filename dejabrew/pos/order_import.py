@@ -0,0 +1,293 @@
+"""
+Bulk import of historical orders from another POS or a spreadsheet, used by
+the import_orders command.
+
+Two input formats are read as a stream, one order at a time:
+
+- CSV with a header and one row per order line. Rows of the same order_id
+  must be next to each other. Columns: order_id, created_at, item (name or
+  id), qty, and optionally price, total, status, payment_method,
+  dining_option, customer_name, cashier (username), discount (percent),
+  reference_number.
+- JSONL with one order per line: the same order fields plus
+  "items": [{"item": ..., "qty": ..., "price": ...}, ...].
+
+Items and cashiers are resolved through maps loaded once, and Orders,
+OrderItems and (optionally) their STOCK_OUT ledger rows are written with
+bulk_create, one transaction per batch, keeping the source created_at.
+
+Lines of recipe items get a unit cost at today's ingredient costs, the
+best estimate there is for history.
+
+Each imported order gets the idempotency key "<source>:<order_id>", so
+importing the same file again (or resuming after a crash) skips the orders
+that are already in. Importing history does not touch current stock.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, time as dt_time
+from decimal import Decimal, InvalidOperation
+from itertools import groupby
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from dejabrew.sqlite_backend import immediate_atomic
+
+from .best_sellers import order_sales, record_sales
+from .ledger import replay_ledger
+from .load_data import explicit_timestamps
+from .margins import item_unit_cost
+from .models import Ingredient, InventoryTransaction, Item, Order, OrderItem
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_SOURCE = 'import'
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+ORDER_FIELDS = ('status', 'payment_method', 'dining_option', 'customer_name', 'reference_number')
+STATUSES = {value for value, _ in Order.STATUS_CHOICES}
+
+# Errors kept in the stats; the rest are only counted
+MAX_ERRORS = 1000
+
+
+class OrderImportError(ValueError):
+    """A source order that can't be imported; the message names its line."""
+
+
+def detect_format(path):
+    fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f'Unknown file type for {path}; use .csv or .jsonl, or pass the format.')
+    return fmt
+
+
+def read_csv(f):
+    """Yields (line number, order dict) with one order per run of rows sharing an order_id."""
+    reader = csv.DictReader(f)
+    missing = {'order_id', 'created_at', 'item', 'qty'} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"CSV is missing the column(s): {', '.join(sorted(missing))}")
+
+    numbered = ((reader.line_num, row) for row in reader)
+    for order_id, rows in groupby(numbered, key=lambda pair: (pair[1]['order_id'] or '').strip()):
+        rows = list(rows)
+        line, first = rows[0]
+        order = {k: v for k, v in first.items() if k not in ('item', 'qty', 'price') and v not in (None, '')}
+        order['order_id'] = order_id
+        order['items'] = [{'item': row['item'], 'qty': row['qty'], 'price': row.get('price')} for _, row in rows]
+        yield line, order
+
+
+def read_jsonl(f):
+    for line, text in enumerate(f, 1):
+        if not text.strip():
+            continue
+        try:
+            order = json.loads(text)
+        except ValueError as e:
+            yield line, e
+            continue
+        yield line, order
+
+
+def parse_timestamp(value, date_format=None):
+    """Aware datetime from ISO 8601 (or `date_format`); naive values are in the project's time zone."""
+    value = str(value or '').strip()
+    try:
+        when = datetime.strptime(value, date_format) if date_format else parse_datetime(value)
+        if when is None and parse_date(value):
+            when = datetime.combine(parse_date(value), dt_time())
+    except ValueError:
+        when = None
+    if when is None:
+        raise OrderImportError(f'bad created_at {value!r}')
+    return timezone.make_aware(when) if timezone.is_naive(when) else when
+
+
+def decimal_or_none(value, name):
+    if value in (None, ''):
+        return None
+    try:
+        number = Decimal(str(value).replace(',', '').strip())
+    except InvalidOperation:
+        raise OrderImportError(f'bad {name} {value!r}')
+    if not number.is_finite():  # NaN / Infinity
+        raise OrderImportError(f'bad {name} {value!r}')
+    return number
+
+
+def idempotency_key(source, order_id):
+    key = f'{source}:{order_id}'
+    if len(key) > 64:  # Order.idempotency_key max_length
+        key = f'{source[:20]}:{hashlib.sha1(key.encode()).hexdigest()}'
+    return key
+
+
+class Importer:
+    """Holds the lookup maps and turns source orders into unsaved model rows."""
+
+    def __init__(self, source, date_format=None, ledger=False):
+        self.source = source
+        self.date_format = date_format
+        self.ledger = ledger
+        self.items = {}
+        for item in Item.objects.order_by('id').only('id', 'name', 'price', 'recipe', 'is_buy1take1'):
+            self.items[str(item.id)] = item
+            self.items[item.name.strip().lower()] = item  # Duplicate names: the newest item wins
+        self.cashiers = dict(User.objects.values_list('username', 'id'))
+        self.ingredients = {i.name: i for i in Ingredient.objects.all()} if ledger else {}
+        self.costs = dict(Ingredient.objects.values_list('name', 'cost'))  # Unit costs at today's prices
+        self.used_ingredients = set()
+
+    def item(self, value):
+        item = self.items.get(str(value).strip().lower())
+        if item is None:
+            raise OrderImportError(f'unknown item {value!r}')
+        return item
+
+    def build(self, order):
+        """(Order, [OrderItem without order], {ingredient: quantity}) for one source order."""
+        if not isinstance(order, dict):
+            raise OrderImportError(f'not an order: {order}')
+        order_id = str(order.get('order_id') or '').strip()
+        if not order_id:
+            raise OrderImportError('missing order_id')
+        if not order.get('items'):
+            raise OrderImportError(f'order {order_id} has no items')
+
+        lines, usage = [], {}
+        for line in order['items']:
+            if not isinstance(line, dict):
+                raise OrderImportError(f'bad line {line!r} in order {order_id}')
+            item = self.item(line.get('item', ''))
+            try:
+                qty = int(Decimal(str(line.get('qty')).strip()))
+            except (InvalidOperation, ValueError, OverflowError):  # OverflowError: Infinity
+                raise OrderImportError(f"bad qty {line.get('qty')!r} in order {order_id}")
+            if qty <= 0:
+                raise OrderImportError(f'qty must be positive in order {order_id}')
+            price = decimal_or_none(line.get('price'), 'price')
+            lines.append(OrderItem(item=item, qty=qty, price_at_order=item.price if price is None else price,
+                                   unit_cost=item_unit_cost(item, self.costs)))
+            if self.ledger and isinstance(item.recipe, list):
+                for recipe_line in item.recipe:
+                    ingredient = self.ingredients.get(recipe_line.get('ingredient'))
+                    quantity = float(recipe_line.get('quantity') or 0)
+                    if ingredient is not None and quantity > 0:
+                        usage[ingredient] = usage.get(ingredient, 0) + quantity * qty
+
+        status = str(order.get('status') or 'paid').strip().lower()
+        if status not in STATUSES:
+            raise OrderImportError(f'bad status {status!r} in order {order_id}')
+        discount = decimal_or_none(order.get('discount'), 'discount') or Decimal('0')
+        total = decimal_or_none(order.get('total'), 'total')
+        if total is None:
+            subtotal = sum(line.qty * line.price_at_order for line in lines)
+            total = (subtotal * (1 - discount / 100)).quantize(Decimal('0.01'))
+
+        cashier = str(order.get('cashier') or '').strip()
+        if cashier and cashier not in self.cashiers:
+            raise OrderImportError(f'unknown cashier {cashier!r} in order {order_id}')
+
+        fields = {name: str(order[name]).strip() for name in ORDER_FIELDS if order.get(name) not in (None, '')}
+        fields['status'] = status
+        return Order(
+            **fields,
+            created_at=parse_timestamp(order.get('created_at'), self.date_format),
+            total=total,
+            discount=discount,
+            cashier_id=self.cashiers.get(cashier),
+            idempotency_key=idempotency_key(self.source, order_id),
+        ), lines, (usage if status != 'cancelled' else {})
+
+    def write(self, batch, stats):
+        """Saves one batch of built orders, skipping ones imported before. Call inside a transaction."""
+        keys = [order.idempotency_key for order, _, _ in batch]
+        existing = set(Order.objects.filter(idempotency_key__in=keys).values_list('idempotency_key', flat=True))
+        batch = [row for row in batch if row[0].idempotency_key not in existing]
+        stats['skipped'] += len(keys) - len(batch)
+
+        orders = Order.objects.bulk_create([order for order, _, _ in batch])
+        order_items, rows = [], []
+        for order, (_, lines, usage) in zip(orders, batch):
+            for line in lines:
+                line.order_id = order.id
+                order_items.append(line)
+            for ingredient, quantity in usage.items():
+                quantity = round(quantity, 6)
+                rows.append(InventoryTransaction(
+                    ingredient=ingredient, ingredient_name=ingredient.name, transaction_type='STOCK_OUT',
+                    quantity=-quantity, unit=ingredient.unit, cost_per_unit=ingredient.cost,
+                    total_cost=(Decimal(str(quantity)) * ingredient.cost).quantize(Decimal('0.01')),
+                    main_stock_after=ingredient.mainStock, stock_room_after=ingredient.stockRoom,
+                    notes='Used in order (recipe)', reference=f'Order-{order.id}',
+                    user_id=order.cashier_id, created_at=order.created_at,
+                ))
+                self.used_ingredients.add(ingredient.id)
+        OrderItem.objects.bulk_create(order_items)
+        InventoryTransaction.objects.bulk_create(rows)
+        record_sales(sale for order, (_, lines, _) in zip(orders, batch)
+                     for sale in order_sales(order, [(line.item_id, line.qty) for line in lines]))
+
+        stats['orders'] += len(orders)
+        stats['order_items'] += len(order_items)
+        stats['stock_out'] += len(rows)
+
+
+def import_orders(path, fmt=None, source=DEFAULT_SOURCE, batch_size=DEFAULT_BATCH_SIZE, ledger=False,
+                  replay=False, date_format=None, log=print):
+    """
+    Imports the orders in the CSV / JSONL file at `path`. Orders that can't
+    be read are skipped and listed in stats['errors'] with their line.
+    Returns counts of what was written.
+
+    With ledger, each imported order that wasn't cancelled gets the
+    STOCK_OUT rows of its items' recipes. Those carry today's stock, as
+    backfilled rows do; replay recomputes the touched ingredients' balances
+    at the end (slow on big ledgers; replay_ledger does the same).
+    """
+    fmt = fmt or detect_format(path)
+    importer = Importer(source, date_format=date_format, ledger=ledger)
+    stats = {'orders': 0, 'order_items': 0, 'stock_out': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+    seen = set()
+    started = time.perf_counter()
+
+    def flush(batch):
+        with immediate_atomic():
+            importer.write(batch, stats)
+        elapsed = time.perf_counter() - started
+        log(f"  {stats['orders']:,} orders imported, {stats['skipped']:,} already there "
+            f"({stats['orders'] / elapsed if elapsed else 0:,.0f} orders/s)")
+
+    with open(path, encoding='utf-8-sig', newline='') as f, explicit_timestamps():
+        batch = []
+        for line, order in (read_csv(f) if fmt == 'csv' else read_jsonl(f)):
+            try:
+                if isinstance(order, Exception):
+                    raise OrderImportError(f'bad JSON: {order}')
+                built = importer.build(order)
+                if built[0].idempotency_key in seen:
+                    raise OrderImportError(f"order {order['order_id']} appears twice "
+                                           f"(in a CSV its rows must be next to each other)")
+            except OrderImportError as e:
+                stats['failed'] += 1
+                if len(stats['errors']) < MAX_ERRORS:
+                    stats['errors'].append(f'line {line}: {e}')
+                continue
+            seen.add(built[0].idempotency_key)
+            batch.append(built)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+    if replay and importer.used_ingredients:
+        replay_ledger(Ingredient.objects.filter(id__in=importer.used_ingredients))
+    stats['elapsed_seconds'] = time.perf_counter() - started
+    return stats
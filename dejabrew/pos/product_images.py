@@ -0,0 +1,88 @@
+"""
+Product photos: every upload is normalized (EXIF rotation applied, metadata
+dropped, converted to WebP) into resized derivatives:
+
+- thumbnail: fits 400x400, what the POS product tiles show
+- detail:    fits 1200x1200, for the product modals and Item.image_url
+
+Files are named after a hash of their bytes (latte.3f2a9c0b1d4e.webp) under
+pos/static/pos/img/products/, so a given URL never changes content and
+ProductImageWhiteNoiseMiddleware can serve it with far-future cache headers.
+Uploading the same photo twice reuses the same files.
+"""
+
+import hashlib
+import io
+import os
+import re
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+DERIVATIVES = {
+    'thumbnail': (400, 400),
+    'detail': (1200, 1200),
+}
+FORMAT, EXTENSION, QUALITY = 'WEBP', 'webp', 80
+STATIC_PREFIX = '/static/pos/img/'
+URL_PREFIX = STATIC_PREFIX + 'products/'
+HASHED_URL = re.compile(r'^' + re.escape(URL_PREFIX) + r'[\w-]+\.[0-9a-f]{12}\.' + EXTENSION + '$')
+
+
+class ProductImageError(ValueError):
+    pass
+
+
+def image_dir():
+    return os.path.join(settings.BASE_DIR, 'pos', 'static', 'pos', 'img')
+
+
+def slug(filename):
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return ''.join(c for c in name if c.isalnum() or c in ('_', '-'))[:60] or 'product'
+
+
+def derivative(image, size):
+    copy = image.copy()
+    copy.thumbnail(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    copy.save(buffer, FORMAT, quality=QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def save_derivatives(source, filename):
+    """
+    Writes the derivatives of an image (a path or file object) and returns
+    {'image_url': detail URL, 'thumbnail_url': thumbnail URL}.
+    Raises ProductImageError if it isn't an image Pillow can read.
+    """
+    try:
+        with Image.open(source) as opened:
+            image = ImageOps.exif_transpose(opened)
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    except (UnidentifiedImageError, OSError) as e:
+        raise ProductImageError(f'Not a readable image: {e}')
+
+    out_dir = os.path.join(image_dir(), 'products')
+    os.makedirs(out_dir, exist_ok=True)
+    urls = {}
+    for name, size in DERIVATIVES.items():
+        data = derivative(image, size)
+        filename_out = f'{slug(filename)}.{hashlib.sha256(data).hexdigest()[:12]}.{EXTENSION}'
+        path = os.path.join(out_dir, filename_out)
+        if not os.path.exists(path):
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        urls[name] = URL_PREFIX + filename_out
+    return {'image_url': urls['detail'], 'thumbnail_url': urls['thumbnail']}
+
+
+def local_path(url):
+    """File behind a /static/pos/img/... URL, or None for anything else (external URLs, other paths)."""
+    if not url or not url.startswith(STATIC_PREFIX):
+        return None
+    relative = url[len(STATIC_PREFIX):].split('?')[0]
+    path = os.path.normpath(os.path.join(image_dir(), relative))
+    return path if path.startswith(image_dir() + os.sep) else None
@@ -0,0 +1,142 @@
+"""
+Receipt archive: the HTML receipt of every order, kept out of the static
+files in one compressed segment per day.
+
+    receipts/2025/11/2025-11-19.html.gz
+
+Each receipt is appended to its day's segment as a gzip member of its own,
+so a segment is also a valid .gz file (zcat prints the day's receipts) and
+one receipt reads back with a single seek. ArchivedReceipt rows index them
+by order: segment, offset and length.
+
+Appends happen inside the order's transaction, which on SQLite holds the
+database write lock (immediate_atomic), so two processes never append to a
+segment at the same time. If the transaction rolls back, the bytes stay in
+the segment with no row pointing at them.
+"""
+
+import glob
+import gzip
+import os
+import re
+
+from django.conf import settings
+
+from dejabrew.sqlite_backend import immediate_atomic
+
+from .models import ArchivedReceipt, Order
+
+SEGMENT_SUFFIX = '.html.gz'
+LEGACY_FILE = re.compile(r'^receipt_order_(\d+)_(\d{8})_(\d{6})\.html$')
+PACK_BATCH_SIZE = 500
+
+
+def archive_dir():
+    return os.path.join(settings.BASE_DIR, 'receipts')
+
+
+def legacy_dir():
+    """Where save_receipt_to_file used to write one HTML file per order."""
+    return os.path.join(settings.BASE_DIR, 'pos', 'static', 'pos', 'receipt')
+
+
+def segment_name(day):
+    return f'{day:%Y}/{day:%m}/{day:%Y-%m-%d}{SEGMENT_SUFFIX}'
+
+
+def compress(html):
+    return gzip.compress(html.encode('utf-8'), compresslevel=9, mtime=0)
+
+
+def append(segment, blobs):
+    """Appends compressed receipts to a segment. Returns their (offset, length)."""
+    path = os.path.join(archive_dir(), segment)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    positions = []
+    with open(path, 'ab') as f:
+        offset = f.seek(0, os.SEEK_END)
+        for blob in blobs:
+            f.write(blob)
+            positions.append((offset, len(blob)))
+            offset += len(blob)
+    return positions
+
+
+def archive_receipt(order, html):
+    """Stores an order's receipt. Call inside the transaction that saved the order."""
+    segment = segment_name(order.business_date)
+    [(offset, length)] = append(segment, [compress(html)])
+    return ArchivedReceipt.objects.create(order=order, segment=segment, offset=offset, length=length)
+
+
+def read_compressed(receipt):
+    """The receipt's gzip member as stored; it can be sent as-is with Content-Encoding: gzip."""
+    with open(os.path.join(archive_dir(), receipt.segment), 'rb') as f:
+        f.seek(receipt.offset)
+        data = f.read(receipt.length)
+    if len(data) != receipt.length:
+        raise OSError(f'Segment {receipt.segment} is shorter than the index says')
+    return data
+
+
+def read_receipt(receipt):
+    return gzip.decompress(read_compressed(receipt)).decode('utf-8')
+
+
+def pack_legacy_receipts(delete=False, batch_size=PACK_BATCH_SIZE, log=print):
+    """
+    Moves the flat receipt_order_<id>_<timestamp>.html files into the
+    archive, each under its order's day. When an order has several files
+    the newest wins; orders that are already archived or no longer exist
+    are skipped. With delete, the files of archived orders are removed
+    once every batch is committed. Returns counts of what was done.
+    """
+    latest = {}
+    for path in glob.glob(os.path.join(legacy_dir(), 'receipt_order_*.html')):
+        match = LEGACY_FILE.match(os.path.basename(path))
+        if match:
+            order_id, stamp = int(match.group(1)), match.group(2) + match.group(3)
+            if order_id not in latest or stamp > latest[order_id][0]:
+                latest[order_id] = (stamp, path)
+
+    stats = {'packed': 0, 'already_archived': 0, 'missing_orders': 0, 'deleted': 0,
+             'bytes_before': 0, 'bytes_after': 0}
+    done = set()
+    order_ids = sorted(latest)
+    for start in range(0, len(order_ids), batch_size):
+        batch = order_ids[start:start + batch_size]
+        with immediate_atomic():
+            orders = Order.objects.in_bulk(batch)
+            archived = set(ArchivedReceipt.objects.filter(order_id__in=batch).values_list('order_id', flat=True))
+            by_segment = {}
+            for order_id in batch:
+                if order_id not in orders:
+                    stats['missing_orders'] += 1
+                    continue
+                done.add(order_id)
+                if order_id in archived:
+                    stats['already_archived'] += 1
+                    continue
+                with open(latest[order_id][1], encoding='utf-8') as f:
+                    blob = compress(f.read())
+                segment = segment_name(orders[order_id].business_date)
+                by_segment.setdefault(segment, []).append((order_id, blob))
+                stats['bytes_before'] += os.path.getsize(latest[order_id][1])
+
+            rows = []
+            for segment, receipts in sorted(by_segment.items()):
+                positions = append(segment, [blob for _, blob in receipts])
+                for (order_id, _), (offset, length) in zip(receipts, positions):
+                    rows.append(ArchivedReceipt(order_id=order_id, segment=segment, offset=offset, length=length))
+                    stats['bytes_after'] += length
+            ArchivedReceipt.objects.bulk_create(rows)
+            stats['packed'] += len(rows)
+        log(f"  {start + len(batch):,} / {len(order_ids):,} orders, {stats['packed']:,} receipts packed")
+
+    if delete:
+        for path in glob.glob(os.path.join(legacy_dir(), 'receipt_order_*.html')):
+            match = LEGACY_FILE.match(os.path.basename(path))
+            if match and int(match.group(1)) in done:
+                os.remove(path)
+                stats['deleted'] += 1
+    return stats
@@ -291,7 +291,7 @@ function renderProducts(products) {
 
         return `
         <div class="product-card ${isDisabled ? 'disabled' : ''}">
-            <div class="product-image" style="background-image: url('${product.image_url || PLACEHOLDER_IMAGE}'); position: relative;">
+            <div class="product-image" style="background-image: url('${product.thumbnail_url || product.image_url || PLACEHOLDER_IMAGE}'); position: relative;">
                 ${isDisabled ? '<div class="out-of-stock-watermark">NOT AVAILABLE</div>' : ''}
                 ${isBuy1Take1 && !isDisabled ? '<div class="promo-badge">BUY 1 TAKE 1</div>' : ''}
             </div>
@@ -729,7 +729,7 @@ function showAddOnsModal(productName) {
         
         addOnsGrid.innerHTML = addOnsProducts.map(product => `
             <div class="addon-card" data-id="${product.id}" onclick="toggleAddOn(${product.id}, '${escapeJs(product.name)}', ${product.price})">
-                <img src="${product.image_url || PLACEHOLDER_IMAGE}" alt="${escapeHtml(product.name)}">
+                <img src="${product.thumbnail_url || product.image_url || PLACEHOLDER_IMAGE}" loading="lazy" alt="${escapeHtml(product.name)}">
                 <div class="name">${escapeHtml(product.name)}</div>
                 <div class="price">₱${parseFloat(product.price).toFixed(2)}</div>
             </div>
@@ -1735,7 +1735,7 @@ function showAddOnsModalForModify(productName, existingAddOns = []) {
             const isSelected = existingAddOns.some(a => a.id === product.id);
             return `
                 <div class="addon-card ${isSelected ? 'selected' : ''}" data-id="${product.id}" onclick="toggleAddOn(${product.id}, '${escapeJs(product.name)}', ${product.price})">
-                    <img src="${product.image_url || PLACEHOLDER_IMAGE}" alt="${escapeHtml(product.name)}">
+                    <img src="${product.thumbnail_url || product.image_url || PLACEHOLDER_IMAGE}" loading="lazy" alt="${escapeHtml(product.name)}">
                     <div class="name">${escapeHtml(product.name)}</div>
                     <div class="price">₱${parseFloat(product.price).toFixed(2)}</div>
                 </div>
@@ -158,6 +158,8 @@ document.addEventListener('DOMContentLoaded', async function() {
     setupOrderCompleteModal(); // Initialize Order Complete Modal
     setupButtonControls(); // NEW: Setup button-based controls
     setupAdminPasswordModal(); // NEW: Setup admin authentication
+    setupOrderQueue(); // Send orders queued while the server was unreachable
+    setupLiveEvents(); // Stock pushed by the server instead of re-fetching lists
 });
 
 function setupEventListeners() {
@@ -393,7 +395,7 @@ function renderProducts(products) {
 
         return `
         <div class="product-card ${isDisabled ? 'disabled' : ''}">
-            <div class="product-image" style="background-image: url('${product.image_url || PLACEHOLDER_IMAGE}'); position: relative;">
+            <div class="product-image" style="background-image: url('${product.thumbnail_url || product.image_url || PLACEHOLDER_IMAGE}'); position: relative;">
                 ${isDisabled ? '<div class="out-of-stock-watermark">NOT AVAILABLE</div>' : ''}
                 ${isBuy1Take1 && !isDisabled ? '<div class="promo-badge">BUY 1 TAKE 1</div>' : ''}
             </div>
@@ -855,7 +857,7 @@ function showAddOnsModal(productName) {
         
         addOnsGrid.innerHTML = addOnsProducts.map(product => `
             <div class="addon-card" data-id="${product.id}" onclick="toggleAddOn(${product.id}, '${escapeJs(product.name)}', ${product.price})">
-                <img src="${product.image_url || PLACEHOLDER_IMAGE}" alt="${escapeHtml(product.name)}">
+                <img src="${product.thumbnail_url || product.image_url || PLACEHOLDER_IMAGE}" loading="lazy" alt="${escapeHtml(product.name)}">
                 <div class="name">${escapeHtml(product.name)}</div>
                 <div class="price">₱${parseFloat(product.price).toFixed(2)}</div>
             </div>
@@ -1348,7 +1350,7 @@ function showAddOnsModalForModify(productName, existingAddOns = []) {
             const isSelected = existingAddOns.some(a => a.id === product.id);
             return `
                 <div class="addon-card ${isSelected ? 'selected' : ''}" data-id="${product.id}" onclick="toggleAddOn(${product.id}, '${escapeJs(product.name)}', ${product.price})">
-                    <img src="${product.image_url || PLACEHOLDER_IMAGE}" alt="${escapeHtml(product.name)}">
+                    <img src="${product.thumbnail_url || product.image_url || PLACEHOLDER_IMAGE}" loading="lazy" alt="${escapeHtml(product.name)}">
                     <div class="name">${escapeHtml(product.name)}</div>
                     <div class="price">₱${parseFloat(product.price).toFixed(2)}</div>
                 </div>
@@ -1360,6 +1362,185 @@ function showAddOnsModalForModify(productName, existingAddOns = []) {
     });
 }
 
+// --- OFFLINE ORDER QUEUE ---
+// Every order is queued in localStorage with a client-generated idempotency
+// key and sent to /api/process-order/batch/. The server skips keys it has
+// already processed, so a batch can be resent after a timeout or a lost
+// response without charging or deducting stock twice.
+
+const ORDER_QUEUE_STORAGE_KEY = 'dejabrew_order_queue_v1';
+const ORDER_QUEUE_BATCH_SIZE = 20;
+const ORDER_SUBMIT_TIMEOUT_MS = 8000;
+const ORDER_QUEUE_RETRY_MS = 15000;
+const ORDER_MAX_ATTEMPTS = 5; // Server errors on the same order before it is taken out of the queue
+let orderQueueFlush = null;
+// idempotency_key -> result, filled by whichever flush sent the order
+const orderResults = {};
+// Keys processOrder is waiting for; background reports leave them to it
+const ordersAwaitingCashier = new Set();
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+}
+
+function loadOrderQueue() {
+    try {
+        return JSON.parse(localStorage.getItem(ORDER_QUEUE_STORAGE_KEY)) || [];
+    } catch (error) {
+        return [];
+    }
+}
+
+function saveOrderQueue(queue) {
+    localStorage.setItem(ORDER_QUEUE_STORAGE_KEY, JSON.stringify(queue));
+    updateOrderQueueBadge(queue.length);
+}
+
+function queueOrder(orderData) {
+    const queued = { ...orderData, idempotency_key: newIdempotencyKey(), queued_at: new Date().toISOString() };
+    saveOrderQueue([...loadOrderQueue(), queued]);
+    return queued;
+}
+
+function updateOrderQueueBadge(count) {
+    let badge = document.getElementById('orderQueueBadge');
+    if (!badge) {
+        if (count === 0) return;
+        badge = document.createElement('div');
+        badge.id = 'orderQueueBadge';
+        Object.assign(badge.style, {
+            position: 'fixed', bottom: '16px', left: '16px', zIndex: '9999', padding: '8px 14px',
+            borderRadius: '8px', background: '#fff3cd', color: '#856404', border: '1px solid #ffeeba',
+            fontWeight: '600', boxShadow: '0 4px 12px rgba(0,0,0,0.15)'
+        });
+        document.body.appendChild(badge);
+    }
+    badge.textContent = `⏳ ${count} order${count === 1 ? '' : 's'} waiting to be sent`;
+    badge.style.display = count > 0 ? 'block' : 'none';
+}
+
+// Sends the queue in batches. Resolves to {idempotency_key: result} for every order the server answered
+// for good; the results are also kept in orderResults. A 5xx result is retried by later flushes, up to
+// ORDER_MAX_ATTEMPTS times, then reported as failed so one bad order can't stay queued forever.
+async function sendQueuedOrders() {
+    const answered = {};
+    try {
+        let queue = loadOrderQueue();
+        while (queue.length > 0) {
+            const controller = new AbortController();
+            const timer = setTimeout(() => controller.abort(), ORDER_SUBMIT_TIMEOUT_MS);
+            let data;
+            try {
+                const response = await fetch('/api/process-order/batch/', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCSRFToken() },
+                    body: JSON.stringify({ orders: queue.slice(0, ORDER_QUEUE_BATCH_SIZE) }),
+                    signal: controller.signal
+                });
+                if (!response.ok) break; // Keep everything queued and retry later
+                data = await response.json();
+            } finally {
+                clearTimeout(timer);
+            }
+
+            const attempts = {};
+            queue.forEach(order => { attempts[order.idempotency_key] = (order.attempts || 0) + 1; });
+            const done = new Set();
+            const retried = new Set();
+            data.results.forEach(result => {
+                const key = result.idempotency_key;
+                if (result.status >= 500 && attempts[key] < ORDER_MAX_ATTEMPTS) {
+                    retried.add(key);
+                    return;
+                }
+                if (result.status >= 500) {
+                    result = { ...result, error: `${result.error} (gave up after ${attempts[key]} attempts)` };
+                }
+                done.add(key);
+                answered[key] = result;
+                orderResults[key] = result;
+            });
+            // Re-read: another order may have been queued while the batch was in flight
+            queue = loadOrderQueue()
+                .filter(order => !done.has(order.idempotency_key))
+                .map(order => retried.has(order.idempotency_key) ? { ...order, attempts: attempts[order.idempotency_key] } : order);
+            saveOrderQueue(queue);
+            if (done.size === 0) break;
+        }
+    } catch (error) {
+        console.warn('Could not send queued orders, will retry:', error);
+    }
+    return answered;
+}
+
+// One flush at a time; a flush asked for meanwhile runs right after the current one
+function flushOrderQueue() {
+    orderQueueFlush = (orderQueueFlush || Promise.resolve()).then(sendQueuedOrders, sendQueuedOrders);
+    return orderQueueFlush;
+}
+
+// Tells the cashier about queued orders that went through (or failed) in the background
+function reportQueuedOrderResults(results) {
+    const others = Object.values(results).filter(result => !ordersAwaitingCashier.has(result.idempotency_key));
+    others.forEach(result => { delete orderResults[result.idempotency_key]; });
+    const sent = others.filter(result => result.success).length;
+    others.filter(result => !result.success).forEach(result => {
+        showNotification(`A queued order could not be processed: ${result.error}`, 'error');
+    });
+    if (sent > 0) {
+        showNotification(`${sent} queued order${sent === 1 ? '' : 's'} sent.`, 'success');
+        loadProducts();
+    }
+}
+
+function setupOrderQueue() {
+    const flushInBackground = () => {
+        if (loadOrderQueue().length > 0) {
+            flushOrderQueue().then(results => reportQueuedOrderResults(results));
+        }
+    };
+    updateOrderQueueBadge(loadOrderQueue().length);
+    flushInBackground();
+    setInterval(flushInBackground, ORDER_QUEUE_RETRY_MS);
+    window.addEventListener('online', flushInBackground);
+}
+
+// --- LIVE EVENTS (server-sent, see pos/live_events.py) ---
+
+function refreshVisibleProducts() {
+    const currentCategory = document.getElementById('productsGrid')?.dataset.currentCategory;
+    if (currentCategory) showProductView(currentCategory);
+}
+
+function setupLiveEvents() {
+    // Only served by the ASGI app; elsewhere the stream fails once and the page works as before
+    if (!window.EventSource) return;
+    const events = new EventSource('/api/events/?kinds=stock,low_stock');
+
+    events.addEventListener('stock', (event) => {
+        const changed = JSON.parse(event.data).ingredients;
+        changed.forEach(update => {
+            const ingredient = allIngredients.find(ing => ing.id === update.id);
+            if (ingredient) {
+                ingredient.mainStock = update.main;
+                ingredient.stockRoom = update.room;
+                ingredient.status = update.status;
+            }
+        });
+        refreshVisibleProducts();
+    });
+
+    events.addEventListener('low_stock', (event) => {
+        const data = JSON.parse(event.data);
+        if (data.level === 'out') showNotification(`${data.name} is out of stock.`, 'error', true);
+        else if (data.level === 'low') showNotification(`${data.name} is running low.`, 'info', true);
+    });
+
+    // Missed more than the server keeps: reload the whole list once
+    events.addEventListener('reset', () => loadIngredients().then(refreshVisibleProducts));
+}
+
 // --- ORDER PROCESSING ---
 
 async function processOrder() {
@@ -1428,14 +1609,26 @@ async function processOrder() {
     processOrderBtn.innerHTML = '<i class="fa-solid fa-spinner fa-spin"></i> Processing...';
 
     try {
-        const response = await fetch('/api/process-order/', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCSRFToken() },
-            body: JSON.stringify(orderData)
-        });
-        const data = await response.json();
+        const queued = queueOrder(orderData);
+        ordersAwaitingCashier.add(queued.idempotency_key);
+        let results, data;
+        try {
+            // A background flush already running may send this order; its result lands in orderResults too
+            results = await flushOrderQueue();
+            data = orderResults[queued.idempotency_key];
+            delete orderResults[queued.idempotency_key];
+        } finally {
+            ordersAwaitingCashier.delete(queued.idempotency_key);
+        }
+        reportQueuedOrderResults(results);
 
-        if (response.ok && data.success) {
+        if (!data) {
+            // Server slow or unreachable: the order stays queued and is sent in the background
+            showNotification('Server busy or offline. The order was saved and will be sent automatically.', 'info');
+            clearCart();
+            const currentCategory = document.getElementById('productsGrid').dataset.currentCategory || 'all';
+            showProductView(currentCategory);
+        } else if (data.success) {
             // Show Order Complete Modal instead of just notification
             showOrderCompleteModal(data.order_id, orderData.total, paymentMethod, data.receipt_html);
 
@@ -336,7 +336,7 @@ function renderProducts(products) {
                 <td>
                     <div class="product-info">
                         ${product.image_url ?
-                            `<img src="${product.image_url}" alt="${product.name}" class="product-thumb" onerror="this.src='${placeholderImageUrl}'; this.nextElementSibling.style.display='none';" />
+                            `<img src="${product.thumbnail_url || product.image_url}" alt="${product.name}" class="product-thumb" loading="lazy" onerror="this.src='${placeholderImageUrl}'; this.nextElementSibling.style.display='none';" />
                              <div class="product-thumb-placeholder" style="display:none;">No Image</div>` :
                             `<div class="product-thumb-placeholder">No Image</div>`
                         }
@@ -1,3 +1,1513 @@
-from django.test import TestCase
+import contextlib
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import unittest
+import warnings
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.http import HttpResponse
+from django.urls import reverse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from dejabrew import metrics
+from dejabrew.nplusone import NPlusOneError, NPlusOneWarning, detect_n_plus_one, fingerprint
+from dejabrew.slow_queries import SlowQueryMiddleware, threshold_ms
+from dejabrew.sqlite_backend import immediate_atomic
+from dejabrew.static_files import ProductImageWhiteNoiseMiddleware
+
+from forecasting.forecasting_service import load_live_db_data, load_trained_articles
+
+from .best_sellers import best_sellers, rebuild_item_sales, record_sales
+from .inventory_backfill import backfill_inventory_transactions, load_checkpoint, save_checkpoint
+from .ledger import (WEEKDAYS, ingredient_consumption, replay_ingredient, running_balances, stock_as_of, stock_deltas,
+                     take_inventory_snapshot)
+from .load_data import delete_load_data, explicit_timestamps, generate_load_data
+from .margins import backfill_unit_costs, orders_by_time
+from .order_import import import_orders
+from .product_images import HASHED_URL, image_dir, local_path
+from .receipt_archive import archive_dir, legacy_dir, segment_name
+from .models import (ArchivedReceipt, AuditTrail, Ingredient, Item, ItemDailySales, LiveEvent, Order, OrderItem, WastedLog,
+                     InventoryTransaction, InventorySnapshot, SlowQuery)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InventoryBackfillTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cashier = User.objects.create_user('cashier', password='x')
+        milk = Ingredient.objects.create(name='Milk', unit='ml', mainStock=1000, cost=Decimal('0.05'))
+        beans = Ingredient.objects.create(name='Beans', unit='g', mainStock=500, cost=Decimal('0.40'))
+        latte = Item.objects.create(name='Latte', price=Decimal('120'), recipe=[
+            {'ingredient': 'Milk', 'quantity': 150},
+            {'ingredient': 'Beans', 'quantity': 18},
+            {'ingredient': 'Vanilla', 'quantity': 5},  # not an ingredient
+        ])
+        cookie = Item.objects.create(name='Cookie', price=Decimal('60'), recipe=[])
+        for i in range(30):
+            order = Order.objects.create(total=Decimal('120'), status='paid' if i % 5 else 'pending',
+                                         cashier=cashier)
+            OrderItem.objects.create(order=order, item=latte, qty=1 + i % 3, price_at_order=latte.price)
+            OrderItem.objects.create(order=order, item=cookie, qty=1, price_at_order=cookie.price)
+        WastedLog.objects.create(ingredient=milk, ingredient_name='Milk', quantity=20, unit='ml',
+                                 cost_at_waste=Decimal('1.00'), user=cashier)
+        WastedLog.objects.create(ingredient=beans, ingredient_name='Beans', quantity=0, unit='g',
+                                 cost_at_waste=Decimal('0'), user=cashier)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.checkpoint = os.path.join(tmp.name, 'checkpoint.json')
+
+    def snapshot(self):
+        return sorted(InventoryTransaction.objects.values_list(
+            'ingredient_id', 'transaction_type', 'quantity', 'total_cost', 'reference', 'user_id', 'created_at'
+        ))
+
+    def test_full_run(self):
+        Order.objects.create(total=Decimal('0'), status='paid')  # No lines, so no rows
+        calls = []
+        stats = backfill_inventory_transactions(batch_size=7, checkpoint_path=self.checkpoint,
+                                                progress=lambda done, total: calls.append((done, total)))
+        self.assertEqual(stats['stock_out'], 24 * 2)  # 24 paid orders x (milk, beans)
+        self.assertEqual(stats['waste'], 2)
+        self.assertEqual(len(stats['errors']), 24)  # Vanilla, once per paid order
+        self.assertEqual(stats['error_count'], 24)
+        self.assertEqual(InventoryTransaction.objects.count(), 50)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertEqual(calls[0], (0, 24 + 2))
+        self.assertEqual(calls[-2], (26, 26))  # The last batch completes it, not just the final call
+
+        order = Order.objects.filter(status='paid', total__gt=0).first()
+        row = InventoryTransaction.objects.get(reference=f'Order-{order.id}', ingredient_name='Milk')
+        self.assertEqual(row.quantity, -150.0 * order.items.get(item__name='Latte').qty)
+        self.assertEqual(row.created_at, order.created_at)
+
+    def test_errors_past_the_cap_are_only_counted(self):
+        with mock.patch('pos.inventory_backfill.MAX_ERRORS', 5):
+            stats = backfill_inventory_transactions(batch_size=7)
+        self.assertEqual(len(stats['errors']), 5)
+        self.assertEqual(stats['error_count'], 24)
+
+    def test_resume_after_interruption(self):
+        backfill_inventory_transactions(batch_size=7)
+        expected = self.snapshot()
+        InventoryTransaction.objects.all().delete()
+
+        def interrupt(done, total):
+            if 0 < done < total:
+                raise Interrupted
+        with self.assertRaises(Interrupted):
+            backfill_inventory_transactions(batch_size=7, checkpoint_path=self.checkpoint, progress=interrupt)
+        partial = InventoryTransaction.objects.count()
+        self.assertTrue(0 < partial < len(expected))
+        self.assertEqual(load_checkpoint(self.checkpoint)['rows'], partial)
+
+        backfill_inventory_transactions(batch_size=7, checkpoint_path=self.checkpoint)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_resume_discards_batch_committed_without_checkpoint(self):
+        backfill_inventory_transactions(batch_size=7)
+        expected = self.snapshot()
+        paid = list(Order.objects.filter(status='paid').order_by('id').values_list('id', flat=True))
+
+        # Everything is written, but the checkpoint still says the batch
+        # ending at paid[5] was pending when the process died.
+        save_checkpoint(self.checkpoint, {'orders': paid[2], 'waste': 0, 'rows': 6,
+                                          'pending': {'phase': 'orders', 'until': paid[5]}})
+        InventoryTransaction.objects.filter(reference__in=[f'Order-{i}' for i in paid[6:]]).delete()
+        InventoryTransaction.objects.filter(transaction_type='WASTE').delete()
+
+        backfill_inventory_transactions(batch_size=7, checkpoint_path=self.checkpoint)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_resume_keeps_live_rows_of_pending_sources(self):
+        # A queued order of the pending range paid at the terminal, and a
+        # waste log recorded, both with the notes the live views write
+        milk = Ingredient.objects.get(name='Milk')
+        queued = Order.objects.filter(status='pending').order_by('id')[1]
+        queued.status = 'paid'
+        queued.save()
+        waste_log = WastedLog.objects.order_by('id').first()
+        InventoryTransaction.objects.create(ingredient=milk, ingredient_name='Milk', transaction_type='STOCK_OUT',
+                                            quantity=-150, unit='ml', notes='Used in order (recipe)',
+                                            reference=f'Order-{queued.id}')
+        after_row = InventoryTransaction.objects.create(
+            ingredient=milk, ingredient_name='Milk', transaction_type='WASTE', quantity=-20, unit='ml',
+            notes=f'Waste recorded: {waste_log.reason}', reference=f'WasteLog-{waste_log.id}',
+        ).id
+        backfill_inventory_transactions(batch_size=7)
+        expected = self.snapshot()
+        paid = list(Order.objects.filter(status='paid').order_by('id').values_list('id', flat=True))
+        self.assertLess(paid[2], queued.id)
+        self.assertLess(queued.id, paid[-1])
+
+        last_log = WastedLog.objects.order_by('id').last().id
+
+        # Without after_row (a checkpoint from before it was saved) only the notes tell them apart
+        for pending in ({'phase': 'orders', 'until': paid[-1]},
+                        {'phase': 'orders', 'until': paid[-1], 'after_row': after_row},
+                        {'phase': 'waste', 'until': last_log, 'after_row': after_row}):
+            orders_phase = pending['phase'] == 'orders'
+            save_checkpoint(self.checkpoint, {'orders': paid[2] if orders_phase else paid[-1],
+                                              'waste': last_log if orders_phase else 0, 'rows': 0,
+                                              'pending': pending})
+            backfill_inventory_transactions(batch_size=7, checkpoint_path=self.checkpoint)
+            self.assertEqual(self.snapshot(), expected, pending)
+
+
+class LedgerMathTests(SimpleTestCase):
+
+    def test_running_balances_match_forward_walk(self):
+        rng = np.random.default_rng(0)
+        deltas = rng.normal(0, 10, 1000)
+        opening = 500.0
+        walked = opening + np.cumsum(deltas)
+        np.testing.assert_allclose(running_balances(deltas, walked[-1]), walked)
+
+    def test_stock_deltas_per_type(self):
+        main, room = stock_deltas(
+            ['STOCK_OUT', 'WASTE', 'TRANSFER_TO_MAIN', 'TRANSFER_TO_ROOM', 'STOCK_IN', 'STOCK_IN', 'ADJUSTMENT'],
+            [-5, -1, 20, 8, 50, 30, -2],
+            ['', '', '', '', 'Added 50g to main stock', 'Added 30g to stock room',
+             'Manual adjustment: removed 2g from stock room'],
+        )
+        np.testing.assert_array_equal(main, [-5, -1, 20, -8, 50, 0, 0])
+        np.testing.assert_array_equal(room, [0, 0, -20, 8, 0, 30, -2])
+
+
+class LedgerReplayTests(TestCase):
+
+    def add(self, ingredient, when, transaction_type, quantity, notes=''):
+        return InventoryTransaction.objects.create(
+            ingredient=ingredient, ingredient_name=ingredient.name, transaction_type=transaction_type,
+            quantity=quantity, unit=ingredient.unit, notes=notes,
+            main_stock_after=ingredient.mainStock, stock_room_after=ingredient.stockRoom, created_at=when,
+        )
+
+    def test_replay_rewrites_balances(self):
+        milk = Ingredient.objects.create(name='Milk', unit='ml', mainStock=100, stockRoom=40)
+        start = timezone.now() - timedelta(days=3)
+        # Inserted out of order on purpose; replay goes by created_at
+        sale = self.add(milk, start + timedelta(hours=2), 'STOCK_OUT', -150)
+        restock = self.add(milk, start + timedelta(hours=1), 'STOCK_IN', 200, 'Added 200ml to main stock')
+        transfer = self.add(milk, start + timedelta(hours=3), 'TRANSFER_TO_MAIN', 60)
+        waste = self.add(milk, start + timedelta(hours=4), 'WASTE', -10)
+
+        result = replay_ingredient(milk, write=False)
+        self.assertEqual(result['rows'], 4)
+        self.assertEqual(result['corrected'], 3)  # only the last row already matched current stock
+        self.assertEqual(InventoryTransaction.objects.get(id=sale.id).main_stock_after, 100)  # untouched
+
+        result = replay_ingredient(milk)
+        balances = {t.id: (t.main_stock_after, t.stock_room_after)
+                    for t in InventoryTransaction.objects.filter(ingredient=milk)}
+        self.assertEqual(balances[restock.id], (200, 100))
+        self.assertEqual(balances[sale.id], (50, 100))
+        self.assertEqual(balances[transfer.id], (110, 40))
+        self.assertEqual(balances[waste.id], (100, 40))
+        self.assertEqual(result['negative'], [])
+        self.assertEqual(replay_ingredient(milk)['corrected'], 0)
+
+    def test_negative_balance_is_flagged(self):
+        beans = Ingredient.objects.create(name='Beans', unit='g', mainStock=5)
+        now = timezone.now()
+        early = self.add(beans, now - timedelta(hours=2), 'STOCK_OUT', -20)
+        self.add(beans, now - timedelta(hours=1), 'STOCK_IN', 10, 'Added 10g to main stock')
+
+        result = replay_ingredient(beans, write=False)
+        self.assertEqual([n['id'] for n in result['negative']], [early.id])
+        self.assertEqual(result['negative'][0]['main_stock_after'], -5)
+
+
+class PointInTimeStockTests(TestCase):
+
+    def setUp(self):
+        self.milk = Ingredient.objects.create(name='Milk', unit='ml', mainStock=100, stockRoom=40,
+                                              cost=Decimal('0.50'))
+        self.now = timezone.now()
+        self.day = lambda n: self.now - timedelta(days=n)
+        # Ledger ending at the current stock (main 100, room 40)
+        for days_ago, transaction_type, quantity, notes in [
+            (10, 'STOCK_IN', 310, 'Added 310ml to main stock'),
+            (8, 'STOCK_OUT', -120, ''),
+            (6, 'TRANSFER_TO_ROOM', 50, ''),
+            (4, 'STOCK_OUT', -30, ''),
+            (2, 'TRANSFER_TO_MAIN', 10, ''),
+            (1, 'ADJUSTMENT', -20, 'Manual adjustment: removed 20ml from stock room'),
+        ]:
+            InventoryTransaction.objects.create(
+                ingredient=self.milk, ingredient_name='Milk', transaction_type=transaction_type,
+                quantity=quantity, unit='ml', notes=notes, created_at=self.day(days_ago),
+            )
+        replay_ingredient(self.milk)
+        self.expected = {
+            t.created_at: (t.main_stock_after, t.stock_room_after)
+            for t in InventoryTransaction.objects.filter(ingredient=self.milk)
+        }
+
+    def assertStockAt(self, when):
+        expected = [v for t, v in sorted(self.expected.items()) if t <= when][-1]
+        row = stock_as_of(when)[self.milk.id]
+        self.assertAlmostEqual(row['main_stock'], expected[0])
+        self.assertAlmostEqual(row['stock_room'], expected[1])
+        self.assertEqual(row['valuation'], (Decimal(str(sum(expected))) * Decimal('0.50')).quantize(Decimal('0.01')))
+        return row
+
+    def test_without_snapshots_replays_back_from_current_stock(self):
+        for days_ago in (9, 7, 5, 3, 1.5, 0.5):
+            row = self.assertStockAt(self.day(days_ago))
+            self.assertIsNone(row['snapshot_taken_at'])
+
+    def test_nearest_snapshot_is_used(self):
+        take_inventory_snapshot(self.day(7))
+        self.assertEqual(InventorySnapshot.objects.get().main_stock, 170)
+
+        # Ledger rows before the snapshot no longer matter for nearby dates
+        InventoryTransaction.objects.filter(created_at__lt=self.day(9)).delete()
+        for days_ago in (7.5, 6.5, 5):
+            row = self.assertStockAt(self.day(days_ago))
+            self.assertEqual(row['snapshot_taken_at'], self.day(7))
+        self.assertIsNone(stock_as_of(self.day(0.5))[self.milk.id]['snapshot_taken_at'])
+
+    def test_ingredient_missing_from_snapshot_falls_back(self):
+        take_inventory_snapshot(self.day(7))
+        sugar = Ingredient.objects.create(name='Sugar', unit='g', mainStock=12)
+        stock = stock_as_of(self.day(6.5))
+        self.assertEqual(stock[sugar.id]['main_stock'], 12)
+        self.assertIsNone(stock[sugar.id]['snapshot_taken_at'])
+
+    def test_api_as_of(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        url = reverse('api_inventory_monitoring')
+        as_of = timezone.localdate(self.day(3)).isoformat()
+        self.assertEqual(self.client.get(url, {'as_of': as_of}).json()['as_of']['date'], as_of)
+        response = self.client.get(url, {'as_of': '2025-13-01'})
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'as_of must be YYYY-MM-DD'))
+
+
+class ConsumptionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', password='x')
+        self.today = timezone.localdate()
+        for days_ago, transaction_type, quantity in [
+            (0, 'STOCK_OUT', -70), (0, 'WASTE', -5), (1, 'STOCK_OUT', -140),
+            (3, 'STOCK_IN', 500), (10, 'STOCK_OUT', -700), (40, 'STOCK_OUT', -900),
+        ]:
+            self.move(days_ago, transaction_type, quantity)
+
+    def move(self, days_ago, transaction_type, quantity):
+        noon = datetime.combine(self.today - timedelta(days=days_ago), datetime.min.time()) + timedelta(hours=12)
+        InventoryTransaction.objects.create(ingredient_name='Milk', transaction_type=transaction_type,
+                                            quantity=quantity, unit='ml', created_at=timezone.make_aware(noon))
+
+    def test_sales_usage_per_window_and_weekday(self):
+        self.assertAlmostEqual(ingredient_consumption(7)['daily']['Milk'], 30)
+        self.assertAlmostEqual(ingredient_consumption(30)['daily']['Milk'], 910 / 30)
+
+        consumption = ingredient_consumption(7, by_weekday=True)
+        self.assertAlmostEqual(consumption['daily']['Milk'], 30)
+        expected = dict.fromkeys(WEEKDAYS, 0)
+        expected[WEEKDAYS[self.today.weekday()]] = 70
+        expected[WEEKDAYS[(self.today - timedelta(days=1)).weekday()]] = 140
+        self.assertEqual(consumption['weekday']['Milk'], expected)
+
+    def test_weekdays_in_one_query(self):
+        # The cache key's newest id and row count, then the usage itself
+        with self.assertNumQueries(3):
+            consumption = ingredient_consumption(90, by_weekday=True)
+        self.assertAlmostEqual(consumption['daily']['Milk'], 1810 / 90)
+        window = [self.today - timedelta(days=days_ago) for days_ago in range(90)]
+        expected = dict.fromkeys(WEEKDAYS, 0)
+        for days_ago, quantity in [(0, 70), (1, 140), (10, 700), (40, 900)]:
+            weekday = (self.today - timedelta(days=days_ago)).weekday()
+            expected[WEEKDAYS[weekday]] += quantity / sum(day.weekday() == weekday for day in window)
+        self.assertEqual(consumption['weekday']['Milk'].keys(), expected.keys())
+        for day, quantity in expected.items():
+            self.assertAlmostEqual(consumption['weekday']['Milk'][day], quantity)
+
+    def test_cached_until_the_next_movement(self):
+        ingredient_consumption(7)
+        with self.assertNumQueries(2):
+            self.assertAlmostEqual(ingredient_consumption(7)['daily']['Milk'], 30)
+        self.move(0, 'STOCK_OUT', -7)
+        self.assertAlmostEqual(ingredient_consumption(7)['daily']['Milk'], 31)
+        # Rows below the newest one going away count too
+        InventoryTransaction.objects.filter(quantity=-140).delete()
+        self.assertAlmostEqual(ingredient_consumption(7)['daily']['Milk'], 11)
+
+    def test_api(self):
+        self.client.force_login(self.admin)
+        url = reverse('api_inventory_consumption')
+        data = self.client.get(url, {'days': 90, 'by_weekday': 1}).json()
+        self.assertAlmostEqual(data['daily_consumption']['Milk'], 1810 / 90)
+        self.assertIn('Milk', data['weekday_consumption'])
+        self.assertNotIn('weekday_consumption', self.client.get(url).json())
+        self.assertEqual(self.client.get(url, {'days': 14}).status_code, 400)
+
+
+class ImmediateAtomicTests(TransactionTestCase):
+
+    def test_write_transactions_begin_immediate(self):
+        with CaptureQueriesContext(connection) as queries:
+            with immediate_atomic():
+                Ingredient.objects.create(name='Milk', unit='ml')
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+        self.assertIsNone(connection.begin_mode)
+
+    def test_decorator_and_nested_use(self):
+        @immediate_atomic
+        def add(name):
+            with immediate_atomic():
+                return Ingredient.objects.create(name=name, unit='g')
+
+        with CaptureQueriesContext(connection) as queries:
+            add('Beans')
+        sql = [q['sql'] for q in queries.captured_queries]
+        self.assertEqual(sql[0], 'BEGIN IMMEDIATE')
+        self.assertEqual(sql.count('BEGIN IMMEDIATE'), 1)  # the inner block is a savepoint
+        self.assertTrue(Ingredient.objects.filter(name='Beans').exists())
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every query the hot read paths issue and
+    fails if SQLite would read a whole sales table to answer it. Catalog
+    tables (items, ingredients, users) are small and may be scanned.
+    """
+    SALES_TABLES = ('pos_order', 'pos_orderitem', 'pos_audittrail', 'pos_wastedlog', 'pos_inventorytransaction',
+                    'pos_itemdailysales')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x')
+        cashier = User.objects.create_user('cashier', password='x')
+        latte = Item.objects.create(name='Latte', price=Decimal('120'), category='Coffee')
+        cookie = Item.objects.create(name='Cookie', price=Decimal('60'), category='Pastry')
+        for i in range(40):
+            order = Order.objects.create(total=Decimal('180'), status='paid' if i % 4 else 'pending',
+                                         cashier=cashier if i % 2 else cls.admin,
+                                         payment_method='Cash' if i % 3 else 'GCash')
+            OrderItem.objects.create(order=order, item=latte, qty=1, price_at_order=latte.price)
+            OrderItem.objects.create(order=order, item=cookie, qty=1, price_at_order=cookie.price)
+        AuditTrail.objects.create(user=cashier, action='Process Order', description='x', category='sales')
+        rebuild_item_sales()  # Orders created directly skip the best-seller totals
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def full_scans(self, queries):
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                if re.fullmatch(r'SELECT COUNT\(\*\) AS "__count" FROM "\w+"', sql.strip()):
+                    continue  # No WHERE: SQLite counts the smallest index's pages instead of reading rows
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    words = detail.split()
+                    if words[:1] == ['SCAN'] and words[1] in self.SALES_TABLES:
+                        scans.append(f'{detail}\n    in: {sql}')
+        return scans
+
+    def assertNoFullScans(self, queries):
+        self.assertTrue(queries.captured_queries)
+        scans = self.full_scans(queries.captured_queries)
+        self.assertFalse(scans, 'Full table scans:\n' + '\n'.join(scans))
+
+    def test_dashboard(self):
+        today = timezone.localdate().isoformat()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'), {'start_date': today, 'end_date': today})
+        self.assertEqual(response.status_code, 200)
+        self.assertNoFullScans(queries)
+
+    def test_sales_monitoring_api(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_sales_monitoring'), {'payment_method': 'cash'})
+        self.assertEqual(response.json()['summary']['total_orders'], 26)
+        self.assertNoFullScans(queries)
+
+    def test_best_selling_products_api(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('best_selling_products_api'))
+        self.assertEqual(response.json()['products'][0]['total_sold'], 30)
+        self.assertNoFullScans(queries)
+
+    def test_load_live_db_data(self):
+        with CaptureQueriesContext(connection) as queries:
+            df = load_live_db_data()
+        self.assertEqual(df['quantity'].sum(), 60)
+        self.assertNoFullScans(queries)
+
+    def test_margin_report_api(self):
+        for by in ('item', 'category', 'day'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('api_margins'), {'by': by})
+            self.assertEqual(response.json()['totals']['revenue'], 30 * 180, by)
+            self.assertNoFullScans(queries)
+
+    def test_inventory_consumption_api(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_inventory_consumption'), {'days': 7, 'by_weekday': 1})
+        self.assertTrue(response.json()['success'])
+        self.assertNoFullScans(queries)
+
+    def test_dashboard_sales_data(self):
+        for period in ('daily', 'weekly', 'monthly'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('dashboard_sales_data'), {'period': period})
+            self.assertEqual(sum(row['sales'] for row in response.json()['sales_data']), 30 * 180, period)
+            self.assertNoFullScans(queries)
+
+
+@override_settings(TIME_ZONE='Asia/Manila')
+class BusinessDateTests(TestCase):
+
+    def test_orders_get_the_local_date_and_hour(self):
+        late = datetime(2025, 11, 1, 16, 30, tzinfo=dt_timezone.utc)  # 00:30 on Nov 2 in Manila
+        with explicit_timestamps():
+            imported = Order.objects.bulk_create([Order(total=Decimal('10'), created_at=late)])[0]
+        created = Order.objects.create(total=Decimal('10'))
+        now = timezone.localtime()
+
+        self.assertEqual((imported.business_date, imported.business_hour), (date(2025, 11, 2), 0))
+        created.refresh_from_db()
+        self.assertEqual((created.business_date, created.business_hour), (now.date(), now.hour))
+        self.assertEqual(Order.objects.filter(business_date=date(2025, 11, 2)).get(), imported)
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(METRICS_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.admin = User.objects.create_superuser('admin', password='x')
+
+    def scrape(self, **extra):
+        response = self.client.get(reverse('metrics'), **extra)
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                series, value = line.rsplit(' ', 1)
+                samples[series] = float(value)
+        return samples
+
+    def test_request_and_sql_metrics_per_view(self):
+        before = self.scrape()
+        self.client.force_login(self.admin)
+        self.client.get(reverse('best_selling_products_api'))
+        after = self.scrape()
+
+        def delta(series):
+            return after.get(series, 0) - before.get(series, 0)
+
+        view = 'view="best_selling_products_api"'
+        self.assertEqual(delta(f'dejabrew_http_requests_total{{method="GET",status="200",{view}}}'), 1)
+        self.assertEqual(delta(f'dejabrew_http_request_duration_seconds_bucket{{le="+Inf",{view}}}'), 1)
+        self.assertEqual(delta(f'dejabrew_http_request_duration_seconds_count{{{view}}}'), 1)
+        self.assertGreaterEqual(delta(f'dejabrew_db_queries_total{{{view}}}'), 1)
+        self.assertGreater(delta(f'dejabrew_db_query_seconds_total{{{view}}}'), 0)
+
+    def test_cache_hits_and_misses(self):
+        before = self.scrape()
+        metrics.record_cache('model', hit=False)
+        metrics.record_cache('model', hit=True)
+        metrics.record_cache('model', hit=True)
+        after = self.scrape()
+        hits = 'dejabrew_forecast_cache_total{cache="model",result="hit"}'
+        misses = 'dejabrew_forecast_cache_total{cache="model",result="miss"}'
+        self.assertEqual(after[hits] - before.get(hits, 0), 2)
+        self.assertEqual(after[misses] - before.get(misses, 0), 1)
+
+    def test_workers_are_summed(self):
+        before = self.scrape()
+        other_worker = os.path.join(metrics.metrics_dir(), '999999.json')
+        with open(other_worker, 'w', encoding='utf-8') as f:
+            f.write('[["dejabrew_forecast_cache_total", {"cache": "json", "result": "hit"}, 5]]')
+        series = 'dejabrew_forecast_cache_total{cache="json",result="hit"}'
+        self.assertEqual(self.scrape()[series] - before.get(series, 0), 5)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_workers_start_from_zero(self):
+        before = self.scrape()
+        misses = 'dejabrew_forecast_cache_total{cache="warmup",result="miss"}'
+        metrics.record_cache('warmup', hit=False)  # The master warming up before the fork
+        metrics.flush()
+        for _ in range(2):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    metrics.reset()  # gunicorn's post_fork hook
+                    metrics.flush()
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+        self.assertEqual(self.scrape()[misses] - before.get(misses, 0), 1)
+
+    def test_reused_pid_keeps_the_dead_workers_counts(self):
+        before = self.scrape()
+        hits = 'dejabrew_forecast_cache_total{cache="model",result="hit"}'
+        metrics.record_cache('model', hit=True)
+        metrics.flush()
+        metrics.reset()  # A new worker with the same pid
+        metrics.record_cache('model', hit=True)
+        self.assertEqual(self.scrape()[hits] - before.get(hits, 0), 2)
+
+    def test_server_start_clears_the_last_runs_files(self):
+        metrics.flush()
+        dead_worker = os.path.join(metrics.metrics_dir(), '999999-1.json')
+        with open(dead_worker, 'w', encoding='utf-8') as f:
+            f.write('[]')
+        metrics.clear()  # gunicorn's when_ready hook
+        self.assertEqual(os.listdir(metrics.metrics_dir()), [])
+
+    def test_remote_clients_need_admin(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.8').status_code, 403)
+        self.client.force_login(self.admin)
+        self.scrape(REMOTE_ADDR='10.0.0.8')
+
+
+class QueryBudgetMixin:
+    """
+    SQL query and wall-time budgets for the hot endpoints, checked against
+    a seeded database of ITEMS menu items and ORDERS orders. The query
+    budgets are the same at every scale, so a query per row (an N+1)
+    fails the bigger scales.
+
+    The 1,000 item / 100,000 order scale takes a while to seed; set
+    DEJABREW_LARGE_QUERY_BUDGET=1 to run it.
+    """
+    ITEMS = ORDERS = 0
+    INGREDIENTS = 20
+    CART = 3  # distinct items per process_order call
+
+    # endpoint -> most queries it may run, whatever the data size
+    QUERY_BUDGET = dict(process_order=18, get_products_api=8, dashboard=11, inventory_monitoring_api=10,
+                        sales_monitoring_api=6, predict_api=9, order_details_api=9)
+    # endpoint -> seconds it may take at this scale
+    TIME_BUDGET = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x')
+        cashier = User.objects.create_user('cashier', password='x')
+
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'Ingredient {i}', unit='g', mainStock=10 ** 9, stockRoom=1000, reorder=10,
+                       cost=Decimal('0.25'))
+            for i in range(cls.INGREDIENTS)
+        ])
+        # Named after the trained articles (then "Latte 23" and so on) so predict_api has models to run
+        articles = load_trained_articles() or ['Item']
+        items = []
+        for i in range(cls.ITEMS):
+            name = articles[i % len(articles)] + (f' {i}' if i >= len(articles) else '')
+            recipe = [] if i % 5 == 4 else [
+                {'ingredient': f'Ingredient {(i + k) % cls.INGREDIENTS}', 'quantity': 5 + k} for k in range(3)
+            ]
+            items.append(Item(name=name, price=Decimal(100 + i % 50), category=f'Category {i % 6}',
+                              stock=10 ** 6 if not recipe else 0, recipe=recipe))
+        cls.items = Item.objects.bulk_create(items)
+
+        payment_methods = ['Cash', 'GCash', 'Card']
+        orders = Order.objects.bulk_create([
+            Order(total=Decimal('250'), status='pending' if i % 10 == 9 else 'paid',
+                  cashier=cashier if i % 3 else cls.admin, payment_method=payment_methods[i % 3])
+            for i in range(cls.ORDERS)
+        ], batch_size=5000)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, item=cls.items[(order.id * k) % cls.ITEMS], qty=1 + k, price_at_order=Decimal('125'))
+            for order in orders for k in (1, 2)
+        ], batch_size=5000)
+        # Spread the orders over the last 60 days (auto_now_add ignores a created_at passed in)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE pos_order SET created_at = datetime('now', '-' || (id % 60) || ' days', "
+                "'-' || (id % 600) || ' minutes')"
+            )
+        Order.objects.update(business_date=TruncDate('created_at'), business_hour=ExtractHour('created_at'))
+
+        ingredients = list(Ingredient.objects.all())
+        now = timezone.now()
+        InventoryTransaction.objects.bulk_create([
+            InventoryTransaction(
+                ingredient=ingredients[i % cls.INGREDIENTS], ingredient_name=ingredients[i % cls.INGREDIENTS].name,
+                transaction_type='WASTE' if i % 20 == 0 else 'STOCK_OUT', quantity=-5, unit='g',
+                cost_per_unit=Decimal('0.25'), total_cost=Decimal('1.25'), reference=f'Order-{i}', user=cashier,
+                created_at=now - timedelta(minutes=i * 43200 // max(cls.ORDERS, 1)),
+            )
+            for i in range(cls.ORDERS)
+        ], batch_size=5000)
+        cls.order_id = orders[len(orders) // 2].id
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        # Recording slow queries runs queries of its own
+        override = override_settings(SLOW_QUERY_MS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def assertWithinBudget(self, name, request):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries, detect_n_plus_one(label=name):
+            response = request()
+        elapsed = time.perf_counter() - start
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        self.assertLessEqual(
+            len(queries), self.QUERY_BUDGET[name],
+            f'{name} ran {len(queries)} queries at {self.ITEMS} items / {self.ORDERS} orders:\n'
+            + '\n'.join(q['sql'][:200] for q in queries.captured_queries)
+        )
+        self.assertLessEqual(elapsed, self.TIME_BUDGET[name],
+                             f'{name} took {elapsed:.2f}s at {self.ITEMS} items / {self.ORDERS} orders')
+        return response
+
+    def test_process_order(self):
+        recipe_items = [item for item in self.items if item.recipe][:self.CART - 1]
+        stock_item = next(item for item in self.items if not item.recipe)
+        cart = [{'id': item.id, 'quantity': 2} for item in recipe_items + [stock_item]]
+        with tempfile.TemporaryDirectory() as tmp, override_settings(BASE_DIR=tmp):
+            response = self.assertWithinBudget('process_order', lambda: self.client.post(
+                reverse('process_order'), json.dumps({'items': cart, 'payment_method': 'Cash'}),
+                content_type='application/json',
+            ))
+        self.assertTrue(response.json()['success'], response.json())
+
+    def test_get_products_api(self):
+        response = self.assertWithinBudget('get_products_api', lambda: self.client.get(reverse('get_products_api')))
+        self.assertEqual(len(response.json()['products']), self.ITEMS)
+
+    def test_dashboard(self):
+        today = timezone.localdate()
+        self.assertWithinBudget('dashboard', lambda: self.client.get(reverse('dashboard'), {
+            'start_date': (today - timedelta(days=30)).isoformat(), 'end_date': today.isoformat(),
+        }))
+
+    def test_inventory_monitoring_api(self):
+        response = self.assertWithinBudget('inventory_monitoring_api', lambda: self.client.get(
+            reverse('api_inventory_monitoring')
+        ))
+        self.assertEqual(len(response.json()['ingredient_summary']), self.INGREDIENTS)
+
+    def test_sales_monitoring_api(self):
+        self.assertWithinBudget('sales_monitoring_api', lambda: self.client.get(reverse('api_sales_monitoring')))
+
+    def test_predict_api(self):
+        response = self.assertWithinBudget('predict_api', lambda: self.client.get(
+            reverse('forecast_predict_api'), {'days': 7}
+        ))
+        self.assertTrue(response.json()['success'])
+
+    def test_order_details_api(self):
+        response = self.assertWithinBudget('order_details_api', lambda: self.client.get(
+            reverse('order_details_api', args=[self.order_id])
+        ))
+        self.assertEqual(len(response.json()['items']), 2)
+
+
+
+class SmallQueryBudgetTests(QueryBudgetMixin, TestCase):
+    ITEMS, ORDERS = 10, 1_000
+    TIME_BUDGET = dict(process_order=2, get_products_api=2, dashboard=2, inventory_monitoring_api=3,
+                       sales_monitoring_api=2, predict_api=15, order_details_api=1)
+
+
+class MediumQueryBudgetTests(QueryBudgetMixin, TestCase):
+    ITEMS, ORDERS = 100, 10_000
+    TIME_BUDGET = dict(process_order=2, get_products_api=2, dashboard=2, inventory_monitoring_api=5,
+                       sales_monitoring_api=4, predict_api=15, order_details_api=1)
+
+
+@unittest.skipUnless(os.environ.get('DEJABREW_LARGE_QUERY_BUDGET'), 'set DEJABREW_LARGE_QUERY_BUDGET=1 to run')
+class LargeQueryBudgetTests(QueryBudgetMixin, TestCase):
+    ITEMS, ORDERS = 1_000, 100_000
+    # The monitoring APIs return every row in the date range, so their time grows with it
+    TIME_BUDGET = dict(process_order=2, get_products_api=3, dashboard=3, inventory_monitoring_api=30,
+                       sales_monitoring_api=12, predict_api=40, order_details_api=1)
+
+
+class NPlusOneDetectorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x')
+        cls.items = [Item.objects.create(name=f'Item {i}', price=Decimal('50')) for i in range(8)]
+        order = Order.objects.create(total=Decimal('400'), status='paid')
+        for item in cls.items:
+            OrderItem.objects.create(order=order, item=item, qty=1, price_at_order=item.price)
+        for i in range(8):
+            user = User.objects.create_user(f'cashier{i}', password='x')
+            AuditTrail.objects.create(user=user, action='Login', description='x', category='auth')
+
+    def test_fingerprint_ignores_in_list_length(self):
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+                         fingerprint('SELECT  *  FROM t WHERE id IN (%s)'))
+
+    def test_reports_repeated_query_and_its_origin(self):
+        with self.assertRaises(NPlusOneError) as raised:
+            with detect_n_plus_one(threshold=3):
+                for item in self.items:
+                    Item.objects.get(id=item.id)
+        report = str(raised.exception)
+        self.assertIn('8x from pos/tests.py:', report)  # the loop's line
+        self.assertIn('Item.objects.get(id=item.id)', report)
+
+        with detect_n_plus_one(threshold=3):
+            list(Item.objects.filter(id__in=[item.id for item in self.items]))
+
+    def test_warn_mode(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            with detect_n_plus_one(threshold=3, mode='warn'):
+                for item in self.items:
+                    Item.objects.get(id=item.id)
+        self.assertEqual([w.category for w in caught], [NPlusOneWarning])
+
+    @override_settings(NPLUSONE_DETECTION='raise', NPLUSONE_THRESHOLD=3)
+    def test_middleware_checks_views(self):
+        self.client.force_login(self.admin)
+        for name in ('audit_logs_api', 'best_selling_products_api', 'get_products_api'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 200, name)
+
+
+class SlowQueryLogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x')
+        for i in range(3):
+            Order.objects.create(total=Decimal('100'), status='paid')
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.log_file = os.path.join(tmp.name, 'logs', 'slow.log')
+        # Every statement counts as slow
+        self.override = override_settings(SLOW_QUERY_MS=0.000001, SLOW_QUERY_LOG_FILE=self.log_file)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.addCleanup(lambda: [h.close() for h in logging.getLogger('dejabrew.slow_queries').handlers])
+
+    def test_slow_queries_are_logged_and_aggregated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                list(Order.objects.filter(status='paid').order_by('-created_at'))
+
+        row = SlowQuery.objects.get(sql__contains='"pos_order"."status" = %s')
+        self.assertEqual(row.count, 2)
+        self.assertGreater(row.total_ms, 0)
+        self.assertGreaterEqual(row.total_ms, row.max_ms)
+        self.assertIn('idx', row.plan.lower())  # the status/-created_at index
+        self.assertTrue(row.origin.startswith('pos/tests.py:'), row.origin)
+        self.assertIn("'paid'", row.params)
+
+        with open(self.log_file, encoding='utf-8') as f:
+            log = f.read()
+        self.assertIn('"pos_order"."status" = %s', log)
+        self.assertIn('plan:', log)
+
+    def test_entries_name_the_view(self):
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.get(reverse('audit_logs_api')).status_code, 200)
+        self.assertTrue(SlowQuery.objects.filter(view='audit_logs_api').exists())
+
+    def test_requests_save_entries_after_the_view(self):
+        class RolledBack(Exception):
+            pass
+
+        def view(request):
+            try:
+                with immediate_atomic():
+                    list(Order.objects.filter(status='paid'))
+                    raise RolledBack
+            except RolledBack:
+                pass
+            # Nothing is written to the table while the view runs
+            self.assertFalse(SlowQuery.objects.exists())
+            return HttpResponse('ok')
+
+        SlowQueryMiddleware(view)(RequestFactory().get('/'))
+        self.assertTrue(SlowQuery.objects.filter(sql__contains='"pos_order"."status" = %s').exists())
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_disabled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            list(Order.objects.all())
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_test_runs_leave_the_log_off(self):
+        self.override.disable()  # Back to what the test runner set
+        try:
+            self.assertEqual(threshold_ms(), 0)
+        finally:
+            self.override.enable()
+
+
+class BestSellerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x')
+        cls.latte = Item.objects.create(name='Latte', price=Decimal('120'), stock=100, image_url='latte.png',
+                                        recipe=[{'ingredient': 'Milk', 'quantity': 200}])
+        cls.muffin = Item.objects.create(name='Muffin', price=Decimal('70'), stock=100)
+        cls.cookie = Item.objects.create(name='Cookie', price=Decimal('50'), stock=100)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        tmp = tempfile.TemporaryDirectory()  # Receipts are written under BASE_DIR
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(BASE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def sell(self, item, quantity):
+        response = self.client.post(reverse('process_order'), json.dumps({
+            'items': [{'id': item.id, 'quantity': quantity}], 'payment_method': 'Cash',
+        }), content_type='application/json')
+        self.assertTrue(response.json()['success'], response.content[:300])
+        return response.json()['order_id']
+
+    def ranking(self, window=None):
+        response = self.client.get(reverse('best_selling_products_api'), {'window': window} if window else {})
+        return [(p['name'], p['total_sold']) for p in response.json()['products']]
+
+    def test_windows_rank_from_the_daily_totals(self):
+        self.sell(self.latte, 2)
+        self.sell(self.muffin, 1)
+        today = timezone.localdate()
+        record_sales([(self.muffin.id, today - timedelta(days=10), 3), (self.cookie.id, today - timedelta(days=40), 9)])
+
+        self.assertEqual(self.ranking('7d'), [('Latte', 2), ('Muffin', 1)])
+        self.assertEqual(self.ranking('30d'), [('Muffin', 4), ('Latte', 2)])
+        self.assertEqual(self.ranking(), [('Cookie', 9), ('Muffin', 4), ('Latte', 2)])
+
+        with self.assertNumQueries(1):
+            top = list(best_sellers('30d'))
+        self.assertEqual((top[1].recipe, top[1].image_url), (self.latte.recipe, 'latte.png'))
+        self.assertEqual(self.client.get(reverse('best_selling_products_api'), {'window': '1y'}).status_code, 400)
+
+    def test_edited_and_deleted_orders_leave_the_totals(self):
+        first = self.sell(self.latte, 2)
+        second = self.sell(self.latte, 3)
+        self.client.patch(f'/api/orders/{first}/', json.dumps({'status': 'cancelled'}),
+                          content_type='application/json')
+        self.assertEqual(self.ranking(), [('Latte', 3)])
+        self.client.delete(f'/api/orders/{second}/')
+        self.assertEqual(self.ranking(), [])
+
+        # A rebuild from the orders agrees with the incremental totals
+        self.sell(self.muffin, 4)
+        self.assertTotalsMatchRebuild()
+
+    def assertTotalsMatchRebuild(self):
+        before = list(ItemDailySales.objects.values_list('item', 'day', 'quantity').order_by('item'))
+        rebuild_item_sales()
+        self.assertEqual(list(ItemDailySales.objects.filter(quantity__gt=0)
+                              .values_list('item', 'day', 'quantity').order_by('item')),
+                         [row for row in before if row[2]])
+
+    def test_admin_changes_leave_the_totals(self):
+        first, second, third = self.sell(self.latte, 2), self.sell(self.muffin, 3), self.sell(self.cookie, 1)
+        changelist = reverse('admin:pos_order_changelist')
+
+        self.client.post(changelist, {'action': 'mark_as_cancelled', '_selected_action': [first, second]})
+        self.assertEqual(self.ranking(), [('Cookie', 1)])
+        self.client.post(changelist, {'action': 'mark_as_paid', '_selected_action': [first]})
+        self.assertEqual(self.ranking(), [('Latte', 2), ('Cookie', 1)])
+
+        # The change form, with the quantity of a line edited in its inline
+        order = Order.objects.get(pk=first)
+        line = order.items.get()
+        response = self.client.post(reverse('admin:pos_order_change', args=[first]), {
+            'total': order.total, 'status': 'paid', 'cashier': self.admin.id, 'customer_name': '',
+            'dining_option': order.dining_option, 'payment_method': order.payment_method,
+            'items-TOTAL_FORMS': 1, 'items-INITIAL_FORMS': 1, 'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+            'items-0-id': line.id, 'items-0-order': first, 'items-0-item': self.latte.id, 'items-0-qty': 5,
+        })
+        self.assertEqual(response.status_code, 302, response.content[:2000])
+        self.assertEqual(self.ranking(), [('Latte', 5), ('Cookie', 1)])
+
+        self.client.post(reverse('admin:pos_order_delete', args=[first]), {'post': 'yes'})
+        self.client.post(changelist, {'action': 'delete_selected', '_selected_action': [third], 'post': 'yes'})
+        self.assertEqual(self.ranking(), [])
+        self.assertTotalsMatchRebuild()
+
+
+class ProductImageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        tmp = tempfile.TemporaryDirectory()  # Images are written under BASE_DIR
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(BASE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def photo(self, name='Latte Art.jpg', size=(2400, 1600)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (120, 80, 40)).save(buffer, 'JPEG', quality=95)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_uploads_become_hashed_webp_derivatives(self):
+        response = self.client.post(reverse('create_product'), {
+            'name': 'Latte', 'price': '120', 'stock': '10', 'image_file': self.photo(),
+        })
+        self.assertTrue(response.json()['success'], response.content[:300])
+        item = Item.objects.get(name='Latte')
+        for url, longest in ((item.image_url, 1200), (item.thumbnail_url, 400)):
+            self.assertRegex(url, HASHED_URL)
+            self.assertTrue(url.startswith('/static/pos/img/products/LatteArt.'))
+            with Image.open(local_path(url)) as image:
+                self.assertEqual((image.format, max(image.size)), ('WEBP', longest))
+
+        # The same photo again reuses the files
+        response = self.client.post(reverse('update_product', args=[item.id]), {'image_file': self.photo()})
+        self.assertTrue(response.json()['success'], response.content[:300])
+        self.assertEqual(len(os.listdir(os.path.join(image_dir(), 'products'))), 2)
+
+        response = self.client.post(reverse('update_product', args=[item.id]), {'image_url': 'https://cdn/x.png'})
+        item.refresh_from_db()
+        self.assertEqual((item.image_url, item.thumbnail_url), ('https://cdn/x.png', ''))
+
+    def test_unreadable_uploads_are_bad_requests(self):
+        def not_an_image():
+            return SimpleUploadedFile('latte.jpg', b'not a photo', content_type='image/jpeg')
+
+        response = self.client.post(reverse('create_product'), {
+            'name': 'Latte', 'price': '120', 'stock': '10', 'image_file': not_an_image(),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Not a readable image', response.json()['error'])
+        self.assertFalse(Item.objects.filter(name='Latte').exists())
+
+        item = Item.objects.create(name='Mocha', price=Decimal('130'), image_url='mocha.png')
+        response = self.client.post(reverse('update_product', args=[item.id]), {'image_file': not_an_image()})
+        self.assertEqual(response.status_code, 400)
+        item.refresh_from_db()
+        self.assertEqual(item.image_url, 'mocha.png')
+
+    def test_hashed_images_are_cached_for_good(self):
+        middleware = ProductImageWhiteNoiseMiddleware(lambda request: None)
+        self.assertTrue(middleware.immutable_file_test('', '/static/pos/img/products/latte.0123456789ab.webp'))
+        self.assertFalse(middleware.immutable_file_test('', '/static/pos/img/latte.webp'))
+
+    def test_command_converts_existing_images(self):
+        os.makedirs(image_dir())
+        Image.new('RGB', (1000, 1000), 'white').save(os.path.join(image_dir(), 'muffin.png'))
+        muffin = Item.objects.create(name='Muffin', price=Decimal('70'), image_url='/static/pos/img/muffin.png')
+        remote = Item.objects.create(name='Cookie', price=Decimal('50'), image_url='https://cdn/cookie.png')
+
+        call_command('build_product_images', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(Item.objects.get(id=muffin.id).thumbnail_url, '')
+        call_command('build_product_images', stdout=io.StringIO())
+        muffin.refresh_from_db()
+        self.assertRegex(muffin.thumbnail_url, HASHED_URL)
+        self.assertRegex(muffin.image_url, HASHED_URL)
+        self.assertEqual(Item.objects.get(id=remote.id).image_url, 'https://cdn/cookie.png')
+        self.assertTrue(os.path.exists(os.path.join(image_dir(), 'muffin.png')))
+
+
+class MarginTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x')
+        cls.milk = Ingredient.objects.create(name='Milk', unit='ml', mainStock=10000, cost=Decimal('0.10'))
+        Ingredient.objects.create(name='Beans', unit='g', mainStock=10000, cost=Decimal('2.00'))
+        recipe = [{'ingredient': 'Milk', 'quantity': 200}, {'ingredient': 'Beans', 'quantity': 18}]
+        cls.latte = Item.objects.create(name='Latte', category='Drinks', price=Decimal('120'), recipe=recipe)
+        cls.promo = Item.objects.create(name='Promo Latte', category='Drinks', price=Decimal('150'), recipe=recipe,
+                                        is_buy1take1=True)
+        cls.muffin = Item.objects.create(name='Muffin', category='Pastry', price=Decimal('70'), stock=10)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        tmp = tempfile.TemporaryDirectory()  # Receipts are written under BASE_DIR
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(BASE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def report(self, by):
+        response = self.client.get(reverse('api_margins'), {'by': by})
+        self.assertEqual(response.status_code, 200, response.content[:300])
+        return response.json()
+
+    def test_costs_are_kept_from_the_time_of_sale(self):
+        response = self.client.post(reverse('process_order'), json.dumps({
+            'items': [{'id': self.latte.id, 'quantity': 2}, {'id': self.promo.id, 'quantity': 1},
+                      {'id': self.muffin.id, 'quantity': 1}],
+            'payment_method': 'Cash',
+        }), content_type='application/json')
+        self.assertTrue(response.json()['success'], response.content[:300])
+        costs = dict(OrderItem.objects.values_list('item__name', 'unit_cost'))
+        self.assertEqual(costs, {'Latte': Decimal('56'), 'Promo Latte': Decimal('112'), 'Muffin': None})
+
+        Ingredient.objects.filter(id=self.milk.id).update(cost=Decimal('0.50'))  # Doesn't change past sales
+        by_item = {row['name']: row for row in self.report('item')['rows']}
+        self.assertEqual((by_item['Latte']['revenue'], by_item['Latte']['cost'], by_item['Latte']['gross_margin']),
+                         (240.0, 112.0, 128.0))
+        self.assertEqual((by_item['Muffin']['uncosted_revenue'], by_item['Muffin']['margin_percent']), (70.0, None))
+
+        self.assertEqual([(row['category'], row['gross_margin']) for row in self.report('category')['rows']],
+                         [('Drinks', 166.0), ('Pastry', 0.0)])
+        by_day = self.report('day')
+        self.assertEqual([row['day'] for row in by_day['rows']], [timezone.localdate().isoformat()])
+        self.assertEqual(by_day['totals']['margin_percent'], round(166 / 390 * 100, 2))
+        self.assertEqual(self.client.get(reverse('api_margins'), {'by': 'hour'}).status_code, 400)
+
+    def test_backfill_prices_past_lines_from_the_ledger(self):
+        order = Order.objects.create(total=Decimal('240'), status='paid')
+        line = OrderItem.objects.create(order=order, item=self.latte, qty=2, price_at_order=Decimal('120'))
+        InventoryTransaction.objects.create(
+            ingredient=self.milk, ingredient_name='Milk', transaction_type='STOCK_OUT', quantity=-400, unit='ml',
+            cost_per_unit=Decimal('0.05'), total_cost=Decimal('20'), reference=f'Order-{order.id}',
+        )
+        stock_line = OrderItem.objects.create(order=order, item=self.muffin, qty=1, price_at_order=Decimal('70'))
+
+        call_command('backfill_unit_costs', stdout=io.StringIO())
+        line.refresh_from_db()
+        stock_line.refresh_from_db()
+        self.assertEqual(line.unit_cost, Decimal('46'))  # 200 ml at the sale's 0.05 + 18 g at today's 2.00
+        self.assertIsNone(stock_line.unit_cost)
+
+    def test_backfill_batches_follow_order_time(self):
+        recent = [Order.objects.create(total=Decimal('120'), status='paid') for _ in range(3)]
+        imported = [Order.objects.create(total=Decimal('120'), status='paid') for _ in range(4)]
+        noon = timezone.make_aware(datetime(2024, 3, 1, 12))
+        Order.objects.filter(id__in=[o.id for o in imported[:3]]).update(created_at=noon)  # Same timestamp
+        Order.objects.filter(id=imported[3].id).update(created_at=noon - timedelta(days=1))
+
+        batches = list(orders_by_time(2))
+        expected = list(Order.objects.order_by('-created_at', 'id').values_list('id', 'created_at'))
+        self.assertEqual([order for batch in batches for order in batch], expected)
+        # Newest first, so the imported orders (high ids, old dates) come last, ties by id
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2, 1])
+        self.assertEqual([order_id for order_id, _ in expected[3:]], [o.id for o in imported])
+
+        for order in recent + imported:
+            OrderItem.objects.create(order=order, item=self.latte, qty=1, price_at_order=Decimal('120'))
+        stats = backfill_unit_costs(batch_size=2, log=lambda m: None)
+        self.assertEqual(stats['costed'], 7)
+        self.assertFalse(OrderItem.objects.filter(unit_cost__isnull=True).exists())
+
+    def test_imported_lines_cost_the_same_as_sold_ones(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'orders.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'order_id': 1, 'created_at': '2024-03-01',
+                                'items': [{'item': 'Latte', 'qty': 1}, {'item': 'Promo Latte', 'qty': 1}]}))
+        import_orders(path, log=lambda m: None)
+        expected = {'Latte': Decimal('56'), 'Promo Latte': Decimal('112')}
+        self.assertEqual(dict(OrderItem.objects.values_list('item__name', 'unit_cost')), expected)
+
+        # Recomputing them gives the same costs
+        call_command('backfill_unit_costs', '--force', stdout=io.StringIO())
+        self.assertEqual(dict(OrderItem.objects.values_list('item__name', 'unit_cost')), expected)
+
+
+class LoadDataTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.create(name='Espresso Shots', unit='ml', mainStock=1000, cost=Decimal('2'))
+        Ingredient.objects.create(name='Fresh Milk', unit='L', mainStock=50, cost=Decimal('90'),
+                                  ingredient_type='perishable')
+        Ingredient.objects.create(name='Cocoa', unit='g', mainStock=500, cost=Decimal('1'))
+
+    def generate(self):
+        stats = generate_load_data(orders=400, days=14, cashiers=3, items=12, seed=7, batch_size=150, log=lambda m: None)
+        orders = list(Order.objects.filter(cashier__username__startswith='loadgen_')
+                      .order_by('created_at', 'id').values_list('created_at', 'total', 'status', 'cashier__username'))
+        return stats, orders
+
+    def test_generates_seasonal_history_with_ledger_and_audit_rows(self):
+        stats, orders = self.generate()
+        self.assertEqual(stats['orders'], 400)
+        self.assertEqual(len(orders), 400)
+        self.assertEqual(OrderItem.objects.filter(order__cashier__username__startswith='loadgen_').count(),
+                         stats['order_items'])
+        self.assertEqual(Item.objects.count(), 12)
+        ingredient_names = set(Ingredient.objects.values_list('name', flat=True))
+        for item in Item.objects.all():
+            self.assertTrue({line['ingredient'] for line in item.recipe} <= ingredient_names, item.recipe)
+
+        self.assertEqual(InventoryTransaction.objects.filter(transaction_type='STOCK_OUT').count(), stats['stock_out'])
+        self.assertGreater(stats['stock_out'], 0)
+        self.assertEqual(WastedLog.objects.count(), stats['waste'])
+        self.assertEqual(InventoryTransaction.objects.filter(transaction_type='WASTE').count(), stats['waste'])
+        self.assertEqual(AuditTrail.objects.filter(action='Process Order').count(), 400)
+        self.assertEqual(AuditTrail.objects.filter(action='Login').count(), 14 * 2)
+        self.assertEqual(ItemDailySales.objects.aggregate(n=Sum('quantity'))['n'],
+                         OrderItem.objects.filter(order__status='paid').aggregate(n=Sum('qty'))['n'])
+
+        # Kept their historical timestamps, all within opening hours of the last 14 days
+        today = timezone.localdate()
+        local = [timezone.localtime(created_at) for created_at, *_ in orders]
+        self.assertTrue(all(today - timedelta(days=14) <= t.date() < today for t in local))
+        self.assertTrue(all(7 <= t.hour < 21 for t in local))
+        self.assertEqual(AuditTrail.objects.filter(timestamp__date=today).count(), 0)
+        self.assertTrue(Order._meta.get_field('created_at').auto_now_add)
+
+    def test_same_seed_same_rows(self):
+        first = self.generate()[1]
+        self.assertGreater(delete_load_data(), 0)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.generate()[1], first)
+
+
+class OrderImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('maria', password='x')
+        cls.milk = Ingredient.objects.create(name='Milk', unit='ml', mainStock=1000, cost=Decimal('0.10'))
+        cls.latte = Item.objects.create(name='Latte', price=Decimal('120'),
+                                        recipe=[{'ingredient': 'Milk', 'quantity': 200}])
+        cls.muffin = Item.objects.create(name='Muffin', price=Decimal('70'), stock=3)
+
+    def write(self, name, text):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_csv_with_ledger_keeps_timestamps_and_skips_reimports(self):
+        path = self.write('orders.csv', (
+            'order_id,created_at,item,qty,price,cashier,payment_method,status\n'
+            'A-1,2024-03-01 08:15:00,latte,2,,maria,GCash,paid\n'
+            f'A-1,2024-03-01 08:15:00,{self.muffin.id},1,65,maria,GCash,paid\n'
+            'A-2,2024-03-02T09:00:00+08:00,Latte,1,,,Cash,cancelled\n'
+        ))
+        stats = import_orders(path, ledger=True, batch_size=1, log=lambda m: None)
+        self.assertEqual((stats['orders'], stats['order_items'], stats['failed']), (2, 3, 0))
+
+        first = Order.objects.get(idempotency_key='import:A-1')
+        self.assertEqual(first.total, Decimal('305.00'))
+        self.assertEqual(first.cashier, self.cashier)
+        self.assertEqual(first.payment_method, 'GCash')
+        self.assertEqual(timezone.localtime(first.created_at).strftime('%Y-%m-%d %H:%M'), '2024-03-01 08:15')
+        self.assertEqual(sorted(first.items.values_list('price_at_order', flat=True)),
+                         [Decimal('65'), Decimal('120')])
+
+        # Only the paid order uses stock, and current stock is left alone
+        rows = InventoryTransaction.objects.filter(transaction_type='STOCK_OUT')
+        self.assertEqual([(r.reference, r.quantity, r.created_at) for r in rows],
+                         [(f'Order-{first.id}', -400, first.created_at)])
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.mainStock, 1000)
+
+        again = import_orders(path, ledger=True, log=lambda m: None)
+        self.assertEqual((again['orders'], again['skipped']), (0, 2))
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertTrue(Order._meta.get_field('created_at').auto_now_add)
+
+    def test_jsonl_reports_bad_orders_and_imports_the_rest(self):
+        path = self.write('orders.jsonl', '\n'.join([
+            json.dumps({'order_id': 1, 'created_at': '2024-03-01', 'discount': 10,
+                        'items': [{'item': 'Latte', 'qty': 1}]}),
+            json.dumps({'order_id': 2, 'created_at': '2024-03-01', 'items': [{'item': 'Mocha', 'qty': 1}]}),
+            json.dumps({'order_id': 3, 'created_at': 'yesterday', 'items': [{'item': 'Latte', 'qty': 1}]}),
+            '{not json',
+            json.dumps({'order_id': 1, 'created_at': '2024-03-01', 'items': [{'item': 'Latte', 'qty': 1}]}),
+        ]))
+        stats = import_orders(path, source='oldpos', log=lambda m: None)
+        self.assertEqual((stats['orders'], stats['failed']), (1, 4))
+        self.assertEqual([error.split(':')[0] for error in stats['errors']], ['line 2', 'line 3', 'line 4', 'line 5'])
+        self.assertIn("unknown item 'Mocha'", stats['errors'][0])
+        order = Order.objects.get(idempotency_key='oldpos:1')
+        self.assertEqual(order.total, Decimal('108.00'))
+        self.assertFalse(InventoryTransaction.objects.exists())
+
+    def test_non_finite_numbers_fail_their_line(self):
+        path = self.write('orders.jsonl', '\n'.join([
+            json.dumps({'order_id': 1, 'created_at': '2024-03-01', 'items': [{'item': 'Latte', 'qty': 'Infinity'}]}),
+            json.dumps({'order_id': 2, 'created_at': '2024-03-01', 'items': [{'item': 'Latte', 'qty': 1, 'price': 'NaN'}]}),
+            json.dumps({'order_id': 3, 'created_at': '2024-03-01', 'discount': '-Infinity',
+                        'items': [{'item': 'Latte', 'qty': 1}]}),
+            json.dumps({'order_id': 4, 'created_at': '2024-03-01', 'items': [{'item': 'Latte', 'qty': 1}]}),
+        ]))
+        stats = import_orders(path, log=lambda m: None)
+        self.assertEqual((stats['orders'], stats['failed']), (1, 3))
+        self.assertEqual([error.split(':')[0] for error in stats['errors']], ['line 1', 'line 2', 'line 3'])
+
+
+class ProcessOrderBatchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='x')
+        cls.milk = Ingredient.objects.create(name='Milk', unit='ml', mainStock=1000, cost=Decimal('0.10'))
+        cls.latte = Item.objects.create(name='Latte', price=Decimal('120'),
+                                        recipe=[{'ingredient': 'Milk', 'quantity': 200}])
+        cls.muffin = Item.objects.create(name='Muffin', price=Decimal('70'), stock=3)
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+        tmp = tempfile.TemporaryDirectory()  # Receipts are written under BASE_DIR
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(BASE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def order(self, key, item, quantity=1, **extra):
+        return {'idempotency_key': key, 'items': [{'id': item.id, 'quantity': quantity}],
+                'payment_method': 'Cash', 'dining_option': 'take-out', **extra}
+
+    def submit(self, *orders):
+        response = self.client.post(reverse('process_order_batch'), json.dumps({'orders': list(orders)}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.json()
+
+    def test_broken_recipe_is_a_permanent_failure(self):
+        broken = Item.objects.create(name='Mocha', price=Decimal('130'),
+                                     recipe=[{'ingredient': 'Milk', 'quantity': '200'}])
+        results = self.submit(self.order('k-broken', broken), self.order('k-ok', self.muffin))['results']
+        # Not 5xx, so the terminal takes it out of its queue instead of sending it again
+        self.assertEqual([(r['status'], r['success']) for r in results], [(422, False), (200, True)])
+
+    def test_replayed_batch_is_not_charged_twice(self):
+        batch = [self.order('key-1', self.latte, 2), self.order('key-2', self.muffin)]
+        first = self.submit(*batch)
+        self.assertEqual([r['idempotency_key'] for r in first['results']], ['key-1', 'key-2'])
+        self.assertTrue(all(r['success'] and not r.get('duplicate') for r in first['results']))
+        self.assertEqual(first['processed'], 2)
+
+        again = self.submit(*batch)  # e.g. the first response never reached the terminal
+        self.assertEqual(again['duplicates'], 2)
+        self.assertEqual([r['order_id'] for r in again['results']], [r['order_id'] for r in first['results']])
+
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(InventoryTransaction.objects.filter(transaction_type='STOCK_OUT').count(), 1)
+        self.milk.refresh_from_db()
+        self.muffin.refresh_from_db()
+        self.assertEqual(self.milk.mainStock, 600)
+        self.assertEqual(self.muffin.stock, 2)
+
+        # The single-order endpoint honours the same keys
+        response = self.client.post(reverse('process_order'), json.dumps(self.order('key-1', self.latte, 2)),
+                                    content_type='application/json')
+        self.assertTrue(response.json()['duplicate'])
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_failed_order_does_not_undo_the_rest(self):
+        result = self.submit(
+            self.order('ok-1', self.latte),
+            self.order('too-many', self.muffin, 5),
+            {'items': [{'id': self.latte.id, 'quantity': 1}]},  # No key
+            self.order('ok-2', self.muffin),
+        )
+        self.assertEqual([(r['success'], r['status']) for r in result['results']],
+                         [(True, 200), (False, 400), (False, 400), (True, 200)])
+        self.assertIn('Insufficient product stock', result['results'][1]['error'])
+        self.assertEqual(set(Order.objects.values_list('idempotency_key', flat=True)), {'ok-1', 'ok-2'})
+        self.muffin.refresh_from_db()
+        self.assertEqual(self.muffin.stock, 2)
+
+        retried = self.submit(self.order('too-many', self.muffin, 2))  # A failed key isn't burnt
+        self.assertTrue(retried['results'][0]['success'])
+
+    def test_keeps_plausible_sale_time(self):
+        sold_at = timezone.now() - timedelta(hours=2)
+        result = self.submit(self.order('then', self.muffin, queued_at=sold_at.isoformat()),
+                             self.order('future', self.muffin, queued_at=(timezone.now() + timedelta(days=3)).isoformat()))
+        then, future = (Order.objects.get(id=r['order_id']) for r in result['results'])
+        self.assertEqual(then.created_at, sold_at)
+        self.assertEqual((then.business_date, then.business_hour),
+                         (timezone.localdate(sold_at), timezone.localtime(sold_at).hour))
+        self.assertLess(abs(future.created_at - timezone.now()), timedelta(minutes=1))
+
+    def test_rejects_bad_batches(self):
+        url = reverse('process_order_batch')
+        self.assertEqual(self.client.post(url, json.dumps({'orders': []}),
+                                          content_type='application/json').status_code, 400)
+        too_many = [self.order(f'k{i}', self.muffin) for i in range(51)]
+        self.assertEqual(self.client.post(url, json.dumps({'orders': too_many}),
+                                          content_type='application/json').status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class ReceiptArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x')
+        cls.muffin = Item.objects.create(name='Muffin', price=Decimal('70'), stock=10)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        tmp = tempfile.TemporaryDirectory()  # Receipts are written under BASE_DIR
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(BASE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def sell(self):
+        response = self.client.post(reverse('process_order'), json.dumps({
+            'items': [{'id': self.muffin.id, 'quantity': 1}], 'payment_method': 'Cash',
+        }), content_type='application/json')
+        self.assertTrue(response.json()['success'], response.content[:300])
+        return response.json()
+
+    def test_receipts_are_appended_to_the_days_segment(self):
+        first, second = self.sell(), self.sell()
+        receipts = ArchivedReceipt.objects.order_by('order_id')
+        self.assertEqual({r.segment for r in receipts}, {segment_name(timezone.localdate())})
+        self.assertEqual(receipts[1].offset, receipts[0].length)
+        with gzip.open(os.path.join(archive_dir(), receipts[0].segment), 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), first['receipt_html'] + second['receipt_html'])
+
+        response = self.client.get(second['receipt_url'])
+        self.assertEqual(response.content.decode(), second['receipt_html'])
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(self.client.get(second['receipt_url'], HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        gzipped = self.client.get(second['receipt_url'], HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content).decode(), second['receipt_html'])
+        self.assertNotEqual(gzipped['ETag'], response['ETag'])
+
+        self.assertEqual(self.client.get(reverse('order_receipt', args=[999])).status_code, 404)
+
+    def test_unwritable_archive_does_not_fail_the_sale(self):
+        with open(archive_dir(), 'w'):  # A file where the archive directory should be
+            pass
+        with contextlib.redirect_stdout(io.StringIO()):
+            sold = self.sell()
+        self.assertIsNone(sold['receipt_url'])
+        self.assertIn('Muffin', sold['receipt_html'])
+        self.assertTrue(Order.objects.filter(id=sold['order_id'], status='paid').exists())
+        self.assertFalse(ArchivedReceipt.objects.exists())
+
+    def test_flat_files_are_packed_once(self):
+        order = Order.objects.create(total=Decimal('70'))
+        os.makedirs(legacy_dir())
+        for stamp, text in (('20251101_080000', 'old'), ('20251102_090000', 'newest')):
+            with open(os.path.join(legacy_dir(), f'receipt_order_{order.id}_{stamp}.html'), 'w') as f:
+                f.write(f'<p>{text}</p>')
+        with open(os.path.join(legacy_dir(), 'receipt_order_999_20251102_090000.html'), 'w') as f:
+            f.write('<p>deleted order</p>')
+
+        call_command('pack_receipts', '--delete', stdout=io.StringIO())
+        response = self.client.get(reverse('order_receipt', args=[order.id]))
+        self.assertEqual(response.content, b'<p>newest</p>')
+        self.assertEqual(os.listdir(legacy_dir()), ['receipt_order_999_20251102_090000.html'])
+
+        call_command('pack_receipts', stdout=io.StringIO())
+        self.assertEqual(ArchivedReceipt.objects.count(), 1)
+
+
+@override_settings(LIVE_EVENTS_POLL_SECONDS=0.01, LIVE_EVENTS_STREAM_SECONDS=0.1)
+class LiveEventTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cashier = User.objects.create_user('cashier', password='x')
+        cls.milk = Ingredient.objects.create(name='Milk', unit='ml', mainStock=1000, reorder=900,
+                                             cost=Decimal('0.10'))
+        cls.latte = Item.objects.create(name='Latte', price=Decimal('120'),
+                                        recipe=[{'ingredient': 'Milk', 'quantity': 200}])
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()  # Receipts are written under BASE_DIR
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(BASE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def process_order(self):
+        self.client.force_login(self.cashier)
+        response = self.client.post(reverse('process_order'), json.dumps({
+            'items': [{'id': self.latte.id, 'quantity': 1}], 'payment_method': 'Cash', 'dining_option': 'take-out',
+        }), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        return response.json()['order_id']
+
+    async def read_stream(self, **headers):
+        await sync_to_async(self.async_client.force_login)(self.cashier)
+        response = await self.async_client.get(reverse('live_events'), headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    def test_order_publishes_stock_threshold_and_order_events(self):
+        order_id = self.process_order()
+        events = {e.kind: e.data for e in LiveEvent.objects.all()}
+        self.assertEqual(events['stock'], {'ingredients': [
+            {'id': self.milk.id, 'name': 'Milk', 'main': 800.0, 'room': 0.0, 'status': 'Low Stock'}]})
+        self.assertEqual((events['low_stock']['was'], events['low_stock']['level']), ('ok', 'low'))
+        self.assertEqual(events['order']['id'], order_id)
+        self.assertEqual(events['order'], self.client.get(reverse('recent_orders_api')).json()['orders'][0])
+
+        # Restocking above the reorder level crosses back
+        self.client.force_login(User.objects.create_superuser('boss', password='x'))
+        self.client.patch(f'/api/ingredients/{self.milk.id}/', json.dumps({'mainStock': 950}),
+                          content_type='application/json')
+        self.assertEqual(LiveEvent.objects.filter(kind='low_stock').last().data['level'], 'ok')
+
+    async def test_stream_resumes_after_last_event_id(self):
+        await sync_to_async(self.process_order)()
+        first = await LiveEvent.objects.order_by('id').afirst()
+        body = await self.read_stream(**{'Last-Event-ID': str(first.id)})
+        self.assertTrue(body.startswith('retry: '))
+        self.assertNotIn(f'id: {first.id}\n', body)
+        self.assertIn('event: low_stock\n', body)
+        self.assertIn('event: order\n', body)
+
+        # A new client only gets what happens after it connected
+        self.assertNotIn('event:', await self.read_stream())
+
+    async def test_pruned_events_ask_the_client_to_reload(self):
+        await sync_to_async(self.process_order)()
+        first, latest = [e async for e in LiveEvent.objects.order_by('id')][::2]
+        await LiveEvent.objects.filter(id=first.id).adelete()  # Pruned
+        body = await self.read_stream(**{'Last-Event-ID': str(first.id - 1)})
+        self.assertIn(f'id: {latest.id}\nevent: reset\n', body)
+        self.assertNotIn('event: order', body)
+
+    def test_needs_asgi(self):
+        self.client.force_login(self.cashier)
+        self.assertEqual(self.client.get(reverse('live_events')).status_code, 503)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework import routers
-from . import views
+from . import live_events, views
 from forecasting import views as forecast_views
 
 router = routers.DefaultRouter()
@@ -37,9 +37,11 @@ urlpatterns = [
     path('audit/api/logs/', views.audit_logs_api, name='audit_logs_api'),
 
     path('api/process-order/', views.process_order, name='process_order'),
+    path('api/process-order/batch/', views.process_order_batch, name='process_order_batch'),
     path('api/verify-admin/', views.verify_admin_api, name='verify_admin_api'),
     path('api/log-void-action/', views.log_void_action, name='log_void_action'),
     path('api/recent-orders/', views.recent_orders_api, name='recent_orders_api'),
+    path('api/events/', live_events.live_events, name='live_events'),
     path('api/best-selling-products/', views.get_best_selling_products_api, name='best_selling_products_api'),
     path('api/product-categories/', views.get_product_categories_api, name='product_categories_api'),
     path('api/rename-coffee-to-drinks/', views.rename_coffee_categories_to_drinks, name='rename_coffee_to_drinks'),
@@ -54,17 +56,20 @@ urlpatterns = [
     
 
     path('api/order/<int:order_id>/', views.order_details_api, name='order_details_api'),
+    path('api/order/<int:order_id>/receipt/', views.order_receipt, name='order_receipt'),
 
     # Inventory Monitoring
     path('inventory-monitoring/', views.inventory_monitoring_view, name='inventory_monitoring'),
     path('api/inventory-monitoring/', views.inventory_monitoring_api, name='api_inventory_monitoring'),
     path('api/inventory-monitoring/export/', views.export_inventory_monitoring, name='export_inventory_monitoring'),
     path('api/inventory-monitoring/populate/', views.populate_historical_transactions, name='populate_historical_transactions'),
+    path('api/inventory-monitoring/snapshot/', views.take_inventory_snapshot_api, name='take_inventory_snapshot'),
     path('api/inventory-monitoring/debug/', views.debug_transactions, name='debug_transactions'),
 
     # Sales Monitoring
     path('sales-monitoring/', views.sales_monitoring_view, name='sales_monitoring'),
     path('api/sales-monitoring/', views.sales_monitoring_api, name='api_sales_monitoring'),
+    path('api/margins/', views.margin_report_api, name='api_margins'),
 
     # Forecasting endpoints
     path('forecasting/api/predict/', forecast_views.predict_api, name='forecast_predict_api'),
@@ -73,4 +78,5 @@ urlpatterns = [
     
     path('run-retrain/', views.run_retrain),
     path('populate-inventory/', views.populate_inventory),
+    path('api/jobs/<str:name>/', views.job_status_api, name='job_status_api'),
 ]
\ No newline at end of file
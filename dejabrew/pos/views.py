@@ -7,26 +7,33 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from .models import Item, Order, OrderItem, AuditTrail, UserProfile, Ingredient, WastedLog, InventoryTransaction
+from .models import (ArchivedReceipt, Item, Order, OrderItem, AuditTrail, UserProfile, Ingredient, WastedLog,
+                     InventoryTransaction)
 from .serializers import ItemSerializer, OrderSerializer, IngredientSerializer
-from django.http import JsonResponse, QueryDict
+from .best_sellers import DEFAULT_WINDOW, WINDOWS, best_sellers, order_sales, record_order, record_sales
+from .inventory_backfill import backfill_inventory_transactions
+from .ledger import CONSUMPTION_WINDOWS, ingredient_consumption, replay_ledger, stock_as_of, take_inventory_snapshot
+from .live_events import order_data, order_events, publish, stock_events
+from .margins import GROUPS as MARGIN_GROUPS, item_unit_cost, margin_report
+from .product_images import ProductImageError, save_derivatives
+from .receipt_archive import archive_receipt, read_compressed, read_receipt
+from django.http import HttpResponse, JsonResponse, QueryDict
 from django.core.serializers import serialize
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from django.db import IntegrityError, OperationalError, transaction
 from django.db.models import Sum, Count, F, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta, datetime
 import json
 from collections import defaultdict
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
-from django.db import transaction
+from dejabrew.sqlite_backend import immediate_atomic
 from decimal import Decimal
 from django.template.loader import render_to_string
-import os
-from django.conf import settings
+from django.urls import reverse
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-import time
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -150,6 +157,9 @@ class IngredientViewSet(viewsets.ModelViewSet):
                         notes=f"Manual adjustment: removed {abs(stock_diff)}{instance.unit} from stock room"
                     )
 
+        if (old_mainStock, old_stockRoom, old_status) != (instance.mainStock, instance.stockRoom, instance.status):
+            publish(stock_events([(instance, old_mainStock, old_stockRoom)]))
+
         if old_status != instance.status:
             changes.append(f"status: '{old_status}' -> '{instance.status}'")
             if not changes:
@@ -207,6 +217,17 @@ class OrderViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated()]
         return [AllowAny()]
 
+    # Keep the best-seller totals in step when an admin edits or deletes an order
+    def perform_update(self, serializer):
+        with immediate_atomic():
+            record_order(serializer.instance, -1)
+            record_order(serializer.save())
+
+    def perform_destroy(self, instance):
+        with immediate_atomic():
+            record_order(instance, -1)
+            instance.delete()
+
 
 def require_admin_access(request, fallback_url='staff_dashboard'):
     if not request.user.is_authenticated:
@@ -272,318 +293,17 @@ def create_inventory_transaction(ingredient, transaction_type, quantity, user, n
         raise
 
 
-def save_receipt_to_file(order, order_items_list, subtotal, discount, discount_amount, total, payment_method, 
-                         vatable_amount=None, vat_amount=None, discount_type='regular', discount_id=''):
-    try:
-        receipt_context = {
-            'order': order,
-            'order_items': order_items_list,
-            'subtotal': subtotal,
-            'vatable_amount': vatable_amount,
-            'vat_amount': vat_amount,
-            'discount_type': discount_type,
-            'discount_id': discount_id,
-            'discount_percent': discount,
-            'discount_amount': discount_amount,
-            'total': total,
-            'payment_method': payment_method
-        }
-        
-        receipt_html = render_to_string('pos/receipt/_receipt_template.html', receipt_context)
-        
-        receipt_dir = os.path.join(settings.BASE_DIR, 'pos', 'static', 'pos', 'receipt')
-        
-        os.makedirs(receipt_dir, exist_ok=True)
-        
-        timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'receipt_order_{order.id}_{timestamp}.html'
-        filepath = os.path.join(receipt_dir, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(receipt_html)
-        
-        return f'pos/receipt/{filename}'
-        
-    except Exception as e:
-        print(f"⚠️ Error saving receipt to file: {e}")
-        return None
-
-
-def handle_uploaded_file(f):
-    try:
-        save_dir = os.path.join(settings.BASE_DIR, 'pos', 'static', 'pos', 'img')
-        os.makedirs(save_dir, exist_ok=True)
-
-        fname, ext = os.path.splitext(f.name)
-        safe_fname = "".join(c for c in fname if c.isalnum() or c in ('_','-')).rstrip()
-        unique_filename = f"{safe_fname}_{int(time.time())}{ext}"
-
-        save_path = os.path.join(save_dir, unique_filename)
-
-        with open(save_path, 'wb+') as destination:
-            for chunk in f.chunks():
-                destination.write(chunk)
-
-        url_path = f'/static/pos/img/{unique_filename}'
-        return url_path
-
-    except Exception as e:
-        print(f"⚠️ Error saving uploaded file: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
-
-
-# ... [Previous view functions remain the same until process_order] ...
-
-
-@login_required
-@require_http_methods(["POST"])
-@transaction.atomic
-def process_order(request):
-    try:
-        data = json.loads(request.body)
-        cart_items_data = data.get('items', [])
-        payment_method = data.get('payment_method', 'Cash')
-        discount = Decimal(data.get('discount', '0.0'))
-        customer_name = data.get('customer_name', '')
-        
-        discount_type = data.get('discount_type', 'regular')
-        discount_id = data.get('discount_id', '')
-        
-        payment_details = data.get('payment_details', {})
-        
-        if not cart_items_data: 
-            return JsonResponse({'success': False, 'error': 'Cart is empty'}, status=400)
-        
-        required_ingredients = defaultdict(float)
-        items_to_process = []
-
-        for item_data in cart_items_data:
-            try:
-                item = Item.objects.get(id=item_data['id'], is_active=True)
-                quantity = int(item_data['quantity'])
-                
-                # CRITICAL FIX: Calculate actual quantity needed for Buy 1 Take 1
-                # If item is Buy 1 Take 1, we need to deduct double the quantity ordered
-                actual_quantity_needed = quantity * 2 if item.is_buy1take1 else quantity
-                
-                items_to_process.append({
-                    'item': item, 
-                    'quantity': quantity,  # Quantity customer ordered (for receipt)
-                    'actual_quantity': actual_quantity_needed  # Actual quantity to deduct from stock
-                })
-                
-                is_recipe_item = False
-                if item.stock > 0:
-                    is_recipe_item = False
-                else:
-                    if isinstance(item.recipe, list) and len(item.recipe) > 0:
-                        for recipe_item in item.recipe:
-                            ingredient_name = recipe_item.get('ingredient')
-                            qty_per_item = recipe_item.get('quantity', 0)
-                            if ingredient_name and qty_per_item > 0: 
-                                is_recipe_item = True
-                                # Use actual_quantity_needed for recipe calculations
-                                required_ingredients[ingredient_name] += float(qty_per_item) * actual_quantity_needed
-                
-                if not is_recipe_item:
-                    if item.stock < actual_quantity_needed: 
-                        return JsonResponse({
-                            'success': False, 
-                            'error': f'Insufficient product stock for {item.name}. Need {actual_quantity_needed}, have {item.stock}'
-                        }, status=400)
-
-            except Item.DoesNotExist: 
-                return JsonResponse({'success': False, 'error': f'Item ID {item_data["id"]} not found or inactive'}, status=404)
-            except ValueError: 
-                return JsonResponse({'success': False, 'error': 'Invalid quantity received'}, status=400)
-            except TypeError:
-                return JsonResponse({'success': False, 'error': f'Invalid recipe format for {item.name}'}, status=500)
-        
-        ingredients_to_update = []
-        for name, needed_qty in required_ingredients.items():
-            try:
-                ingredient = Ingredient.objects.get(name=name)
-                if ingredient.status == 'Out of Stock' or ingredient.mainStock < needed_qty:
-                    return JsonResponse({
-                        'success': False, 
-                        'error': f'Insufficient or out of stock ingredient: {name}. Needed: {needed_qty}, Available: {ingredient.mainStock}'
-                    }, status=400)
-                ingredients_to_update.append({'ingredient': ingredient, 'deduct_qty': needed_qty})
-            except Ingredient.DoesNotExist: 
-                return JsonResponse({'success': False, 'error': f'Ingredient "{name}" not found in database'}, status=404)
-        
-        subtotal = sum((item['item'].price or Decimal('0.0')) * item['quantity'] for item in items_to_process)
-        
-        vat_rate = Decimal('0.12')
-        vatable_amount = subtotal / (Decimal('1') + vat_rate)
-        vat_amount = subtotal - vatable_amount
-        
-        discount_amount = Decimal('0.0')
-        discount_percent = discount
-        
-        if discount_type == 'senior' or discount_type == 'pwd':
-            discount_percent = Decimal('20.0')
-            discount_amount = vatable_amount * (discount_percent / Decimal('100.0'))
-            total_deduction = discount_amount + vat_amount
-            total = subtotal - total_deduction
-        else:
-            discount_amount = subtotal * (discount_percent / Decimal('100.0'))
-            total = subtotal - discount_amount
-        
-        dining_option = data.get('dining_option', 'dine-in')
-
-        reference_number = None
-        if payment_details:
-            reference_number = payment_details.get('ref_num', '') or payment_details.get('reference_number', '')
-
-        order_data = {
-            'total': total,
-            'customer_name': customer_name,
-            'status': 'paid',
-            'cashier': request.user,
-            'payment_method': payment_method,
-            'discount': discount_percent,
-            'dining_option': dining_option,
-            'reference_number': reference_number or ''
-        }
-
-        try:
-            order = Order.objects.create(
-                **order_data,
-                discount_type=discount_type,
-                discount_id=discount_id
-            )
-        except TypeError:
-            order = Order.objects.create(**order_data)
-        
-        order_items_list = []
-        for item_data in items_to_process:
-            item = item_data['item']
-            quantity = item_data['quantity']
-            actual_quantity = item_data['actual_quantity']
-            
-            order_item = OrderItem.objects.create(
-                order=order, 
-                item=item, 
-                qty=quantity,  # Store customer's ordered quantity
-                price_at_order=item.price
-            )
-            order_items_list.append(order_item)
-            
-            is_recipe_item = False
-            if item.stock > 0:
-                is_recipe_item = False
-            else:
-                if isinstance(item.recipe, list) and len(item.recipe) > 0:
-                    for recipe_item in item.recipe:
-                        if recipe_item.get('ingredient') and recipe_item.get('quantity', 0) > 0:
-                            is_recipe_item = True
-                            break
-            
-            if not is_recipe_item:
-                # CRITICAL FIX: Deduct actual_quantity (accounts for Buy 1 Take 1)
-                item.stock -= actual_quantity
-                item.save(update_fields=['stock'])
-
-        for ing_data in ingredients_to_update:
-            ingredient = ing_data['ingredient']
-            deduct_qty = ing_data['deduct_qty']
-
-            ingredient.mainStock -= deduct_qty
-            if ingredient.mainStock <= 0 and ingredient.stockRoom <= 0 and ingredient.status != 'Out of Stock':
-                ingredient.status = 'Out of Stock'
-            elif ingredient.mainStock < ingredient.reorder and ingredient.status == 'In Stock':
-                ingredient.status = 'Low Stock'
-            ingredient.save(update_fields=['mainStock', 'status'])
-
-            create_inventory_transaction(
-                ingredient=ingredient,
-                transaction_type='STOCK_OUT',
-                quantity=-deduct_qty,
-                user=request.user,
-                notes=f"Used in order (recipe)",
-                reference=f"Order-{order.id}"
-            )
-        
-        audit_description = f"Order #{order.id} processed. Total: ₱{total}."
-        if discount_type in ['senior', 'pwd']:
-            audit_description += f" {discount_type.upper()} Discount (ID: {discount_id}). VAT Exempt."
-        if payment_method != 'Cash' and payment_details:
-            ref_num = payment_details.get('ref_num', 'N/A')
-            cust_name = payment_details.get('cust_name', 'N/A')
-            audit_description += f" Method: {payment_method} (Ref: {ref_num}, Name: {cust_name})"
-        
-        log_audit(request, request.user, "Process Order", audit_description, category="sales", severity="medium")
-
-        receipt_context = {
-            'order': order,
-            'order_items': order_items_list,
-            'subtotal': subtotal,
-            'vatable_amount': vatable_amount if (discount_type in ['senior', 'pwd']) else None,
-            'vat_amount': vat_amount if (discount_type in ['senior', 'pwd']) else None,
-            'discount_type': discount_type,
-            'discount_id': discount_id,
-            'discount_percent': discount_percent,
-            'discount_amount': discount_amount,
-            'total': total,
-            'payment_method': payment_method,
-            'dining_option': dining_option
-        }
-        
-        receipt_html = render_to_string('pos/receipt/_receipt_template.html', receipt_context)
-        
-        saved_file_path = save_receipt_to_file(
-            order, order_items_list, subtotal, discount_percent, 
-            discount_amount, total, payment_method, 
-            vatable_amount=vatable_amount, 
-            vat_amount=vat_amount,
-            discount_type=discount_type,
-            discount_id=discount_id
-        )
-        
-        response_data = {
-            'success': True, 
-            'order_id': order.id, 
-            'total': float(total), 
-            'message': 'Order processed successfully!',
-            'receipt_html': receipt_html
-        }
-        
-        if saved_file_path:
-            response_data['receipt_file'] = saved_file_path
-        
-        return JsonResponse(response_data)
-        
-    except json.JSONDecodeError:
-        return JsonResponse({'success': False, 'error': 'Invalid JSON data received'}, status=400)
-    except Exception as e:
-        return JsonResponse({'success': False, 'error': f'An unexpected error occurred: {str(e)}'}, status=500)
-
 def handle_uploaded_file(f):
+    """
+    Saves an uploaded product photo as resized derivatives. Returns their URLs,
+    or None if saving failed; raises ProductImageError if it isn't an image.
+    """
     try:
-        save_dir = os.path.join(settings.BASE_DIR, 'pos', 'static', 'pos', 'img')
-        os.makedirs(save_dir, exist_ok=True)
-
-        fname, ext = os.path.splitext(f.name)
-        safe_fname = "".join(c for c in fname if c.isalnum() or c in ('_','-')).rstrip()
-        unique_filename = f"{safe_fname}_{int(time.time())}{ext}"
-
-        save_path = os.path.join(save_dir, unique_filename)
-
-        # Use regular file operations instead of default_storage for static files
-        with open(save_path, 'wb+') as destination:
-            for chunk in f.chunks():
-                destination.write(chunk)
-
-        url_path = f'/static/pos/img/{unique_filename}'
-        return url_path
-
+        return save_derivatives(f, f.name)
+    except ProductImageError:
+        raise
     except Exception as e:
         print(f"⚠️ Error saving uploaded file: {e}")
-        import traceback
-        traceback.print_exc()
         return None
 
 def login_view(request):
@@ -640,7 +360,7 @@ def dashboard(request):
     end_date_str = request.GET.get('end_date')
     
     if not start_date_str or not end_date_str:
-        today = timezone.now().date()
+        today = timezone.localdate()
         today_str = today.isoformat()
         
         query_params = QueryDict(mutable=True)
@@ -653,23 +373,20 @@ def dashboard(request):
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
     except ValueError:
-        today = timezone.now().date()
+        today = timezone.localdate()
         start_date = today
         end_date = today
         start_date_str = today.isoformat()
         end_date_str = today.isoformat()
 
-    filter_start = timezone.make_aware(timezone.datetime.combine(start_date, timezone.datetime.min.time()))
-    filter_end = timezone.make_aware(timezone.datetime.combine(end_date, timezone.datetime.max.time()))
-
-    paid_orders = Order.objects.filter(status='paid', created_at__range=[filter_start, filter_end])
+    paid_orders = Order.objects.filter(status='paid', business_date__range=[start_date, end_date])
     
     total_sales_count = paid_orders.count()
     total_revenue = paid_orders.aggregate(total_sum=Sum('total'))['total_sum'] or 0
     
     top_products = list(OrderItem.objects.filter(
         order__status='paid',
-        order__created_at__range=[filter_start, filter_end]
+        order__business_date__range=[start_date, end_date]
     ).values('item__name').annotate(
         total_qty=Sum('qty'),
         total_value=Sum(F('qty') * F('price_at_order'))
@@ -697,7 +414,7 @@ def dashboard(request):
 
     staff_sales_query = Order.objects.filter(
         status='paid',
-        created_at__range=[filter_start, filter_end]
+        business_date__range=[start_date, end_date]
     ).exclude(admin_user_q)
 
     all_staff_sales = staff_sales_query.values(
@@ -738,14 +455,10 @@ def staff_dashboard(request):
              messages.info(request, "Admins should use the main dashboard.")
              return redirect('dashboard')
     
-    today = timezone.localtime(timezone.now()).date()
-    today_start = timezone.make_aware(timezone.datetime.combine(today, timezone.datetime.min.time()))
-    today_end = timezone.make_aware(timezone.datetime.combine(today, timezone.datetime.max.time()))
-    
     my_sales_today = Order.objects.filter(
         cashier=request.user, 
         status='paid', 
-        created_at__range=[today_start, today_end]
+        business_date=timezone.localdate()
     )
     
     my_sales_count = my_sales_today.count()
@@ -769,35 +482,40 @@ def dashboard_sales_data(request):
     try:
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
     except (ValueError, TypeError):
-        end_date = timezone.now().date()
+        end_date = timezone.localdate()
 
     period = request.GET.get('period', 'daily')
     sales_data = []
     base_queryset = Order.objects.filter(status='paid')
+
+    def sales_by_day(start_date):
+        rows = (base_queryset.filter(business_date__range=[start_date, end_date])
+                .values('business_date').annotate(total=Sum('total')).order_by('business_date'))
+        return {row['business_date']: row['total'] for row in rows}
+
     try:
         if period == 'daily':
             start_date = end_date - timedelta(days=6)
-            queryset = base_queryset.filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
-            sales_by_period = queryset.annotate(period=TruncDay('created_at')).values('period').annotate(total=Sum('total')).order_by('period')
-            sales_dict = {item['period'].date(): item['total'] for item in sales_by_period}
+            sales_dict = sales_by_day(start_date)
             for i in range(7): 
                 date = start_date + timedelta(days=i)
                 sales_data.append({'label': date.strftime('%a'), 'sales': float(sales_dict.get(date, 0))})
         elif period == 'weekly':
             start_date = end_date - timedelta(weeks=7) 
-            queryset = base_queryset.filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
-            sales_by_period = queryset.annotate(period=TruncWeek('created_at')).values('period').annotate(total=Sum('total')).order_by('period')
-            sales_dict = {item['period'].date(): item['total'] for item in sales_by_period}
+            sales_dict = defaultdict(Decimal)
+            for date, total in sales_by_day(start_date).items():
+                sales_dict[date - timedelta(days=date.weekday())] += total  # Weeks start on Monday
             for i in range(8): 
                 week_start_date = start_date + timedelta(weeks=i)
                 key_date = week_start_date - timedelta(days=week_start_date.weekday())
                 sales_data.append({'label': f"Wk {week_start_date.strftime('%U')}", 'sales': float(sales_dict.get(key_date, 0))})
         elif period == 'monthly':
             start_date = (end_date.replace(day=1) - timedelta(days=150)).replace(day=1)
-            queryset = base_queryset.filter(created_at__date__gte=start_date, created_at__date__lte=end_date)
-            sales_by_period = queryset.annotate(period=TruncMonth('created_at')).values('period').annotate(total=Sum('total')).order_by('period')
-            for item in sales_by_period: 
-                sales_data.append({'label': item['period'].strftime('%b %Y'), 'sales': float(item['total'])})
+            sales_dict = defaultdict(Decimal)
+            for date, total in sales_by_day(start_date).items():
+                sales_dict[date.replace(day=1)] += total
+            for month in sorted(sales_dict): 
+                sales_data.append({'label': month.strftime('%b %Y'), 'sales': float(sales_dict[month])})
         else: 
             return JsonResponse({'success': False, 'error': 'Invalid period specified'}, status=400)
         
@@ -817,139 +535,62 @@ def cashier_pos_page(request):
     return render(request, 'cashier-pos.html', context)
 
 
-@login_required
-@require_http_methods(["POST"])
-@transaction.atomic
-def process_order(request):
-    try:
-        data = json.loads(request.body)
-        cart_items_data = data.get('items', [])
-        payment_method = data.get('payment_method', 'Cash')
-        discount = Decimal(data.get('discount', '0.0'))
-        customer_name = data.get('customer_name', '')
-        
-        discount_type = data.get('discount_type', 'regular')
-        discount_id = data.get('discount_id', '')
-        
-        payment_details = data.get('payment_details', {})
-        
-        if not cart_items_data: 
-            return JsonResponse({'success': False, 'error': 'Cart is empty'}, status=400)
-        
-        required_ingredients = defaultdict(float)
-        items_to_process = []
+class OrderError(Exception):
+    """A cart that can't be filled (unknown item, not enough stock...), with the HTTP status to answer."""
 
-        for item_data in cart_items_data:
-            try:
-                item = Item.objects.get(id=item_data['id'], is_active=True)
-                quantity = int(item_data['quantity'])
-                
-                # CRITICAL FIX: Calculate actual quantity needed for Buy 1 Take 1
-                actual_quantity_needed = quantity * 2 if item.is_buy1take1 else quantity
-                
-                items_to_process.append({
-                    'item': item, 
-                    'quantity': quantity,  # Quantity customer ordered
-                    'actual_quantity': actual_quantity_needed  # Actual quantity to deduct
-                })
-                
-                is_recipe_item = False
-                if item.stock > 0:
-                    is_recipe_item = False
-                else:
-                    if isinstance(item.recipe, list) and len(item.recipe) > 0:
-                        for recipe_item in item.recipe:
-                            ingredient_name = recipe_item.get('ingredient')
-                            qty_per_item = recipe_item.get('quantity', 0)
-                            if ingredient_name and qty_per_item > 0: 
-                                is_recipe_item = True
-                                # Use actual_quantity_needed for recipe calculations
-                                required_ingredients[ingredient_name] += float(qty_per_item) * actual_quantity_needed
-                
-                if not is_recipe_item:
-                    if item.stock < actual_quantity_needed: 
-                        return JsonResponse({
-                            'success': False, 
-                            'error': f'Insufficient product stock for {item.name}. Need {actual_quantity_needed}, have {item.stock}'
-                        }, status=400)
-
-            except Item.DoesNotExist: 
-                return JsonResponse({'success': False, 'error': f'Item ID {item_data["id"]} not found or inactive'}, status=404)
-            except ValueError: 
-                return JsonResponse({'success': False, 'error': 'Invalid quantity received'}, status=400)
-            except TypeError:
-                return JsonResponse({'success': False, 'error': f'Invalid recipe format for {item.name}'}, status=500)
-        
-        ingredients_to_update = []
-        for name, needed_qty in required_ingredients.items():
-            try:
-                ingredient = Ingredient.objects.get(name=name)
-                if ingredient.status == 'Out of Stock' or ingredient.mainStock < needed_qty:
-                    return JsonResponse({
-                        'success': False, 
-                        'error': f'Insufficient or out of stock ingredient: {name}. Needed: {needed_qty}, Available: {ingredient.mainStock}'
-                    }, status=400)
-                ingredients_to_update.append({'ingredient': ingredient, 'deduct_qty': needed_qty})
-            except Ingredient.DoesNotExist: 
-                return JsonResponse({'success': False, 'error': f'Ingredient "{name}" not found in database'}, status=404)
-        
-        subtotal = sum((item['item'].price or Decimal('0.0')) * item['quantity'] for item in items_to_process)
-        
-        vat_rate = Decimal('0.12')
-        vatable_amount = subtotal / (Decimal('1') + vat_rate)
-        vat_amount = subtotal - vatable_amount
-        
-        discount_amount = Decimal('0.0')
-        discount_percent = discount
-        
-        if discount_type == 'senior' or discount_type == 'pwd':
-            discount_percent = Decimal('20.0')
-            discount_amount = vatable_amount * (discount_percent / Decimal('100.0'))
-            total_deduction = discount_amount + vat_amount
-            total = subtotal - total_deduction
-        else:
-            discount_amount = subtotal * (discount_percent / Decimal('100.0'))
-            total = subtotal - discount_amount
-        
-        dining_option = data.get('dining_option', 'dine-in')
+    def __init__(self, message, http_status=400):
+        super().__init__(message)
+        self.status = http_status
 
-        reference_number = None
-        if payment_details:
-            reference_number = payment_details.get('ref_num', '') or payment_details.get('reference_number', '')
 
-        order_data = {
-            'total': total,
-            'customer_name': customer_name,
-            'status': 'paid',
-            'cashier': request.user,
-            'payment_method': payment_method,
-            'discount': discount_percent,
-            'dining_option': dining_option,
-            'reference_number': reference_number or ''
+def place_order(request, data, idempotency_key=None):
+    """
+    Creates one order from a cashier-pos.js cart: deducts item stock and
+    recipe ingredients, writes the ledger rows, audit entry and receipt,
+    and returns the JSON payload for the terminal. Raises OrderError
+    before writing anything if the cart can't be filled. Runs in the
+    caller's transaction.
+    """
+    cart_items_data = data.get('items', [])
+    payment_method = data.get('payment_method', 'Cash')
+    discount = Decimal(data.get('discount', '0.0'))
+    customer_name = data.get('customer_name', '')
+    
+    discount_type = data.get('discount_type', 'regular')
+    discount_id = data.get('discount_id', '')
+    
+    payment_details = data.get('payment_details', {})
+    
+    if not cart_items_data: 
+        raise OrderError('Cart is empty')
+    
+    required_ingredients = defaultdict(float)
+    items_to_process = []
+
+    # One query for the whole cart instead of one per line
+    try:
+        items_by_id = {
+            str(item.id): item
+            for item in Item.objects.filter(id__in=[d.get('id') for d in cart_items_data], is_active=True)
         }
+    except (TypeError, ValueError):
+        raise OrderError('Invalid item ID received')
 
+    for item_data in cart_items_data:
         try:
-            order = Order.objects.create(
-                **order_data,
-                discount_type=discount_type,
-                discount_id=discount_id
-            )
-        except TypeError:
-            order = Order.objects.create(**order_data)
-        
-        order_items_list = []
-        for item_data in items_to_process:
-            item = item_data['item']
-            quantity = item_data['quantity']
-            actual_quantity = item_data['actual_quantity']
+            item = items_by_id.get(str(item_data['id']))
+            if item is None:
+                raise Item.DoesNotExist
+            quantity = int(item_data['quantity'])
             
-            order_item = OrderItem.objects.create(
-                order=order, 
-                item=item, 
-                qty=quantity,  # Store customer's ordered quantity
-                price_at_order=item.price
-            )
-            order_items_list.append(order_item)
+            # CRITICAL FIX: Calculate actual quantity needed for Buy 1 Take 1
+            actual_quantity_needed = quantity * 2 if item.is_buy1take1 else quantity
+            
+            items_to_process.append({
+                'item': item, 
+                'quantity': quantity,  # Quantity customer ordered
+                'actual_quantity': actual_quantity_needed  # Actual quantity to deduct
+            })
             
             is_recipe_item = False
             if item.stock > 0:
@@ -957,93 +598,308 @@ def process_order(request):
             else:
                 if isinstance(item.recipe, list) and len(item.recipe) > 0:
                     for recipe_item in item.recipe:
-                        if recipe_item.get('ingredient') and recipe_item.get('quantity', 0) > 0:
+                        ingredient_name = recipe_item.get('ingredient')
+                        qty_per_item = recipe_item.get('quantity', 0)
+                        if ingredient_name and qty_per_item > 0: 
                             is_recipe_item = True
-                            break
+                            # Use actual_quantity_needed for recipe calculations
+                            required_ingredients[ingredient_name] += float(qty_per_item) * actual_quantity_needed
             
             if not is_recipe_item:
-                # CRITICAL FIX: Deduct actual_quantity (accounts for Buy 1 Take 1)
-                item.stock -= actual_quantity
-                item.save(update_fields=['stock'])
-
-        for ing_data in ingredients_to_update:
-            ingredient = ing_data['ingredient']
-            deduct_qty = ing_data['deduct_qty']
-
-            ingredient.mainStock -= deduct_qty
-            if ingredient.mainStock <= 0 and ingredient.stockRoom <= 0 and ingredient.status != 'Out of Stock':
-                ingredient.status = 'Out of Stock'
-            elif ingredient.mainStock < ingredient.reorder and ingredient.status == 'In Stock':
-                ingredient.status = 'Low Stock'
-            ingredient.save(update_fields=['mainStock', 'status'])
-
-            create_inventory_transaction(
-                ingredient=ingredient,
-                transaction_type='STOCK_OUT',
-                quantity=-deduct_qty,
-                user=request.user,
-                notes=f"Used in order (recipe)",
-                reference=f"Order-{order.id}"
-            )
-        
-        audit_description = f"Order #{order.id} processed. Total: ₱{total}."
-        if discount_type in ['senior', 'pwd']:
-            audit_description += f" {discount_type.upper()} Discount (ID: {discount_id}). VAT Exempt."
-        if payment_method != 'Cash' and payment_details:
-            ref_num = payment_details.get('ref_num', 'N/A')
-            cust_name = payment_details.get('cust_name', 'N/A')
-            audit_description += f" Method: {payment_method} (Ref: {ref_num}, Name: {cust_name})"
-        
-        log_audit(request, request.user, "Process Order", audit_description, category="sales", severity="medium")
-
-        receipt_context = {
-            'order': order,
-            'order_items': order_items_list,
-            'subtotal': subtotal,
-            'vatable_amount': vatable_amount if (discount_type in ['senior', 'pwd']) else None,
-            'vat_amount': vat_amount if (discount_type in ['senior', 'pwd']) else None,
-            'discount_type': discount_type,
-            'discount_id': discount_id,
-            'discount_percent': discount_percent,
-            'discount_amount': discount_amount,
-            'total': total,
-            'payment_method': payment_method,
-            'dining_option': dining_option
-        }
-        
-        receipt_html = render_to_string('pos/receipt/_receipt_template.html', receipt_context)
-        
-        saved_file_path = save_receipt_to_file(
-            order, order_items_list, subtotal, discount_percent, 
-            discount_amount, total, payment_method, 
-            vatable_amount=vatable_amount, 
-            vat_amount=vat_amount,
+                if item.stock < actual_quantity_needed: 
+                    raise OrderError(f'Insufficient product stock for {item.name}. Need {actual_quantity_needed}, have {item.stock}')
+
+        except Item.DoesNotExist: 
+            raise OrderError(f'Item ID {item_data["id"]} not found or inactive', 404)
+        except ValueError: 
+            raise OrderError('Invalid quantity received')
+        except TypeError:
+            raise OrderError(f'Invalid recipe format for {item.name}', 422)  # Fails again on every retry
+    
+    ingredients_to_update = []
+    ingredients_by_name = {ing.name: ing for ing in Ingredient.objects.filter(name__in=required_ingredients)}
+    for name, needed_qty in required_ingredients.items():
+        ingredient = ingredients_by_name.get(name)
+        if ingredient is None:
+            raise OrderError(f'Ingredient "{name}" not found in database', 404)
+        if ingredient.status == 'Out of Stock' or ingredient.mainStock < needed_qty:
+            raise OrderError(f'Insufficient or out of stock ingredient: {name}. Needed: {needed_qty}, Available: {ingredient.mainStock}')
+        ingredients_to_update.append({'ingredient': ingredient, 'deduct_qty': needed_qty})
+    
+    subtotal = sum((item['item'].price or Decimal('0.0')) * item['quantity'] for item in items_to_process)
+    
+    vat_rate = Decimal('0.12')
+    vatable_amount = subtotal / (Decimal('1') + vat_rate)
+    vat_amount = subtotal - vatable_amount
+    
+    discount_amount = Decimal('0.0')
+    discount_percent = discount
+    
+    if discount_type == 'senior' or discount_type == 'pwd':
+        discount_percent = Decimal('20.0')
+        discount_amount = vatable_amount * (discount_percent / Decimal('100.0'))
+        total_deduction = discount_amount + vat_amount
+        total = subtotal - total_deduction
+    else:
+        discount_amount = subtotal * (discount_percent / Decimal('100.0'))
+        total = subtotal - discount_amount
+    
+    dining_option = data.get('dining_option', 'dine-in')
+
+    reference_number = None
+    if payment_details:
+        reference_number = payment_details.get('ref_num', '') or payment_details.get('reference_number', '')
+
+    order_data = {
+        'idempotency_key': idempotency_key,
+        'total': total,
+        'customer_name': customer_name,
+        'status': 'paid',
+        'cashier': request.user,
+        'payment_method': payment_method,
+        'discount': discount_percent,
+        'dining_option': dining_option,
+        'reference_number': reference_number or ''
+    }
+
+    try:
+        order = Order.objects.create(
+            **order_data,
             discount_type=discount_type,
             discount_id=discount_id
         )
-        
-        response_data = {
-            'success': True, 
-            'order_id': order.id, 
-            'total': float(total), 
-            'message': 'Order processed successfully!',
-            'receipt_html': receipt_html
-        }
-        
-        if saved_file_path:
-            response_data['receipt_file'] = saved_file_path
-        
-        return JsonResponse(response_data)
-        
+    except TypeError:
+        order = Order.objects.create(**order_data)
+    
+    order_items_list = []
+    stock_items = {}
+    ingredient_costs = {name: ing.cost for name, ing in ingredients_by_name.items()}
+    for item_data in items_to_process:
+        item = item_data['item']
+        quantity = item_data['quantity']
+        actual_quantity = item_data['actual_quantity']
+        
+        is_recipe_item = False
+        if item.stock > 0:
+            is_recipe_item = False
+        else:
+            if isinstance(item.recipe, list) and len(item.recipe) > 0:
+                for recipe_item in item.recipe:
+                    if recipe_item.get('ingredient') and recipe_item.get('quantity', 0) > 0:
+                        is_recipe_item = True
+                        break
+        
+        order_items_list.append(OrderItem(
+            order=order, 
+            item=item, 
+            qty=quantity,  # Store customer's ordered quantity
+            price_at_order=item.price,
+            # Cost of what one ordered unit uses up, the free one of a Buy 1 Take 1 included
+            unit_cost=item_unit_cost(item, ingredient_costs) if is_recipe_item else None
+        ))
+        
+        if not is_recipe_item:
+            # CRITICAL FIX: Deduct actual_quantity (accounts for Buy 1 Take 1)
+            item.stock -= actual_quantity
+            stock_items[item.id] = item
+
+    OrderItem.objects.bulk_create(order_items_list)
+    record_sales(order_sales(order, [(line.item_id, line.qty) for line in order_items_list]))
+    if stock_items:
+        Item.objects.bulk_update(stock_items.values(), ['stock'])
+
+    stock_out_transactions = []
+    stock_changes = []
+    for ing_data in ingredients_to_update:
+        ingredient = ing_data['ingredient']
+        deduct_qty = ing_data['deduct_qty']
+
+        stock_changes.append((ingredient, ingredient.mainStock, ingredient.stockRoom))
+        ingredient.mainStock -= deduct_qty
+        if ingredient.mainStock <= 0 and ingredient.stockRoom <= 0 and ingredient.status != 'Out of Stock':
+            ingredient.status = 'Out of Stock'
+        elif ingredient.mainStock < ingredient.reorder and ingredient.status == 'In Stock':
+            ingredient.status = 'Low Stock'
+
+        stock_out_transactions.append(InventoryTransaction(
+            ingredient=ingredient,
+            ingredient_name=ingredient.name,
+            transaction_type='STOCK_OUT',
+            quantity=-deduct_qty,
+            unit=ingredient.unit,
+            cost_per_unit=ingredient.cost,
+            total_cost=Decimal(str(deduct_qty)) * ingredient.cost,
+            main_stock_after=ingredient.mainStock,
+            stock_room_after=ingredient.stockRoom,
+            notes="Used in order (recipe)",
+            reference=f"Order-{order.id}",
+            user=request.user
+        ))
+
+    if ingredients_to_update:
+        Ingredient.objects.bulk_update([d['ingredient'] for d in ingredients_to_update], ['mainStock', 'status'])
+        InventoryTransaction.objects.bulk_create(stock_out_transactions)
+    publish(stock_events(stock_changes) + order_events(order))
+    
+    audit_description = f"Order #{order.id} processed. Total: ₱{total}."
+    if discount_type in ['senior', 'pwd']:
+        audit_description += f" {discount_type.upper()} Discount (ID: {discount_id}). VAT Exempt."
+    if payment_method != 'Cash' and payment_details:
+        ref_num = payment_details.get('ref_num', 'N/A')
+        cust_name = payment_details.get('cust_name', 'N/A')
+        audit_description += f" Method: {payment_method} (Ref: {ref_num}, Name: {cust_name})"
+    
+    log_audit(request, request.user, "Process Order", audit_description, category="sales", severity="medium")
+
+    receipt_context = {
+        'order': order,
+        'order_items': order_items_list,
+        'subtotal': subtotal,
+        'vatable_amount': vatable_amount if (discount_type in ['senior', 'pwd']) else None,
+        'vat_amount': vat_amount if (discount_type in ['senior', 'pwd']) else None,
+        'discount_type': discount_type,
+        'discount_id': discount_id,
+        'discount_percent': discount_percent,
+        'discount_amount': discount_amount,
+        'total': total,
+        'payment_method': payment_method,
+        'dining_option': dining_option
+    }
+    
+    receipt_html = render_to_string('pos/receipt/_receipt_template.html', receipt_context)
+    try:
+        archive_receipt(order, receipt_html)
+        receipt_url = reverse('order_receipt', args=[order.id])
+    except OSError as e:
+        # A full disk or unwritable archive mustn't fail the sale; the terminal still gets the HTML
+        print(f"⚠️ Could not archive receipt for order {order.id}: {e}")
+        receipt_url = None
+    
+    return {
+        'success': True, 
+        'order_id': order.id, 
+        'total': float(total), 
+        'message': 'Order processed successfully!',
+        'receipt_html': receipt_html,
+        'receipt_url': receipt_url,
+    }
+
+
+def already_processed(order):
+    """Payload for an idempotency key that was used before: the original order, nothing charged again."""
+    return {
+        'success': True,
+        'duplicate': True,
+        'order_id': order.id,
+        'total': float(order.total),
+        'message': f'Order #{order.id} was already processed.',
+    }
+
+
+@login_required
+@require_http_methods(["POST"])
+@immediate_atomic
+def process_order(request):
+    try:
+        data = json.loads(request.body)
+        idempotency_key = data.get('idempotency_key') or None
+        if idempotency_key:
+            existing = Order.objects.filter(idempotency_key=idempotency_key).first()
+            if existing:
+                return JsonResponse(already_processed(existing))
+        return JsonResponse(place_order(request, data, idempotency_key=idempotency_key))
+
+    except OrderError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid JSON data received'}, status=400)
     except Exception as e:
         return JsonResponse({'success': False, 'error': f'An unexpected error occurred: {str(e)}'}, status=500)
-    
+
+
+MAX_BATCH_ORDERS = 50  # The whole batch holds the database write lock
+MAX_QUEUED_AGE = timedelta(hours=24)  # Older queued_at stamps are ignored
+
+
+def submit_queued_order(request, data):
+    """Processes one order of a batch in its own savepoint. Returns its result (with the HTTP status it would get)."""
+    key = data.get('idempotency_key') if isinstance(data, dict) else None
+    if not isinstance(key, str) or not key or len(key) > 64:
+        return {'idempotency_key': key, 'success': False, 'status': 400,
+                'error': 'Each order needs an idempotency_key of up to 64 characters'}
+
+    existing = Order.objects.filter(idempotency_key=key).first()
+    if existing:
+        return {'idempotency_key': key, 'status': 200, **already_processed(existing)}
+    try:
+        with transaction.atomic():
+            result = place_order(request, data, idempotency_key=key)
+            # Keep the time of the sale, not of the upload, if the terminal's clock is plausible
+            queued_at = parse_datetime(str(data.get('queued_at') or ''))
+            now = timezone.now()
+            if queued_at and timezone.is_aware(queued_at) and now - MAX_QUEUED_AGE <= queued_at <= now:
+                order = Order.objects.get(id=result['order_id'])
+                record_order(order, -1)  # Its sales move to the day it was queued
+                order.created_at = queued_at
+                order.save(update_fields=['created_at', 'business_date', 'business_hour'])
+                record_order(order)
+    except OrderError as e:
+        return {'idempotency_key': key, 'success': False, 'status': e.status, 'error': str(e)}
+    except IntegrityError:
+        # Submitted again while this request was running
+        existing = Order.objects.filter(idempotency_key=key).first()
+        if existing is None:
+            raise
+        return {'idempotency_key': key, 'status': 200, **already_processed(existing)}
+    except OperationalError as e:
+        # Database locked or unavailable: worth sending again
+        return {'idempotency_key': key, 'success': False, 'status': 503, 'error': f'Database busy: {str(e)}'}
+    except Exception as e:
+        # Unexpected: the terminal retries it a few times, then gives up and tells the cashier
+        return {'idempotency_key': key, 'success': False, 'status': 500,
+                'error': f'An unexpected error occurred: {str(e)}'}
+    return {'idempotency_key': key, 'status': 200, **result}
+
+
+@login_required
+@require_http_methods(["POST"])
+@immediate_atomic
+def process_order_batch(request):
+    """
+    Orders cashier-pos.js queued while the server was slow or unreachable:
+    {"orders": [{"idempotency_key": "...", "queued_at": "<ISO time>", ...process_order body}, ...]}.
+
+    The batch is one transaction and every order its own savepoint, so a
+    cart that can't be filled fails alone. Results come back per order, in
+    order. A key that was processed before returns that order again
+    (duplicate: true) instead of charging and deducting stock twice, so
+    the terminal can resend a batch whose response it never got.
+    """
+    try:
+        data = json.loads(request.body)
+        orders = data.get('orders') if isinstance(data, dict) else None
+        if not isinstance(orders, list) or not orders:
+            return JsonResponse({'success': False, 'error': 'No orders received'}, status=400)
+        if len(orders) > MAX_BATCH_ORDERS:
+            return JsonResponse({'success': False, 'error': f'At most {MAX_BATCH_ORDERS} orders per batch'}, status=400)
+
+        results = [submit_queued_order(request, order_data) for order_data in orders]
+        return JsonResponse({
+            'success': True,
+            'results': results,
+            'processed': sum(1 for r in results if r['success'] and not r.get('duplicate')),
+            'duplicates': sum(1 for r in results if r.get('duplicate')),
+            'failed': sum(1 for r in results if not r['success']),
+        })
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data received'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': f'An unexpected error occurred: {str(e)}'}, status=500)
+
 @login_required
 def recent_orders_api(request):
     orders = Order.objects.filter(status='paid').select_related('cashier').order_by('-created_at')[:5]
-    orders_data = [{'id': o.id, 'total': float(o.total), 'created_at': o.created_at.strftime('%H:%M'), 'cashier': o.cashier.username if o.cashier else 'Unknown', 'customer_name': o.customer_name or 'Walk-in', 'dining_option': o.dining_option} for o in orders]
+    orders_data = [order_data(o) for o in orders]
     return JsonResponse({'orders': orders_data})
 
 
@@ -1084,11 +940,11 @@ def create_product(request):
         except json.JSONDecodeError:
             pass
         
-        image_url = ''
+        images = {}
         image_file = request.FILES.get('image_file')
         if image_file:
-            image_url = handle_uploaded_file(image_file)
-            if image_url is None:
+            images = handle_uploaded_file(image_file)
+            if images is None:
                 return JsonResponse({'success': False, 'error': 'Failed to save uploaded image'}, status=500)
 
         # Get Buy 1 Take 1 promo status
@@ -1100,14 +956,16 @@ def create_product(request):
             category=data.get('category', 'General').strip(),
             price=price,
             stock=stock,
-            image_url=image_url,
             recipe=recipe_data,
+            **images,
             is_buy1take1=is_buy1take1
         )
         
         log_audit(request, request.user, "Create Product", f"Admin '{request.user.username}' created product '{name}'", category="inventory", severity="medium")
         return JsonResponse({'success': True, 'message': 'Product created', 'product': ItemSerializer(product).data})
         
+    except ProductImageError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
@@ -1142,11 +1000,12 @@ def update_product(request, product_id):
 
         image_file = request.FILES.get('image_file')
         if image_file:
-            product.image_url = handle_uploaded_file(image_file)
-            if product.image_url is None:
+            images = handle_uploaded_file(image_file)
+            if images is None:
                  return JsonResponse({'success': False, 'error': 'Failed to save uploaded image'}, status=500)
-        else:
-            product.image_url = data.get('image_url', product.image_url)
+            product.image_url, product.thumbnail_url = images['image_url'], images['thumbnail_url']
+        elif data.get('image_url', product.image_url) != product.image_url:
+            product.image_url, product.thumbnail_url = data['image_url'], ''
 
         product.save()
         
@@ -1161,6 +1020,8 @@ def update_product(request, product_id):
         
     except Item.DoesNotExist: 
         return JsonResponse({'success': False, 'error': 'Product not found'}, status=404)
+    except ProductImageError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
@@ -1216,7 +1077,15 @@ def get_products_api(request):
             elif status_filter == 'out of stock': products = products.filter(stock=0)
 
         products_data = ItemSerializer(products, many=True).data
-        
+
+        # One query for every ingredient the listed recipes use
+        recipe_ingredients = {
+            recipe_item.get('ingredient')
+            for product in products_data if isinstance(product.get('recipe'), list)
+            for recipe_item in product['recipe']
+        }
+        ingredients_by_name = {ing.name: ing for ing in Ingredient.objects.filter(name__in=recipe_ingredients)}
+
         for product in products_data:
             stock = product.get('stock', 0)
             recipe = product.get('recipe', [])
@@ -1229,12 +1098,8 @@ def get_products_api(request):
                         ingredient_name = recipe_item.get('ingredient')
                         qty_needed = recipe_item.get('quantity', 0)
                         if ingredient_name and qty_needed > 0:
-                            try:
-                                ingredient = Ingredient.objects.get(name=ingredient_name)
-                                if ingredient.status == 'Out of Stock' or ingredient.mainStock < qty_needed:
-                                    all_ingredients_available = False
-                                    break
-                            except Ingredient.DoesNotExist:
+                            ingredient = ingredients_by_name.get(ingredient_name)
+                            if ingredient is None or ingredient.status == 'Out of Stock' or ingredient.mainStock < qty_needed:
                                 all_ingredients_available = False
                                 break
                 product['status'] = "available" if all_ingredients_available else "unavailable"
@@ -1243,13 +1108,17 @@ def get_products_api(request):
                 elif stock <= 10: product['status'] = "low stock"
                 else: product['status'] = "in stock"
 
-        active_products = Item.objects.filter(is_active=True, is_archived=False)
-        total_value = sum((p.price or 0) * (p.stock or 0) for p in active_products)
+        totals = Item.objects.filter(is_active=True, is_archived=False).aggregate(
+            total_products=Count('id'),
+            in_stock=Count('id', filter=Q(stock__gt=10)),
+            low_stock=Count('id', filter=Q(stock__lte=10, stock__gt=0)),
+            total_value=Sum(F('price') * F('stock')),
+        )
         stats = {
-            'total_products': active_products.count(), 
-            'in_stock': active_products.filter(stock__gt=10).count(), 
-            'low_stock': active_products.filter(stock__lte=10, stock__gt=0).count(), 
-            'total_value': float(total_value)
+            'total_products': totals['total_products'],
+            'in_stock': totals['in_stock'],
+            'low_stock': totals['low_stock'],
+            'total_value': float(totals['total_value'] or 0)
         }
         return JsonResponse({'success': True, 'products': products_data, 'stats': stats})
     except Exception as e: 
@@ -1258,19 +1127,19 @@ def get_products_api(request):
 @login_required
 def inventory_consumption_api(request):
     try:
-        days_to_analyze = 30
-        start_date = timezone.now() - timedelta(days=days_to_analyze)
-        recent_order_items = OrderItem.objects.filter(order__created_at__gte=start_date, order__status='paid').select_related('item')
-        consumption_data = defaultdict(float)
-        for order_item in recent_order_items:
-            item = order_item.item
-            if item.recipe and isinstance(item.recipe, list):
-                for ingredient_in_recipe in item.recipe:
-                    ingredient_name = ingredient_in_recipe.get('ingredient')
-                    quantity_per_item = ingredient_in_recipe.get('quantity', 0)
-                    if ingredient_name: consumption_data[ingredient_name] += float(quantity_per_item) * order_item.qty
-        daily_consumption = { name: total / days_to_analyze for name, total in consumption_data.items() }
-        return JsonResponse({'success': True, 'daily_consumption': daily_consumption})
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = None
+    if days not in CONSUMPTION_WINDOWS:
+        windows = ', '.join(str(d) for d in CONSUMPTION_WINDOWS)
+        return JsonResponse({'success': False, 'error': f'days must be one of {windows}'}, status=400)
+    by_weekday = request.GET.get('by_weekday') in ('1', 'true')
+    try:
+        consumption = ingredient_consumption(days, by_weekday)
+        data = {'success': True, 'days': days, 'daily_consumption': consumption['daily']}
+        if by_weekday:
+            data['weekday_consumption'] = consumption['weekday']
+        return JsonResponse(data)
     except Exception as e: return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
@@ -1492,7 +1361,7 @@ def audit_trail(request):
 
 @login_required
 def audit_logs_api(request):
-    logs = AuditTrail.objects.all().order_by('-timestamp')
+    logs = AuditTrail.objects.all().select_related('user').order_by('-timestamp')
     data = [{ 
         "id": log.id, 
         "timestamp": log.timestamp.isoformat(),
@@ -1543,7 +1412,7 @@ def waste_log_api(request):
 
 @login_required
 @require_http_methods(["POST"])
-@transaction.atomic
+@immediate_atomic
 def record_waste(request):
     admin_check = require_admin_access(request)
     if admin_check is not True:
@@ -1573,6 +1442,7 @@ def record_waste(request):
             user=request.user
         )
 
+        main_before, room_before = ingredient.mainStock, ingredient.stockRoom
         ingredient.mainStock = F('mainStock') - quantity
         ingredient.save()
         ingredient.refresh_from_db()
@@ -1598,6 +1468,7 @@ def record_waste(request):
         elif ingredient.mainStock < ingredient.reorder:
              ingredient.status = 'Low Stock'
         ingredient.save(update_fields=['status'])
+        publish(stock_events([(ingredient, main_before, room_before)]))
         return JsonResponse({'success': True, 'message': 'Waste recorded successfully.'})
 
     except json.JSONDecodeError:
@@ -1738,47 +1609,26 @@ def log_void_action(request):
 @login_required
 def get_best_selling_products_api(request):
     """
-    API endpoint to get best-selling products based on actual sales data from OrderItem.
-    Returns products sorted by total quantity sold.
+    API endpoint to get best-selling products from the daily sales totals.
+    ?window=7d, 30d or all (default). Returns products sorted by total quantity sold.
     """
+    window = request.GET.get('window', DEFAULT_WINDOW)
+    if window not in WINDOWS:
+        return JsonResponse({'success': False, 'error': f"window must be one of: {', '.join(WINDOWS)}"}, status=400)
     try:
-        from django.db.models import Sum, Q
-
-        # Get top-selling products from OrderItem, only include active non-archived items
-        best_sellers = OrderItem.objects.filter(
-            item__is_active=True,
-            item__is_archived=False,
-            order__status='paid'
-        ).values(
-            'item__id',
-            'item__name',
-            'item__category',
-            'item__price',
-            'item__stock',
-            'item__image_url'
-        ).annotate(
-            total_sold=Sum('qty')
-        ).order_by('-total_sold')[:50]  # Top 50 best sellers
-
-        # Convert to list and add recipe data
-        products = []
-        for item in best_sellers:
-            try:
-                product_obj = Item.objects.get(id=item['item__id'])
-                products.append({
-                    'id': item['item__id'],
-                    'name': item['item__name'],
-                    'category': item['item__category'],
-                    'price': float(item['item__price']),
-                    'stock': item['item__stock'],
-                    'image_url': item['item__image_url'] or '',
-                    'recipe': product_obj.recipe,
-                    'total_sold': item['total_sold']
-                })
-            except Item.DoesNotExist:
-                continue
-
-        return JsonResponse({'success': True, 'products': products})
+        products = [{
+            'id': item.id,
+            'name': item.name,
+            'category': item.category,
+            'price': float(item.price),
+            'stock': item.stock,
+            'image_url': item.image_url or '',
+            'thumbnail_url': item.thumbnail_url or item.image_url or '',
+            'recipe': item.recipe,
+            'total_sold': item.total_sold,
+        } for item in best_sellers(window)]
+
+        return JsonResponse({'success': True, 'window': window, 'products': products})
 
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -1911,6 +1761,42 @@ def order_details_api(request, order_id):
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
+RECEIPT_MAX_AGE = 24 * 3600  # Receipts never change once written
+
+
+@login_required
+def order_receipt(request, order_id):
+    """
+    The receipt HTML printed for an order, read from the receipt archive.
+    Browsers that accept gzip get the stored bytes as they are.
+    """
+    is_admin = request.user.is_superuser or (hasattr(request.user, 'profile') and request.user.profile.role == 'admin')
+    is_staff = (hasattr(request.user, 'profile') and request.user.profile.role == 'staff')
+    if not (is_admin or is_staff):
+        return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+
+    receipt = ArchivedReceipt.objects.filter(order_id=order_id).first()
+    if receipt is None:
+        return JsonResponse({'success': False, 'error': 'No receipt was archived for this order'}, status=404)
+
+    gzipped = 'gzip' in request.headers.get('Accept-Encoding', '')
+    etag = f'"receipt-{receipt.order_id}-{receipt.offset}{"-gz" if gzipped else ""}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+    else:
+        try:
+            response = HttpResponse(read_compressed(receipt) if gzipped else read_receipt(receipt),
+                                    content_type='text/html; charset=utf-8')
+        except OSError as e:
+            return JsonResponse({'success': False, 'error': f'Receipt could not be read: {e}'}, status=500)
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={RECEIPT_MAX_AGE}'
+    response['Vary'] = 'Accept-Encoding, Cookie'
+    return response
+
+
 # ==================== INVENTORY MONITORING ENDPOINTS ====================
 
 @login_required
@@ -1972,6 +1858,11 @@ def inventory_monitoring_api(request):
         end_date_str = request.GET.get('end_date')
         ingredient_id = request.GET.get('ingredient_id')
         transaction_type = request.GET.get('transaction_type')
+        as_of_str = request.GET.get('as_of')
+        try:
+            as_of_date = datetime.strptime(as_of_str, '%Y-%m-%d').date() if as_of_str else None
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'as_of must be YYYY-MM-DD'}, status=400)
 
         # Default to last 30 days if no dates provided
         if not end_date_str:
@@ -2021,41 +1912,34 @@ def inventory_monitoring_api(request):
                 'user': txn.user.username if txn.user else 'System',
             })
 
-        # Calculate summary statistics
-        stock_in = transactions.filter(transaction_type='STOCK_IN').aggregate(
-            total=Sum('quantity'),
-            cost=Sum('total_cost')
-        )
-        stock_out = transactions.filter(transaction_type='STOCK_OUT').aggregate(
-            total=Sum('quantity'),
-            cost=Sum('total_cost')
-        )
-        waste = transactions.filter(transaction_type='WASTE').aggregate(
-            total=Sum('quantity'),
-            cost=Sum('total_cost')
-        )
-        transfers = transactions.filter(
-            transaction_type__in=['TRANSFER_TO_MAIN', 'TRANSFER_TO_ROOM']
-        ).aggregate(total=Count('id'))
+        # Calculate summary statistics (one aggregate query for all types)
+        totals = {}
+        for key, types in [('stock_in', ['STOCK_IN']), ('stock_out', ['STOCK_OUT']), ('waste', ['WASTE']),
+                           ('transfers', ['TRANSFER_TO_MAIN', 'TRANSFER_TO_ROOM'])]:
+            type_filter = Q(transaction_type__in=types)
+            totals[f'{key}_count'] = Count('id', filter=type_filter)
+            totals[f'{key}_total'] = Sum('quantity', filter=type_filter)
+            totals[f'{key}_cost'] = Sum('total_cost', filter=type_filter)
+        totals = transactions.aggregate(**totals)
 
         summary = {
             'stock_in': {
-                'count': transactions.filter(transaction_type='STOCK_IN').count(),
-                'total_quantity': float(stock_in['total'] or 0),
-                'total_cost': float(stock_in['cost'] or 0),
+                'count': totals['stock_in_count'],
+                'total_quantity': float(totals['stock_in_total'] or 0),
+                'total_cost': float(totals['stock_in_cost'] or 0),
             },
             'stock_out': {
-                'count': transactions.filter(transaction_type='STOCK_OUT').count(),
-                'total_quantity': abs(float(stock_out['total'] or 0)),
-                'total_cost': float(stock_out['cost'] or 0),
+                'count': totals['stock_out_count'],
+                'total_quantity': abs(float(totals['stock_out_total'] or 0)),
+                'total_cost': float(totals['stock_out_cost'] or 0),
             },
             'waste': {
-                'count': transactions.filter(transaction_type='WASTE').count(),
-                'total_quantity': float(waste['total'] or 0),
-                'total_cost': float(waste['cost'] or 0),
+                'count': totals['waste_count'],
+                'total_quantity': float(totals['waste_total'] or 0),
+                'total_cost': float(totals['waste_cost'] or 0),
             },
             'transfers': {
-                'count': transfers['total'] or 0,
+                'count': totals['transfers_count'],
             },
             'date_range': {
                 'start': start_date.isoformat(),
@@ -2072,10 +1956,14 @@ def inventory_monitoring_api(request):
             total_cost=Sum('total_cost')
         ).order_by('-total_cost')
 
+        ingredient_transactions = list(ingredient_transactions)
+        ingredients_by_id = Ingredient.objects.in_bulk(
+            [item['ingredient_id'] for item in ingredient_transactions if item['ingredient_id']]
+        )
         for item in ingredient_transactions:
             if item['ingredient_id']:
-                try:
-                    ingredient = Ingredient.objects.get(id=item['ingredient_id'])
+                ingredient = ingredients_by_id.get(item['ingredient_id'])
+                if ingredient:
                     ingredient_summary.append({
                         'id': item['ingredient_id'],
                         'name': item['ingredient_name'],
@@ -2088,8 +1976,35 @@ def inventory_monitoring_api(request):
                         'current_main_stock': float(ingredient.mainStock),
                         'current_stock_room': float(ingredient.stockRoom),
                     })
-                except Ingredient.DoesNotExist:
-                    continue
+
+        # Stock on a past date: nearest snapshot plus the ledger since then
+        as_of = None
+        if as_of_date:
+            as_of_dt = timezone.make_aware(datetime.combine(as_of_date, datetime.max.time()))
+            stock = stock_as_of(as_of_dt)
+            for entry in ingredient_summary:
+                row = stock.get(entry['id'])
+                if row:
+                    entry['as_of_main_stock'] = row['main_stock']
+                    entry['as_of_stock_room'] = row['stock_room']
+                    entry['as_of_valuation'] = float(row['valuation'])
+            snapshot_times = [row['snapshot_taken_at'] for row in stock.values() if row['snapshot_taken_at']]
+            as_of = {
+                'date': as_of_date.isoformat(),
+                'snapshot_taken_at': max(snapshot_times).isoformat() if snapshot_times else None,
+                'total_valuation': float(sum(row['valuation'] for row in stock.values())),
+                'ingredients': [
+                    {
+                        'id': row['id'],
+                        'name': row['name'],
+                        'unit': row['unit'],
+                        'main_stock': row['main_stock'],
+                        'stock_room': row['stock_room'],
+                        'valuation': float(row['valuation']),
+                    }
+                    for row in sorted(stock.values(), key=lambda r: r['name'])
+                ],
+            }
 
         return JsonResponse({
             'success': True,
@@ -2097,6 +2012,7 @@ def inventory_monitoring_api(request):
             'summary': summary,
             'ingredient_summary': ingredient_summary,
             'ingredients': list(ingredients),
+            'as_of': as_of,
         })
 
     except Exception as e:
@@ -2239,10 +2155,11 @@ def debug_transactions(request):
         total_count = InventoryTransaction.objects.count()
 
         # Count by type
+        counts = dict(InventoryTransaction.objects.order_by().values_list('transaction_type')
+                      .annotate(count=Count('id')))
         type_counts = {}
         for choice in InventoryTransaction._meta.get_field('transaction_type').choices:
-            count = InventoryTransaction.objects.filter(transaction_type=choice[0]).count()
-            type_counts[choice[1]] = count
+            type_counts[choice[1]] = counts.get(choice[0], 0)
 
         return JsonResponse({
             'success': True,
@@ -2261,7 +2178,7 @@ def debug_transactions(request):
 
 @login_required
 @require_http_methods(["POST"])
-@transaction.atomic
+@immediate_atomic
 def populate_historical_transactions(request):
     """
     API endpoint to populate historical inventory transactions
@@ -2273,11 +2190,6 @@ def populate_historical_transactions(request):
         return JsonResponse({'success': False, 'error': 'Admin access required'}, status=403)
 
     try:
-        # Counter for statistics
-        stock_out_count = 0
-        waste_count = 0
-        errors = []
-
         # Check if already populated
         existing_count = InventoryTransaction.objects.count()
         if existing_count > 0:
@@ -2286,72 +2198,11 @@ def populate_historical_transactions(request):
                 'error': f'Transactions already exist ({existing_count} records). Clear them first if you want to repopulate.'
             })
 
-        # Process historical orders for STOCK_OUT transactions
-        orders = Order.objects.filter(status='paid').prefetch_related('items__item').order_by('created_at')
-
-        for order in orders:
-            for order_item in order.items.all():
-                item = order_item.item
-
-                # Check if item has a recipe
-                if isinstance(item.recipe, list) and len(item.recipe) > 0:
-                    for recipe_ingredient in item.recipe:
-                        ingredient_name = recipe_ingredient.get('ingredient')
-                        quantity_per_item = recipe_ingredient.get('quantity', 0)
-
-                        if ingredient_name and quantity_per_item > 0:
-                            try:
-                                ingredient = Ingredient.objects.get(name=ingredient_name)
-                                total_quantity = float(quantity_per_item) * order_item.qty
-
-                                # Create STOCK_OUT transaction
-                                InventoryTransaction.objects.create(
-                                    ingredient=ingredient,
-                                    ingredient_name=ingredient.name,
-                                    transaction_type='STOCK_OUT',
-                                    quantity=-total_quantity,
-                                    unit=ingredient.unit,
-                                    cost_per_unit=ingredient.cost,
-                                    total_cost=Decimal(str(total_quantity)) * ingredient.cost,
-                                    main_stock_after=ingredient.mainStock,
-                                    stock_room_after=ingredient.stockRoom,
-                                    notes=f"Used in order (recipe for {item.name})",
-                                    reference=f"Order-{order.id}",
-                                    user=order.cashier,
-                                    created_at=order.created_at
-                                )
-                                stock_out_count += 1
-
-                            except Ingredient.DoesNotExist:
-                                errors.append(f'Ingredient "{ingredient_name}" not found for order {order.id}')
-                                continue
-
-        # Process waste logs for WASTE transactions
-        waste_logs = WastedLog.objects.all().order_by('wasted_at')
-
-        for waste_log in waste_logs:
-            ingredient = waste_log.ingredient
-
-            if ingredient:
-                # Create WASTE transaction
-                InventoryTransaction.objects.create(
-                    ingredient=ingredient,
-                    ingredient_name=waste_log.ingredient_name,
-                    transaction_type='WASTE',
-                    quantity=-waste_log.quantity,
-                    unit=waste_log.unit,
-                    cost_per_unit=waste_log.cost_at_waste / Decimal(str(waste_log.quantity)) if waste_log.quantity > 0 else Decimal('0'),
-                    total_cost=waste_log.cost_at_waste,
-                    main_stock_after=ingredient.mainStock,
-                    stock_room_after=ingredient.stockRoom,
-                    notes=f"Waste recorded: {waste_log.reason}",
-                    reference=f"WasteLog-{waste_log.id}",
-                    user=waste_log.user,
-                    created_at=waste_log.wasted_at
-                )
-                waste_count += 1
-            else:
-                errors.append(f'Ingredient for waste log {waste_log.id} no longer exists')
+        # STOCK_OUT rows for paid orders, then WASTE rows for waste logs, in bulk
+        stats = backfill_inventory_transactions()
+        replay_ledger()
+        stock_out_count = stats['stock_out']
+        waste_count = stats['waste']
 
         return JsonResponse({
             'success': True,
@@ -2360,15 +2211,38 @@ def populate_historical_transactions(request):
                 'stock_out': stock_out_count,
                 'waste': waste_count,
                 'total': stock_out_count + waste_count,
-                'errors': len(errors)
+                'errors': stats['error_count']
             },
-            'errors': errors[:10]  # Return first 10 errors
+            'errors': stats['errors'][:10]  # Return first 10 errors
         })
 
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
+@login_required
+@require_http_methods(["POST"])
+def take_inventory_snapshot_api(request):
+    """
+    Write an inventory snapshot now (Admin only); normally taken nightly
+    by the snapshot_inventory command
+    """
+    admin_check = require_admin_access(request, 'dashboard')
+    if admin_check is not True:
+        return JsonResponse({'success': False, 'error': 'Admin access required'}, status=403)
+
+    try:
+        snapshots = take_inventory_snapshot()
+        return JsonResponse({
+            'success': True,
+            'ingredients': len(snapshots),
+            'taken_at': snapshots[0].taken_at.isoformat() if snapshots else None,
+            'total_valuation': float(sum(s.valuation for s in snapshots)),
+        })
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
 @login_required
 def sales_monitoring_view(request):
     """
@@ -2450,8 +2324,8 @@ def sales_monitoring_api(request):
 
         # Build query
         orders_query = Order.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date
+            business_date__gte=timezone.localdate(start_date),
+            business_date__lte=timezone.localdate(end_date)
         ).select_related('cashier')
 
         # Filter by payment method if specified
@@ -2547,14 +2421,68 @@ def sales_monitoring_api(request):
 
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
-    
-from django.http import HttpResponse
-from django.core.management import call_command
+
+
+@login_required
+def margin_report_api(request):
+    """
+    Gross margin of paid orders (Admin only): ?by=item|category|day,
+    ?start_date / ?end_date (YYYY-MM-DD, default the last 30 days).
+    Costs are the ones stored on each order line at the time of sale.
+    """
+    is_admin = request.user.is_superuser or (hasattr(request.user, 'profile') and request.user.profile.role == 'admin')
+    if not is_admin:
+        return JsonResponse({'success': False, 'error': 'Admin access required'}, status=403)
+
+    by = request.GET.get('by', 'item')
+    if by not in MARGIN_GROUPS:
+        return JsonResponse({'success': False, 'error': f"by must be one of: {', '.join(MARGIN_GROUPS)}"}, status=400)
+    try:
+        start_date = datetime.strptime(request.GET['start_date'], '%Y-%m-%d').date() if request.GET.get('start_date') else None
+        end_date = datetime.strptime(request.GET['end_date'], '%Y-%m-%d').date() if request.GET.get('end_date') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Dates must be YYYY-MM-DD'}, status=400)
+
+    try:
+        rows = margin_report(by, start_date, end_date)
+        for row in rows:
+            if 'day' in row:
+                row['day'] = row['day'].isoformat()
+        totals = {key: round(sum(row[key] for row in rows), 2)
+                  for key in ('revenue', 'cost', 'uncosted_revenue', 'gross_margin')}
+        costed = totals['revenue'] - totals['uncosted_revenue']
+        totals['margin_percent'] = round(totals['gross_margin'] / costed * 100, 2) if costed > 0 else None
+        return JsonResponse({'success': True, 'by': by, 'rows': rows, 'totals': totals})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+from forecasting import jobs
+
+def submit_job_response(name):
+    """Start a background job and answer right away with its status."""
+    try:
+        started, job = jobs.submit(name)
+        return JsonResponse({
+            'success': True,
+            'started': started,
+            'message': 'Job started' if started else 'Job is already running',
+            'job': job,
+            'status_url': f'/api/jobs/{name}/',
+        }, status=202)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 def run_retrain(request):
-    call_command('retrain_live')
-    return HttpResponse("Retrain triggered!")
+    return submit_job_response('retrain')
 
 def populate_inventory(request):
-    call_command('populate_inventory_transactions')
-    return HttpResponse("Inventory population triggered!")
\ No newline at end of file
+    return submit_job_response('populate_inventory')
+
+def job_status_api(request, name):
+    """Poll a background job: state, articles/rows done, elapsed time and ETA."""
+    if name not in jobs.JOBS:
+        return JsonResponse({'success': False, 'error': f'Unknown job: {name}'}, status=404)
+    try:
+        return JsonResponse({'success': True, 'job': jobs.read_status(name)})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
\ No newline at end of file
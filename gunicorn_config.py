@@ -1,4 +1,5 @@
 # Gunicorn configuration file
+import gc
 import multiprocessing
 
 # Server socket
@@ -12,6 +13,11 @@ worker_connections = 1000
 timeout = 30
 keepalive = 2
 
+# Load the Django app in the master before forking so the forecasting
+# stack (pandas/sklearn + joblib models) is shared copy-on-write by all
+# workers instead of being loaded N times on each worker's first request.
+preload_app = True
+
 # Logging
 accesslog = '-'
 errorlog = '-'
@@ -32,3 +38,39 @@ tmp_upload_dir = None
 # SSL (if needed)
 # keyfile = None
 # certfile = None
+
+
+# Server hooks
+def when_ready(server):
+    """Warm the forecasting model cache in the master, before workers fork."""
+    from django.db import connections
+
+    from dejabrew import metrics
+
+    try:
+        from forecasting.forecasting_service import warm_model_cache
+        from pos.models import Item
+
+        item_names = list(Item.objects.filter(is_active=True).values_list('name', flat=True))
+        loaded = warm_model_cache(item_names)
+        server.log.info("Preloaded %d forecasting models", loaded)
+    except Exception as e:
+        server.log.warning("Forecast model warm-up skipped: %s", e)
+    finally:
+        # Never hand an open DB connection to forked workers
+        connections.close_all()
+    # Drop the files of the last run's workers. The master's file keeps the
+    # warm-up's cache lookups; workers start from zero
+    metrics.clear()
+    metrics.flush()
+
+    # Move everything loaded so far out of the GC's reach so collections in
+    # the workers don't touch (and un-share) the preloaded pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Don't count again in every worker what the master recorded before the fork."""
+    from dejabrew import metrics
+
+    metrics.reset()